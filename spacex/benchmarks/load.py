@@ -0,0 +1,223 @@
+"""
+Load test of the WSGI deployment (gunicorn, sync views) against the ASGI one
+(uvicorn, async views): sustained requests per second and latency
+percentiles at several levels of concurrency, over a mix of listing pages,
+JSON API pages and the health endpoint, on a scratch catalogue of --size
+launches.
+
+    pip install gunicorn uvicorn
+    python -m benchmarks.load --size 10000 --concurrency 8,32,128 --duration 20
+
+Both servers get the same number of worker processes; gunicorn runs --threads
+threads in each. Keep-alive clients run in --clients processes, so give the
+machine enough cores for both the server and the clients. The page cache is
+off unless --cache is given. Results are written as JSON to
+benchmarks/results/load-<commit>.json (or --output).
+
+Run from the directory containing manage.py.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+from spacex_app import testing
+
+from . import scratch
+from .run import RESULTS_DIR, git_commit, middle_cursor
+
+HOST = "127.0.0.1"
+PORT = 8010
+SERVERS = {
+    "wsgi": lambda workers, threads: [
+        sys.executable, "-m", "gunicorn", "spacex.wsgi:application", "--bind", f"{HOST}:{PORT}",
+        "--workers", str(workers), "--threads", str(threads), "--worker-class", "gthread", "--log-level", "warning",
+    ],
+    "asgi": lambda workers, threads: [
+        sys.executable, "-m", "uvicorn", "spacex.asgi:application", "--host", HOST, "--port", str(PORT),
+        "--workers", str(workers), "--no-access-log", "--log-level", "warning",
+    ],
+}
+
+
+def load_catalogue(size):
+    """
+    Fills the scratch database with ``size`` synthetic launches and payloads
+    and returns the URLs of the request mix.
+    """
+    from django.core.management import call_command
+    from spacex_app import populate
+    from spacex_app.models import Launch, Payload
+
+    call_command("migrate", verbosity=0)
+    random.seed(size)
+    n_crew = max(size // 10, 1)
+    for records, fn in (
+        (testing.crew(n_crew), populate.populate_crew),
+        (testing.payloads(size), populate.populate_payload),
+        (testing.launches(size, size, n_crew), populate.populate_launch),
+    ):
+        with patch.object(populate, "api_request", return_value=records):
+            fn()
+    return [
+        "/launch",
+        f"/launch?after={middle_cursor(Launch.objects.all(), 'date_utc')}",
+        "/launch?q=mission",
+        "/payload",
+        f"/payload?after={middle_cursor(Payload.objects.all(), 'name')}",
+        "/crew",
+        "/api/v1/launches?page_size=100",
+        "/api/v1/payloads?page_size=100&fields=name,dragon",
+        "/health",
+    ]
+
+
+def start_server(kind, database, workers, threads, cache):
+    env = {
+        **os.environ,
+        "DJANGO_SETTINGS_MODULE": "benchmarks.load_settings",
+        "DJANGO_SECRET_KEY": os.environ.get("DJANGO_SECRET_KEY", "benchmark-only-secret-key"),
+        "DJANGO_ALLOWED_HOSTS": HOST,
+        "LOAD_DATABASE": str(database),
+        "LOAD_CACHE": "1" if cache else "",
+        "ASYNC_VIEWS": "true" if kind == "asgi" else "false",
+        "DEBUG": "",
+    }
+    server = subprocess.Popen(SERVERS[kind](workers, threads), env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection(HOST, PORT, timeout=1)
+            connection.request("GET", "/ready")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError(f"The {kind} server exited with {server.returncode}")
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"The {kind} server did not become ready")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def _client(urls, threads, duration, seed):
+    """
+    Runs ``threads`` keep-alive clients for ``duration`` seconds; returns the
+    latency of every successful request and the number of failed ones.
+    """
+    latencies, errors = [], [0]
+    deadline = time.perf_counter() + duration
+
+    def loop(rng):
+        connection = http.client.HTTPConnection(HOST, PORT, timeout=30)
+        while time.perf_counter() < deadline:
+            url = rng.choice(urls)
+            start = time.perf_counter()
+            try:
+                connection.request("GET", url)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(HOST, PORT, timeout=30)
+                continue
+            if response.status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors[0] += 1
+        connection.close()
+
+    workers = [threading.Thread(target=loop, args=(random.Random(seed * 1000 + i),)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return latencies, errors[0]
+
+
+def measure(urls, concurrency, duration, clients):
+    clients = max(1, min(clients, concurrency))
+    shares = [concurrency // clients + (i < concurrency % clients) for i in range(clients)]
+    with ProcessPoolExecutor(clients) as pool:
+        results = list(pool.map(_client, [urls] * clients, shares, [duration] * clients, range(clients)))
+    latencies = sorted(latency for result, _ in results for latency in result)
+    errors = sum(count for _, count in results)
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / duration, 1),
+        "p50": round(statistics.median(latencies), 4),
+        "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 4),
+    }
+
+
+def main():
+    from django.db import connections
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10000, help="Launches and payloads in the catalogue.")
+    parser.add_argument("--concurrency", default="8,32,128", help="Comma-separated numbers of open connections.")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of load per concurrency level.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Server worker processes.")
+    parser.add_argument("--threads", type=int, default=8, help="Threads per gunicorn worker.")
+    parser.add_argument("--clients", type=int, default=os.cpu_count() or 1, help="Load generator processes.")
+    parser.add_argument("--servers", default="wsgi,asgi", help="Comma-separated deployments to test.")
+    parser.add_argument("--cache", action="store_true", help="Keep the page cache on.")
+    parser.add_argument("--output", type=Path, help="Result file (default benchmarks/results/load-<commit>.json).")
+    args = parser.parse_args()
+
+    database = scratch.setup("load")
+    urls = load_catalogue(args.size)
+    connections.close_all()
+    levels = [int(level) for level in args.concurrency.split(",")]
+    results = {}
+    for kind in args.servers.split(","):
+        server = start_server(kind, database, args.workers, args.threads, args.cache)
+        try:
+            measure(urls, levels[0], min(args.duration, 3), args.clients)  # warm up
+            for level in levels:
+                row = measure(urls, level, args.duration, args.clients)
+                results.setdefault(kind, {})[str(level)] = row
+                print(f"{kind} c={level}: {json.dumps(row)}", flush=True)
+        finally:
+            stop_server(server)
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "size": args.size,
+        "workers": args.workers,
+        "threads": args.threads,
+        "cache": args.cache,
+        "urls": urls,
+        "results": results,
+    }
+    output = args.output or RESULTS_DIR / f"load-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""
+Settings for the servers started by benchmarks/load.py: the project's
+settings on the load test's scratch database, without the page cache unless
+LOAD_CACHE is set, so every request runs its view.
+"""
+import os
+
+from spacex.settings import *  # noqa: F401,F403
+from spacex.settings import DATABASES
+
+DATABASES["default"]["NAME"] = os.environ["LOAD_DATABASE"]
+
+if not os.environ.get("LOAD_CACHE"):
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
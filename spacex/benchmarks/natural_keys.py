@@ -0,0 +1,102 @@
+"""
+Measures sync and page-render time with and without the natural-key
+indexes/unique constraints added in migration 0009, on a scratch database.
+The "before" run migrates fully and then drops those indexes again, so both
+runs exercise the current sync code.
+
+    python -m benchmarks.natural_keys --launches 2000
+
+Run from the directory containing manage.py.
+"""
+import argparse
+import json
+import time
+from unittest.mock import patch
+
+from spacex_app import testing
+
+from . import scratch
+
+INDEXED_FIELDS = [
+    ("Launch", "launch_id"), ("Launch", "date_utc"),
+    ("Payload", "payload_id"), ("Payload", "name"),
+    ("CrewMember", "member_id"), ("CrewMember", "name"),
+]
+CONSTRAINED_MODELS = ["LaunchCore", "Dragon"]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - start, 4)
+
+
+def drop_natural_key_indexes():
+    from django.apps import apps
+    from django.db import connection
+
+    with connection.schema_editor() as editor:
+        for model_name, name in INDEXED_FIELDS:
+            model = apps.get_model("spacex_app", model_name)
+            field = model._meta.get_field(name)
+            plain = field.clone()
+            plain._unique, plain.db_index = False, False
+            plain.set_attributes_from_name(name)
+            plain.model = model
+            editor.alter_field(model, field, plain)
+        for model_name in CONSTRAINED_MODELS:
+            model = apps.get_model("spacex_app", model_name)
+            for constraint in model._meta.constraints:
+                editor.remove_constraint(model, constraint)
+
+
+def run(crew, payloads, launches):
+    from django.core.management import call_command
+    from django.test import Client
+    from spacex_app import populate
+    from spacex_app.models import CrewMember, Launch, Payload
+
+    client = Client()
+    results = {}
+    for label in ("before", "after"):
+        scratch.switch_database("natural-keys")
+        call_command("migrate", verbosity=0)
+        if label == "before":
+            drop_natural_key_indexes()
+        row = {}
+        with patch.object(populate, "api_request", return_value=crew):
+            row["populate_crew"] = timed(populate.populate_crew)
+        with patch.object(populate, "api_request", return_value=payloads):
+            row["populate_payload"] = timed(populate.populate_payload)
+        with patch.object(populate, "api_request", return_value=launches):
+            row["populate_launch"] = timed(populate.populate_launch)
+            row["resync_launch"] = timed(populate.populate_launch)
+        row["lookup_1000_by_natural_key"] = timed(lambda: [
+            (Launch.objects.filter(launch_id=l["id"]).exists(),
+             Payload.objects.filter(payload_id=p["id"]).exists(),
+             CrewMember.objects.filter(member_id=c["id"]).exists())
+            for l, p, c in zip(launches[-1000:], payloads[-1000:], crew[-1000:])
+        ])
+        for page in ("launch", "payload", "crew"):
+            row[f"render_{page}"] = timed(lambda: client.get(f"/{page}"))
+        results[label] = row
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--launches", type=int, default=2000)
+    args = parser.parse_args()
+
+    scratch.setup("natural-keys")
+    n_payloads, n_crew = args.launches * 2, max(args.launches // 4, 1)
+    results = run(
+        testing.crew(n_crew),
+        testing.payloads(n_payloads),
+        testing.launches(args.launches, n_payloads, n_crew),
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Benchmark suite: times the sync (full, unchanged re-sync, and re-sync after
+editing 1% of launches) and the listing pages (first page, a page from the
+middle of the listing, a search, a cached hit, gzipped or not, and a 304
+revalidation), with SQL query counts, plus the time to first byte of a
+streamed 500-launch page, at several catalogue sizes. Each size runs on its own scratch database.
+
+    python -m benchmarks.run --sizes 1000,10000,100000
+    python -m benchmarks.run --compare benchmarks/results/<older>.json
+
+A size N means N launches, N payloads and N/10 crew members. Results are
+written as JSON to benchmarks/results/<commit>.json (or --output) so runs
+from different commits can be compared; --compare prints the change of
+every timing against an earlier file.
+
+Run from the directory containing manage.py.
+"""
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest.mock import patch
+
+from spacex_app import testing
+
+from . import scratch
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+NO_CACHE = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return round(time.perf_counter() - start, 4)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def edited(records, fraction):
+    """
+    Copies of ``records`` with the details of every 1/fraction-th one changed.
+    """
+    step = max(int(1 / fraction), 1)
+    return [
+        {**r, "details": f"{r.get('details')} (edited)"} if i % step == 0 else r
+        for i, r in enumerate(records)
+    ]
+
+
+def time_sync(crew, payloads, launches):
+    from spacex_app import populate
+
+    row = {}
+
+    def sync(prefix, crew, payloads, launches):
+        for name, records, fn in (
+            ("crew", crew, populate.populate_crew),
+            ("payload", payloads, populate.populate_payload),
+            ("launch", launches, populate.populate_launch),
+        ):
+            with patch.object(populate, "api_request", return_value=records):
+                row[f"{prefix}_{name}"] = timed(fn)
+
+    sync("full", crew, payloads, launches)
+    sync("resync_unchanged", crew, payloads, launches)
+    with patch.object(populate, "api_request", return_value=edited(launches, 0.01)):
+        row["resync_1pct_launch"] = timed(populate.populate_launch)
+    return row
+
+
+def middle_cursor(queryset, name):
+    from spacex_app.pagination import encode_cursor
+
+    total = queryset.count()
+    value, pk = queryset.order_by(name, "pk").values_list(name, "pk")[total // 2]
+    return encode_cursor(value, pk)
+
+
+def time_streamed(client, url):
+    """
+    (seconds to the first chunk, seconds to the last) of a streamed page.
+    """
+    start = time.perf_counter()
+    chunks = iter(client.get(url).streaming_content)
+    next(chunks)
+    first = time.perf_counter() - start
+    for _ in chunks:
+        pass
+    return round(first, 4), round(time.perf_counter() - start, 4)
+
+
+def time_pages(repeat):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from spacex_app.models import CrewMember, Launch, Payload
+
+    client = Client()
+    urls = {
+        "launch_first": "/launch",
+        "launch_middle": f"/launch?after={middle_cursor(Launch.objects.all(), 'date_utc')}",
+        "launch_search": "/launch?q=mission",
+        "payload_first": "/payload",
+        "payload_middle": f"/payload?after={middle_cursor(Payload.objects.all(), 'name')}",
+        "crew_first": "/crew",
+        "crew_middle": f"/crew?after={middle_cursor(CrewMember.objects.all(), 'name')}",
+    }
+    row = {}
+    with override_settings(CACHES=NO_CACHE):
+        for label, url in urls.items():
+            with CaptureQueriesContext(connection) as ctx:
+                response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+            row[f"{label}_queries"] = len(ctx.captured_queries)
+            row[f"{label}_bytes"] = len(response.content)
+            row[f"{label}_median"] = round(statistics.median(timed(lambda: client.get(url)) for _ in range(repeat)), 4)
+        for label, url in (("launch_500", "/launch?page_size=500"),):
+            row[f"{label}_median"] = round(statistics.median(timed(lambda: client.get(url)) for _ in range(repeat)), 4)
+            with override_settings(STREAM_LISTINGS=True):
+                first_bytes = [time_streamed(client, url) for _ in range(repeat)]
+            row[f"{label}_stream_ttfb_median"] = round(statistics.median(ttfb for ttfb, _ in first_bytes), 4)
+            row[f"{label}_stream_median"] = round(statistics.median(total for _, total in first_bytes), 4)
+    etag = client.get("/launch")["ETag"]
+    for label, headers in (
+        ("cached", {}),
+        ("cached_gzip", {"HTTP_ACCEPT_ENCODING": "gzip"}),
+        ("not_modified", {"HTTP_IF_NONE_MATCH": etag}),
+    ):
+        row[f"launch_first_{label}_median"] = round(
+            statistics.median(timed(lambda: client.get("/launch", **headers)) for _ in range(repeat)), 4
+        )
+    row["launch_first_gzip_bytes"] = len(client.get("/launch", HTTP_ACCEPT_ENCODING="gzip").content)
+    return row
+
+
+def run(sizes, repeat):
+    from django.core.management import call_command
+
+    results = {}
+    for size in sizes:
+        random.seed(size)
+        n_crew = max(size // 10, 1)
+        crew = testing.crew(n_crew)
+        payloads = testing.payloads(size)
+        launches = testing.launches(size, size, n_crew)
+        scratch.switch_database(f"bench-{size}")
+        call_command("migrate", verbosity=0)
+        row = time_sync(crew, payloads, launches)
+        row.update(time_pages(repeat))
+        results[str(size)] = row
+        print(f"{size}: {json.dumps(row)}", flush=True)
+    return results
+
+
+def compare(old, new):
+    """
+    Prints every timing of ``new`` next to ``old`` with the relative change.
+    """
+    for size, row in new["results"].items():
+        before = old["results"].get(size, {})
+        for key, value in row.items():
+            if key in before and not key.endswith(("_queries", "_bytes")) and before[key]:
+                change = (value - before[key]) / before[key] * 100
+                print(f"{size:>7} {key:<34} {before[key]:>9.4f} -> {value:>9.4f}  {change:+6.1f}%")
+            elif key in before and before[key] != value:
+                print(f"{size:>7} {key:<34} {before[key]:>9} -> {value:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated catalogue sizes.")
+    parser.add_argument("--repeat", type=int, default=5, help="Requests per page timing.")
+    parser.add_argument("--output", type=Path, help="Result file (default benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", type=Path, help="Earlier result file to compare against.")
+    args = parser.parse_args()
+
+    scratch.setup("bench")
+    import django
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "results": run(sizes, args.repeat),
+    }
+    output = args.output or RESULTS_DIR / f"{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Wrote {output}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Points Django at a throwaway SQLite file so benchmarks never touch
+db_data/db.sqlite3. Import and call setup() before importing any models.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+
+def setup(name="benchmark"):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "spacex.settings")
+    os.environ.setdefault("DJANGO_SECRET_KEY", "benchmark-only-secret-key")
+
+    import django
+    from django.conf import settings
+
+    path = new_database_path(name)
+    settings.DATABASES["default"]["NAME"] = path
+    django.setup()
+
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    return path
+
+
+def new_database_path(name="benchmark"):
+    return Path(tempfile.mkdtemp(prefix=f"spacex-{name}-")) / "db.sqlite3"
+
+
+def switch_database(name="benchmark"):
+    """
+    Closes the default connection and points it at a new, empty file.
+    """
+    from django.db import connection
+
+    connection.close()
+    path = new_database_path(name)
+    connection.settings_dict["NAME"] = path
+    return path
@@ -0,0 +1,91 @@
+"""
+A local stand-in for api.spacexdata.com, so syncs can be benchmarked
+reproducibly with no network. It serves
+
+    GET  /v4/crew, /v4/payloads, /v5/launches        (ETag/Last-Modified, 304, gzip)
+    POST /v4/crew/query, /v4/payloads/query, /v5/launches/query
+                                                     (select, limit/page, basic filters)
+
+from fixtures recorded from the real API (benchmarks/fixtures/) or, when
+there are none, from synthetic records the size of the real catalogue. The
+catalogue can be scaled N times and every answer delayed or, at random,
+replaced by a 429/500/503 error.
+
+    python -m benchmarks.stub_api --scale 10 --latency 0.05 --error-rate 0.05
+    SPACEX_API_BASE_URL=http://127.0.0.1:8001 python manage.py sync_spacex
+
+    python -m benchmarks.stub_api --record      # refresh fixtures (needs network)
+
+Run from the directory containing manage.py.
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from pathlib import Path
+
+from spacex_app.testing import ENDPOINTS, StubAPI, catalog, serve
+
+FIXTURE_DIR = Path(__file__).resolve().parent / "fixtures"
+# Roughly the size of the real catalogue, used when there are no fixtures
+SYNTHETIC_SIZES = {"launches": 205, "payloads": 225, "crew": 30}
+
+
+def record(base_url="https://api.spacexdata.com"):
+    """
+    Saves the real API's collections as gzipped JSON fixtures.
+    """
+    import requests
+
+    FIXTURE_DIR.mkdir(exist_ok=True)
+    for path, name in ENDPOINTS.items():
+        response = requests.get(base_url + path, timeout=(5, 60))
+        response.raise_for_status()
+        with gzip.open(FIXTURE_DIR / f"{name}.json.gz", "wt") as f:
+            json.dump(response.json(), f)
+        print(f"{name}: {len(response.json())} records")
+
+
+def load_catalog():
+    """
+    {"crew": [...], "payloads": [...], "launches": [...]} from the recorded
+    fixtures, or synthetic records when they are missing.
+    """
+    if all((FIXTURE_DIR / f"{name}.json.gz").exists() for name in ENDPOINTS.values()):
+        records = {}
+        for name in ENDPOINTS.values():
+            with gzip.open(FIXTURE_DIR / f"{name}.json.gz", "rt") as f:
+                records[name] = json.load(f)
+        return records
+    random.seed(0)
+    return catalog(SYNTHETIC_SIZES["launches"], SYNTHETIC_SIZES["payloads"], SYNTHETIC_SIZES["crew"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--scale", type=int, default=1, help="Serve this many copies of the catalogue.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every answer.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of answers replaced by errors.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", action="store_true", help="Record fixtures from the real API and exit.")
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+        return
+    api = StubAPI(load_catalog(), factor=args.scale, latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    server, url = serve(api, args.host, args.port)
+    sizes = ", ".join(f"{len(c.records)} {path}" for path, c in api.collections.items())
+    print(f"Serving {sizes} on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'spacex_app.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -49,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'spacex_app.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'spacex.urls'
@@ -79,10 +81,82 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db_data' / 'db.sqlite3',
+        # WAL lets pages keep reading while sync_spacex writes; busy_timeout
+        # makes a second writer wait for the lock instead of failing. Writers
+        # take the lock at BEGIN through transactions.write_transaction().
+        'OPTIONS': {
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA busy_timeout=5000'
+            ),
+        },
     }
 }
 
 
+# Cache
+# Rendered listing pages and cards are cached until a sync changes the data
+# they show (see spacex_app/caching.py). Set DJANGO_CACHE_DIR to share the
+# cache between the web server and a separately running sync_spacex.
+
+if os.environ.get("DJANGO_CACHE_DIR"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ["DJANGO_CACHE_DIR"],
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+
+# Send the launch, payload and crew listings as they render (spacex_app/streaming.py)
+# instead of building each page in memory first.
+
+STREAM_LISTINGS = os.environ.get("STREAM_LISTINGS", "False").lower() == "true"
+
+# Route the listings and the JSON API to their async views (spacex_app/urls.py).
+# Set it when serving spacex/asgi.py; under WSGI the sync views are faster.
+
+ASYNC_VIEWS = os.environ.get("ASYNC_VIEWS", "False").lower() == "true"
+
+
+# Snapshot written by export_snapshot and loaded by import_snapshot, so a new
+# container can serve pages before its first sync.
+
+SNAPSHOT_PATH = Path(os.environ.get("SNAPSHOT_PATH", BASE_DIR / 'db_data' / 'snapshot.jsonl.gz'))
+
+
+# SpaceX API client (spacex_app/helper_functions.api_request)
+# Point SPACEX_API_BASE_URL at benchmarks/stub_api.py to sync offline.
+
+SPACEX_API_BASE_URL = os.environ.get("SPACEX_API_BASE_URL", "https://api.spacexdata.com")
+SPACEX_API_TIMEOUT = (5, 30)  # (connect, read) seconds per attempt
+SPACEX_API_RETRIES = 4
+SPACEX_API_BACKOFF = 0.5  # upper bound of the first retry delay, doubled per retry
+SPACEX_API_BACKOFF_MAX = 30
+
+
+# Request metrics (spacex_app/middleware.py), scraped from /metrics
+
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", 1.0))
+METRICS_ALLOWED_IPS = [ip for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",") if ip]
+
+# Profiling (spacex_app/profiling.py): add ?profile=1 to any page, or run
+# sync_spacex --profile. Open to staff users, or to everyone when enabled.
+
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "False").lower() == "true"
+PROFILE_DIR = BASE_DIR / 'db_data' / 'profiles'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,289 @@
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from . import search_index
+from .caching import avalidators, validators
+from .cards import CORE_FIELDS
+from .models import CrewMember, Dragon, Launch, Payload
+from .pagination import akeyset_chunks, decode_cursor, encode_cursor, keyset_chunks, page_size_from
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10_000
+CHUNK_SIZE = 500
+NDJSON = "application/x-ndjson"
+
+_encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+
+class APIError(Exception):
+    """
+    A bad request parameter, answered with a 400 and the message.
+    """
+
+
+def _scalar_fields(model):
+    return [
+        field.name for field in model._meta.concrete_fields
+        if not (field.primary_key or field.is_relation or field.name == "source_hash")
+    ]
+
+
+# Relation fields are read per chunk of rows: each is a function taking the
+# chunk's primary keys and returning {pk: value}, with one query per chunk.
+
+def _m2m(relation, column):
+    def fetch(pks):
+        values = {pk: [] for pk in pks}
+        rows = relation.through.objects.filter(launch_id__in=pks).order_by("pk").values_list("launch_id", column)
+        for pk, value in rows:
+            values[pk].append(value)
+        return values
+    return fetch
+
+
+def _cores(pks):
+    values = {pk: [] for pk in pks}
+    rows = (
+        Launch.cores.through.objects.filter(launch_id__in=pks).order_by("pk")
+        .values_list("launch_id", *(f"launchcore__{field}" for field in CORE_FIELDS))
+    )
+    for pk, *core in rows:
+        values[pk].append(dict(zip(CORE_FIELDS, core)))
+    return values
+
+
+def _nested(model, relation, columns):
+    """
+    The fields ``columns`` (which may reach further, as "patch__small") of
+    the object ``relation`` points at, as nested dicts; None when unset.
+    """
+    def fetch(pks):
+        values = {}
+        lookups = [f"{relation}__{column}" for column in columns]
+        for pk, related, *row in model.objects.filter(pk__in=pks).values_list("pk", relation, *lookups):
+            if related is None:
+                values[pk] = None
+                continue
+            values[pk] = nested = {}
+            for column, value in zip(columns, row):
+                *parents, leaf = column.split("__")
+                target = nested
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                target[leaf] = value
+        return values
+    return fetch
+
+
+class Resource:
+    '''
+    One /api/v1 collection: its model, the column it is listed by, the
+    fields a client can select and the filters it can use. Filters map a
+    query parameter to a lookup on an indexed column; "q" goes through the
+    full-text index. ``versions`` names the data versions (see caching.py)
+    its rows are built from.
+    '''
+    def __init__(self, model, kind, order, filters, relations, versions, descending=False):
+        self.model = model
+        self.kind = kind
+        self.order = order
+        self.descending = descending
+        self.filters = filters
+        self.relations = relations
+        self.versions = versions
+        self.scalars = _scalar_fields(model)
+        self.fields = self.scalars + list(relations)
+
+    def select(self, value):
+        if not value:
+            return self.fields
+        fields = list(dict.fromkeys(f.strip() for f in value.split(",") if f.strip()))
+        unknown = [f for f in fields if f not in self.fields]
+        if unknown:
+            raise APIError(f"Unknown field(s) {', '.join(unknown)}; choose from {', '.join(self.fields)}")
+        return fields
+
+    def filter(self, queryset, params):
+        for param, lookup in self.filters.items():
+            if param not in params:
+                continue
+            field = self.model._meta.get_field(lookup.split("__")[0])
+            raw = params[param].split(",") if lookup.endswith("__in") else [params[param]]
+            try:
+                values = [field.to_python(value) for value in raw]
+            except ValidationError as exc:
+                raise APIError(f"Invalid {param}: {' '.join(exc.messages)}")
+            values = [
+                timezone.make_aware(v, dt_timezone.utc) if isinstance(v, datetime) and timezone.is_naive(v) else v
+                for v in values
+            ]
+            queryset = queryset.filter(**{lookup: values if lookup.endswith("__in") else values[0]})
+        query = params.get("q", "").strip()
+        if query:
+            queryset = queryset.filter(pk__in=search_index.matching(query, self.kind))
+        return queryset
+
+
+RESOURCES = {
+    "launches": Resource(
+        Launch, "launch", "date_utc", descending=True,
+        filters={"launch_id": "launch_id__in", "since": "date_utc__gte", "until": "date_utc__lt"},
+        relations={
+            "links": _nested(Launch, "links", [
+                "presskit", "webcast", "youtube_id", "article", "wikipedia", "patch__small", "patch__large",
+                "reddit__campaign", "reddit__launch", "reddit__media", "reddit__recovery",
+                "flickr__small", "flickr__original",
+            ]),
+            "cores": _cores,
+            "crew": _m2m(Launch.crew, "crewmember__member_id"),
+            "payloads": _m2m(Launch.payloads, "payload__payload_id"),
+        },
+        versions=["launch", "crew", "payload"],
+    ),
+    "payloads": Resource(
+        Payload, "payload", "name",
+        filters={"payload_id": "payload_id__in", "name": "name"},
+        relations={"dragon": _nested(Payload, "dragon", _scalar_fields(Dragon))},
+        versions=["payload"],
+    ),
+    "crew": Resource(
+        CrewMember, "crew", "name",
+        filters={"member_id": "member_id__in", "name": "name"},
+        relations={},
+        versions=["crew"],
+    ),
+}
+
+
+def _next_url(request, row, order):
+    query = request.GET.copy()
+    query["after"] = encode_cursor(row[order], row["pk"])
+    return f"{request.path}?{query.urlencode()}"
+
+
+def _next_line(request, resource, row):
+    return _encoder.encode({"_next": _next_url(request, row, resource.order)}) + "\n"
+
+
+def _lines(resource, chunk, fields, relations):
+    pks = [row["pk"] for row in chunk]
+    related = {name: resource.relations[name](pks) for name in relations}
+    lines = []
+    for row in chunk:
+        lines.append(_encoder.encode({
+            field: related[field][row["pk"]] if field in related else row[field] for field in fields
+        }))
+    return "\n".join(lines) + "\n"
+
+
+def _rows(resource, queryset, fields):
+    scalars = [f for f in fields if f in resource.scalars]
+    relations = [f for f in fields if f in resource.relations]
+    return queryset.values(*dict.fromkeys(["pk", resource.order, *scalars])), relations
+
+
+def _ndjson(request, resource, queryset, fields, after, size):
+    """
+    Yields the rows of one response as NDJSON, one chunk of lines at a time.
+    When rows remain after ``size`` of them, a last {"_next": url} line
+    links the next page.
+    """
+    rows, relations = _rows(resource, queryset, fields)
+    sent, last = 0, None
+    for chunk in keyset_chunks(rows, resource.order, resource.descending, after, min(CHUNK_SIZE, size)):
+        if sent == size:
+            yield _next_line(request, resource, last)
+            return
+        more = len(chunk) > size - sent
+        chunk = chunk[:size - sent]
+        yield _lines(resource, chunk, fields, relations)
+        sent += len(chunk)
+        last = chunk[-1]
+        if more:
+            # The rest of this chunk belongs to the next page, and it may be the last chunk
+            yield _next_line(request, resource, last)
+            return
+
+
+async def _andjson(request, resource, queryset, fields, after, size):
+    """
+    _ndjson() reading rows through the async ORM. The relation queries of a
+    chunk go to a worker thread together, in one hop.
+    """
+    rows, relations = _rows(resource, queryset, fields)
+    lines = sync_to_async(_lines)
+    sent, last = 0, None
+    async for chunk in akeyset_chunks(rows, resource.order, resource.descending, after, min(CHUNK_SIZE, size)):
+        if sent == size:
+            yield _next_line(request, resource, last)
+            return
+        more = len(chunk) > size - sent
+        chunk = chunk[:size - sent]
+        if relations:
+            yield await lines(resource, chunk, fields, relations)
+        else:
+            yield _lines(resource, chunk, fields, relations)
+        sent += len(chunk)
+        last = chunk[-1]
+        if more:
+            yield _next_line(request, resource, last)
+            return
+
+
+def _parse(request, resource):
+    """
+    (fields, queryset, after cursor, page size) of a collection request.
+    Raises APIError for a bad parameter.
+    """
+    fields = resource.select(request.GET.get("fields"))
+    queryset = resource.filter(resource.model.objects.all(), request.GET)
+    after = None
+    if "after" in request.GET:
+        after = decode_cursor(request.GET["after"], resource.model._meta.get_field(resource.order))
+        if after is None:
+            raise APIError("Invalid after cursor")
+    return fields, queryset, after, page_size_from(request, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+
+
+def collection(request, name):
+    """
+    Streams a collection as NDJSON, ``page_size`` rows (default 1000) per
+    response in the collection's listing order. ``fields`` selects the keys
+    of each row, the resource's filters and ``q`` narrow it down, and
+    ``after`` continues from the {"_next": url} line ending a full page.
+    Answers 304 while the client's ETag is current.
+    """
+    resource = RESOURCES[name]
+    page = validators(request, f"api:{name}", *resource.versions)
+    if (response := page.not_modified(request)) is not None:
+        return response
+    try:
+        fields, queryset, after, size = _parse(request, resource)
+    except APIError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return page.apply(
+        StreamingHttpResponse(_ndjson(request, resource, queryset, fields, after, size), content_type=NDJSON)
+    )
+
+
+async def acollection(request, name):
+    """
+    collection() for the async view stack, with an async iterator as the
+    body.
+    """
+    resource = RESOURCES[name]
+    page = await avalidators(request, f"api:{name}", *resource.versions)
+    if (response := page.not_modified(request)) is not None:
+        return response
+    try:
+        fields, queryset, after, size = _parse(request, resource)
+    except APIError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+    return page.apply(
+        StreamingHttpResponse(_andjson(request, resource, queryset, fields, after, size), content_type=NDJSON)
+    )
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class SpacexAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'spacex_app'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import query_wrappers
+        connection_created.connect(query_wrappers.install, dispatch_uid="spacex_app.query_wrappers")
@@ -0,0 +1,223 @@
+import gzip
+import hashlib
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.text import compress_string
+
+VERSION_KEY = "data-version:{}"
+_held_bumps = ContextVar("held_bumps", default=None)
+_accepts_gzip = re.compile(r"\bgzip\b")
+
+
+def _versions(names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def _aversions(names):
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def data_version(*names):
+    """
+    Current data version of each named resource ("launch", "payload",
+    "crew"), joined into one string for use in cache keys. A resource that
+    has no version yet (e.g. after the cache was cleared) gets a fresh one,
+    so losing the cache can only cause misses, never stale hits.
+    """
+    return "-".join(map(str, _versions(names)))
+
+
+async def adata_version(*names):
+    """
+    data_version() for async views.
+    """
+    return "-".join(map(str, await _aversions(names)))
+
+
+def bump_data_version(*names):
+    """
+    Invalidates every cached page and fragment built from ``names`` once the
+    current transaction commits (immediately outside a transaction).
+    """
+    def bump():
+        held = _held_bumps.get()
+        if held is not None:
+            held.update(names)
+            return
+        cache.set_many({VERSION_KEY.format(name): time.time_ns() for name in names}, timeout=None)
+    transaction.on_commit(bump)
+
+
+@contextmanager
+def held_version_bumps():
+    """
+    Collects the names bumped inside the block into the yielded set instead
+    of bumping them, for writes readers cannot see yet (see shadow.py). The
+    caller bumps them once they can.
+    """
+    held = set()
+    token = _held_bumps.set(held)
+    try:
+        yield held
+    finally:
+        _held_bumps.reset(token)
+
+
+class Validators:
+    '''
+    The validator of one response built from the data of ``names``: a weak
+    ETag per data version and full path. There is no Last-Modified, whose
+    whole seconds could not tell apart two bumps within one second. ``key``
+    is where the body is cached. A cache that keeps nothing (the dummy
+    backend) has no versions, and then there is no ETag.
+    '''
+    def __init__(self, request, scope, versions):
+        version = "-".join(map(str, versions))
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        self.key = f"page.gz:{scope}:{version}:{path_hash}"
+        self.etag = None
+        if None not in versions:
+            self.etag = f'W/"{hashlib.md5(self.key.encode()).hexdigest()}"'
+
+    def not_modified(self, request):
+        """
+        A 304 (or 412) answering the request's If-None-Match, or None when
+        the client needs the body.
+        """
+        if self.etag is None:
+            return None
+        response = get_conditional_response(request, etag=self.etag)
+        return response and self.apply(response)
+
+    def apply(self, response):
+        if self.etag is not None and response.status_code in (200, 304):
+            response.headers.setdefault("ETag", self.etag)
+            # Revalidate on every use; a sync can change the page at any time
+            patch_cache_control(response, no_cache=True)
+        return response
+
+
+def validators(request, scope, *names):
+    return Validators(request, scope, _versions(names))
+
+
+async def avalidators(request, scope, *names):
+    return Validators(request, scope, await _aversions(names))
+
+
+def _gzip_accepted(request):
+    return bool(_accepts_gzip.search(request.headers.get("Accept-Encoding", "")))
+
+
+def _cached_response(request, cached):
+    # Bodies are cached gzipped and only decompressed for clients without gzip
+    body, content_type = cached
+    if _gzip_accepted(request):
+        response = HttpResponse(body, content_type=content_type)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(gzip.decompress(body), content_type=content_type)
+    patch_vary_headers(response, ["Accept-Encoding"])
+    return response
+
+
+def _stored_when_complete(chunks, key, content_type, timeout):
+    # Passes a streamed body through and caches it once the last chunk is
+    # sent; a client that disconnects early leaves nothing cached
+    sent = []
+    for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    cache.set(key, (compress_string(b"".join(sent)), content_type), timeout)
+
+
+async def _astored_when_complete(chunks, key, content_type, timeout):
+    sent = []
+    async for chunk in chunks:
+        sent.append(chunk)
+        yield chunk
+    await cache.aset(key, (compress_string(b"".join(sent)), content_type), timeout)
+
+
+def _cache_response(request, response, key, timeout):
+    if response.status_code != 200:
+        return
+    def store(response):
+        compressed = compress_string(response.content)
+        cache.set(key, (compressed, response["Content-Type"]), timeout)
+        if _gzip_accepted(request):
+            response.content = compressed
+            response["Content-Encoding"] = "gzip"
+    patch_vary_headers(response, ["Accept-Encoding"])
+    if response.streaming:
+        stored = _astored_when_complete if response.is_async else _stored_when_complete
+        response.streaming_content = stored(response.streaming_content, key, response["Content-Type"], timeout)
+    # TemplateResponses are rendered after the view returns
+    elif getattr(response, "is_rendered", True):
+        store(response)
+    else:
+        response.add_post_render_callback(store)
+
+
+def cache_listing(*names, timeout=None):
+    """
+    Caches a view's rendered body, gzipped, per full path (so per page
+    cursor, page size and query) and per data version of ``names``. Entries
+    never expire on their own; a version bump from the sync makes them
+    unreachable. Responses carry an ETag from the same versions, and a
+    request whose ETag still matches gets a 304 without the view running.
+    Works on sync and async views alike.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                if request.method != "GET":
+                    return await view(request, *args, **kwargs)
+                page = await avalidators(request, view.__name__, *names)
+                if (response := page.not_modified(request)) is not None:
+                    return response
+                cached = await cache.aget(page.key)
+                if cached is not None:
+                    return page.apply(_cached_response(request, cached))
+                response = await view(request, *args, **kwargs)
+                _cache_response(request, response, page.key, timeout)
+                return page.apply(response)
+            return wrapped
+
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method != "GET":
+                return view(request, *args, **kwargs)
+            page = validators(request, view.__name__, *names)
+            if (response := page.not_modified(request)) is not None:
+                return response
+            cached = cache.get(page.key)
+            if cached is not None:
+                return page.apply(_cached_response(request, cached))
+            response = view(request, *args, **kwargs)
+            _cache_response(request, response, page.key, timeout)
+            return page.apply(response)
+        return wrapped
+    return decorator
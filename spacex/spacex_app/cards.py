@@ -0,0 +1,99 @@
+from .models import Launch, LaunchCard
+
+BUILD_BATCH = 500
+
+LAUNCH_CARD_FIELDS = [
+    "launch_id", "name", "flight_number", "upcoming", "success", "window", "details",
+    "date_precision", "date_unix", "tdb", "net", "static_fire_date_unix", "rocket",
+    "launchpad", "capsules", "ships", "auto_update",
+]
+# The collapsed parts of a card, in page order; see views.launch_section
+SECTIONS = ["cores", "fairings", "failures", "links"]
+CORE_FIELDS = [
+    "core", "flight", "gridfins", "legs", "reused", "landing_attempt", "landing_success",
+    "landing_type", "landpad",
+]
+REDDIT_FIELDS = ["campaign", "launch", "media", "recovery"]
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+def _links(links):
+    """
+    The "Links & media" part of a card, or None when the launch has nothing
+    to show there.
+    """
+    if links is None:
+        return None
+    patch, reddit, flickr = links.patch, links.reddit, links.flickr
+    data = {
+        "patch_large": patch.large if patch else None,
+        "presskit": links.presskit,
+        "article": links.article,
+        "wikipedia": links.wikipedia,
+        "webcast": links.webcast,
+        "reddit": {f: getattr(reddit, f) for f in REDDIT_FIELDS if reddit and getattr(reddit, f)},
+        "flickr": list((flickr.original or [])[:3]) if flickr else [],
+    }
+    if not (any(data.values()) or (patch and patch.small)):
+        return None
+    return data
+
+
+def card_data(launch):
+    """
+    (summary, sections) of the card of ``launch``, which must come from
+    Launch.objects.for_listing() so its relations are already loaded. The
+    summary lists the sections that have anything to show. Only reads
+    fields, so it also works on the historical models of a migration.
+    """
+    data = {field: getattr(launch, field) for field in LAUNCH_CARD_FIELDS}
+    links = launch.links
+    patch = links.patch if links else None
+    sections = {
+        "cores": [{field: getattr(core, field) for field in CORE_FIELDS} for core in launch.cores.all()],
+        "fairings": launch.fairings,
+        "failures": launch.failures,
+        "links": _links(links),
+    }
+    data.update(
+        date_utc=_isoformat(launch.date_utc),
+        date_local=_isoformat(launch.date_local),
+        static_fire_date_utc=_isoformat(launch.static_fire_date_utc),
+        patch_small=patch.small if patch else None,
+        crew_names=", ".join(member.name for member in launch.crew.all()),
+        payload_names=", ".join(payload.name for payload in launch.payloads.all()),
+        sections=[name for name in SECTIONS if sections[name]],
+    )
+    return data, sections
+
+
+def _card(launch):
+    data, sections = card_data(launch)
+    return LaunchCard(launch=launch, date_utc=launch.date_utc, data=data, sections=sections)
+
+
+def build_cards(launch_pks=None):
+    """
+    Rebuilds the LaunchCard of each launch in ``launch_pks`` (every launch
+    by default) with a few statements per BUILD_BATCH launches.
+    """
+    queryset = Launch.objects.for_listing().order_by("pk")
+    if launch_pks is None:
+        launch_pks = list(Launch.objects.values_list("pk", flat=True))
+    launch_pks = sorted(set(launch_pks))
+    for start in range(0, len(launch_pks), BUILD_BATCH):
+        batch = launch_pks[start:start + BUILD_BATCH]
+        cards = [_card(launch) for launch in queryset.filter(pk__in=batch)]
+        LaunchCard.objects.bulk_create(
+            cards, update_conflicts=True, unique_fields=["launch"], update_fields=["date_utc", "data", "sections"]
+        )
+
+
+def missing_cards():
+    """
+    Launches without a card, e.g. ones written before cards existed.
+    """
+    return list(Launch.objects.filter(card__isnull=True).values_list("pk", flat=True))
@@ -1,7 +1,326 @@
+import codecs
+import hashlib
+import json
+import logging
+import random
+import re
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
+from itertools import islice
+
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# One keep-alive connection pool shared by every fetch, including the
+# concurrent ones made by sync.sync_all.
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+session.headers["Accept-Encoding"] = "gzip, deflate"
+
+# Transient upstream failures worth retrying
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Bodies are read and parsed in chunks of this size. A streamed body is
+# spooled in memory up to SPOOL_MAX_SIZE and to a temporary file beyond it.
+STREAM_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
+# /query endpoints are read this many records per request, with up to
+# QUERY_WORKERS requests in flight.
+QUERY_PAGE_SIZE = 100
+QUERY_WORKERS = 4
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_END = object()
+
+
+def iter_json_array(chunks):
+    """
+    Yields the elements of a top-level JSON array one at a time from an
+    iterable of byte chunks. Only the not yet parsed part of the input is held
+    in memory, so memory use is bounded by the largest single element rather
+    than by the size of the array.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+    expect = "["
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+        if pos == len(buf) and not eof:
+            chunk = next(chunks, None)
+            eof = chunk is None
+            buf, pos = buf[pos:] + utf8.decode(chunk or b"", final=eof), 0
+            continue
+        if pos == len(buf):
+            raise ValueError("JSON array ends unexpectedly")
+
+        if expect == "[":
+            if buf[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            pos += 1
+            expect = "first"
+        elif expect == "," or (expect == "first" and buf[pos] == "]"):
+            if buf[pos] == "]":
+                return
+            if buf[pos] != ",":
+                raise ValueError(f"Expected ',' or ']' in JSON array, got {buf[pos]!r}")
+            pos += 1
+            expect = "value"
+        else:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                after = _WHITESPACE.match(buf, end).end()
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                after = len(buf)
+            # Until the separator after it has arrived an element may still
+            # be incomplete: an object missing its tail or a number cut in two
+            if not eof and (after == len(buf) or buf[after] not in ",]"):
+                chunk = next(chunks, None)
+                eof = chunk is None
+                buf, pos = buf[pos:] + utf8.decode(chunk or b"", final=eof), 0
+                continue
+            pos = end
+            expect = ","
+            yield item
+
+
+def _spooled_records(body, metrics):
+    """
+    Parses a spooled response body lazily, adding the time spent decoding to
+    ``metrics["parse"]``.
+    """
+    with body:
+        records = iter_json_array(iter(partial(body.read, STREAM_CHUNK_SIZE), b""))
+        while True:
+            start = time.perf_counter()
+            record = next(records, _END)
+            if metrics is not None:
+                metrics["parse"] += time.perf_counter() - start
+            if record is _END:
+                return
+            yield record
+
+
+def _retry_after(response):
+    """
+    Seconds asked for by a Retry-After header (delta-seconds or HTTP date),
+    or None when there is no usable header.
+    """
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt):
+    """
+    "Full jitter" exponential backoff: a random delay of up to
+    SPACEX_API_BACKOFF * 2**attempt seconds, capped at SPACEX_API_BACKOFF_MAX.
+    """
+    return random.uniform(0, min(settings.SPACEX_API_BACKOFF_MAX, settings.SPACEX_API_BACKOFF * 2 ** attempt))
+
+
+def _wire_size(response):
+    # Bytes read off the socket, before gzip decoding
+    return response.raw.tell()
+
+
+def _send_once(method, api_url, headers, stream, json_body):
+    """
+    One request attempt. Returns the response and, for a successful streamed
+    request, its body spooled to a temporary file, plus the body size.
+    """
+    response = session.request(
+        method, api_url, headers=headers, json=json_body, stream=stream, timeout=settings.SPACEX_API_TIMEOUT
+    )
+    if not stream or not response.ok:
+        return response, None, len(response.content)
+    body, size = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE), 0
+    try:
+        with response:
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                body.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return response, body, size
 
-def api_request(api_url: str):
-    response = requests.get(api_url)
+
+def _send(method, api_url, headers=None, stream=False, json_body=None):
+    """
+    Sends a request, retrying connection errors, timeouts and 429/5xx answers
+    up to SPACEX_API_RETRIES times. Each retry waits for the server's
+    Retry-After or else a jittered exponential backoff. Returns the final
+    response, its spooled body (see _send_once), its size and the number of
+    attempts made; the last connection error is raised.
+    """
+    attempt = 0
+    while True:
+        try:
+            response, body, size = _send_once(method, api_url, headers or {}, stream, json_body)
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if attempt >= settings.SPACEX_API_RETRIES:
+                raise
+            delay, reason = _backoff(attempt), exc.__class__.__name__
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt >= settings.SPACEX_API_RETRIES:
+                return response, body, size, attempt + 1
+            retry_after = _retry_after(response)
+            delay = _backoff(attempt) if retry_after is None else min(retry_after, settings.SPACEX_API_BACKOFF_MAX)
+            reason = f"HTTP {response.status_code}"
+        attempt += 1
+        logger.warning("%s from %s, retry %d in %.1fs", reason, api_url, attempt, delay)
+        time.sleep(delay)
+
+
+def api_request(api_url: str, sync_state=None, metrics=None, stream=False):
+    """
+    GETs ``api_url`` and returns the decoded JSON body.
+
+    Transient failures are retried (see _send) and every attempt is bounded
+    by the (connect, read) SPACEX_API_TIMEOUT.
+
+    With ``stream`` the body (which must be a JSON array) is spooled to a
+    temporary file as it downloads and an iterator over its elements is
+    returned; elements are parsed one at a time as the caller consumes them.
+
+    When a ``sync_state`` (anything with ``etag`` and ``last_modified``
+    attributes, normally a SyncState row) is given, its validators are sent
+    as a conditional request. A 304 returns None; otherwise the response's
+    validators are copied onto ``sync_state`` for the caller to save once the
+    data has been written.
+
+    If a ``metrics`` dict is given, the seconds spent on the HTTP exchange
+    including retries ("fetch"), waiting for the final response's headers
+    ("latency") and on decoding the body ("parse"), the body size as sent
+    over the network ("bytes") and once decoded ("decoded_bytes"), and the
+    number of attempts ("attempts") are stored in it.
+    """
+    headers = {}
+    if sync_state is not None:
+        if sync_state.etag:
+            headers["If-None-Match"] = sync_state.etag
+        if sync_state.last_modified:
+            headers["If-Modified-Since"] = sync_state.last_modified
+
+    start = time.perf_counter()
+    response, body, size, attempts = _send("GET", api_url, headers, stream=stream)
+    fetched = time.perf_counter()
+    if metrics is not None:
+        metrics.update(
+            fetch=fetched - start, latency=response.elapsed.total_seconds(),
+            parse=0.0, bytes=_wire_size(response), decoded_bytes=size, attempts=attempts,
+        )
+    if sync_state is not None and response.status_code == 304:
+        return None
+    response.raise_for_status()
+    if stream:
+        data = _spooled_records(body, metrics)
+    else:
+        data = response.json()
+        if metrics is not None:
+            metrics["parse"] = time.perf_counter() - fetched
+
+    if sync_state is not None:
+        sync_state.etag = response.headers.get("ETag")
+        sync_state.last_modified = response.headers.get("Last-Modified")
+    return data
+
+
+def _query_page(query_url, query, select, page, page_size):
+    """
+    Fetches one page from a /query endpoint. Returns the decoded page and its
+    metrics.
+    """
+    start = time.perf_counter()
+    options = {"page": page, "limit": page_size, "pagination": True}
+    if select is not None:
+        options["select"] = {field: 1 for field in select}
+    response, _, size, attempts = _send("POST", query_url, json_body={"query": query or {}, "options": options})
     response.raise_for_status()
+    fetched = time.perf_counter()
     data = response.json()
-    return data
\ No newline at end of file
+    return data, {
+        "fetch": fetched - start, "latency": response.elapsed.total_seconds(),
+        "parse": time.perf_counter() - fetched, "bytes": _wire_size(response),
+        "decoded_bytes": size, "attempts": attempts,
+    }
+
+
+def _add_metrics(metrics, page_metrics):
+    if metrics is not None:
+        for name, value in page_metrics.items():
+            metrics[name] = metrics.get(name, 0) + value
+        metrics["pages"] = metrics.get("pages", 0) + 1
+
+
+def api_query(api_url: str, query=None, select=None, metrics=None, page_size=QUERY_PAGE_SIZE, workers=QUERY_WORKERS):
+    """
+    Runs ``query`` (a MongoDB-style filter) against the ``{api_url}/query``
+    endpoint of the v4/v5 API and returns an iterator over the matching
+    records, projected to the ``select`` fields when given.
+
+    Results are fetched ``page_size`` records at a time. The first page is
+    fetched before returning, so its errors surface here and the page count
+    is known; later pages are requested up to ``workers`` at a time ahead of
+    the consumer, so fetching overlaps with whatever the caller does with
+    each record.
+
+    ``metrics`` receives the same keys as for api_request, summed over pages,
+    plus the number of pages fetched ("pages").
+    """
+    query_url = f"{api_url.rstrip('/')}/query"
+    first, first_metrics = _query_page(query_url, query, select, 1, page_size)
+    _add_metrics(metrics, first_metrics)
+
+    def records():
+        yield from first["docs"]
+        remaining = iter(range(2, (first.get("totalPages") or 1) + 1))
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            pending = deque(
+                pool.submit(_query_page, query_url, query, select, page, page_size)
+                for page in islice(remaining, workers)
+            )
+            while pending:
+                data, page_metrics = pending.popleft().result()
+                for page in islice(remaining, 1):
+                    pending.append(pool.submit(_query_page, query_url, query, select, page, page_size))
+                _add_metrics(metrics, page_metrics)
+                yield from data["docs"]
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+    return records()
+
+def record_hash(record, fields=None) -> str:
+    """
+    Stable SHA-1 of an API record, used to skip records that have not changed
+    since the last sync. With ``fields`` only those keys are hashed, so a full
+    record and the same record projected by a /query select hash alike.
+    """
+    if fields is not None:
+        record = {field: record[field] for field in fields if field in record}
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from spacex_app.snapshot import export_snapshot
+
+
+class Command(BaseCommand):
+    help = "Writes crew, payloads and launches, with everything linked to them, to a gzipped JSONL snapshot."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            type=Path,
+            default=settings.SNAPSHOT_PATH,
+            help="Snapshot file to write (default: SNAPSHOT_PATH).",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        counts = export_snapshot(path)
+        self.stdout.write(f"Wrote {sum(counts.values())} rows to {path} ({path.stat().st_size} bytes)")
@@ -0,0 +1,48 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from spacex_app.models import Launch
+from spacex_app.snapshot import import_snapshot
+
+
+class Command(BaseCommand):
+    help = "Loads a snapshot written by export_snapshot, so a new database has data without a sync."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path",
+            nargs="?",
+            type=Path,
+            default=settings.SNAPSHOT_PATH,
+            help="Snapshot file to load (default: SNAPSHOT_PATH).",
+        )
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument(
+            "--replace",
+            action="store_true",
+            help="Delete the current catalogue and load the snapshot in its place.",
+        )
+        group.add_argument(
+            "--if-empty",
+            action="store_true",
+            help="Do nothing if the database already has launches or there is no snapshot file.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if options["if_empty"] and (Launch.objects.exists() or not path.exists()):
+            self.stdout.write("Skipped snapshot import")
+            return
+        if not path.exists():
+            raise CommandError(f"No snapshot at {path}")
+        start = time.perf_counter()
+        try:
+            counts = import_snapshot(path, replace=options["replace"])
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        for label, count in counts.items():
+            self.stdout.write(f"{label}: {count} rows")
+        self.stdout.write(f"Imported {path} in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from spacex_app.models import (
+    Dragon, FlickrLinks, LaunchCore, LaunchLinks, PatchLinks, RedditLinks
+)
+from spacex_app.transactions import write_transaction
+
+# Ordered so that deleting one level can orphan the next: LaunchLinks rows go
+# first, which may leave their patch/reddit/flickr rows unreferenced.
+ORPHANS = [
+    (LaunchLinks, {"launch__isnull": True}),
+    (PatchLinks, {"launchlinks__isnull": True}),
+    (RedditLinks, {"launchlinks__isnull": True}),
+    (FlickrLinks, {"launchlinks__isnull": True}),
+    (Dragon, {"payload__isnull": True}),
+    (LaunchCore, {"launch__isnull": True}),
+]
+
+
+def purge_orphans(dry_run=False):
+    """
+    Deletes nested rows that no launch or payload points at any more and
+    returns the number of rows removed per model. With ``dry_run`` the
+    deletes are rolled back, so the counts still include rows that only
+    become orphans once their parent LaunchLinks row is gone.
+    """
+    counts = {}
+    with write_transaction():
+        for model, unreferenced in ORPHANS:
+            _, deleted = model.objects.filter(**unreferenced).delete()
+            counts[model.__name__] = deleted.get(model._meta.label, 0)
+        if dry_run:
+            transaction.set_rollback(True)
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Deletes LaunchLinks, patch/reddit/flickr links, dragons and cores that nothing references."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rows would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        counts = purge_orphans(dry_run=options["dry_run"])
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        for name, count in counts.items():
+            self.stdout.write(f"{verb} {count} {name} rows")
@@ -0,0 +1,121 @@
+import time
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date, parse_datetime
+
+from spacex_app.models import SyncState
+from spacex_app.populate import LAUNCH_PATH, api_url
+from spacex_app.profiling import Profiler
+from spacex_app.sync import RESOURCES, sync_all
+
+# How far before the last launch sync "--since last" reaches back, so past
+# launches corrected upstream shortly after they flew are fetched again
+LAST_SYNC_WINDOW = timedelta(days=30)
+
+
+def resolve_since(value):
+    """
+    Turns a --since value into a unix timestamp. Accepts a unix timestamp, an
+    ISO date or datetime, or "last" for LAST_SYNC_WINDOW before the last
+    launch sync.
+    """
+    if value is None:
+        return None
+    if value == "last":
+        state = SyncState.objects.filter(endpoint=api_url(LAUNCH_PATH), synced_at__isnull=False).first()
+        return int((state.synced_at - LAST_SYNC_WINDOW).timestamp()) if state else None
+    if value.isdigit():
+        return int(value)
+    moment = parse_datetime(value)
+    if moment is None and (day := parse_date(value)) is not None:
+        moment = datetime.combine(day, dt_time.min)
+    if moment is None:
+        raise CommandError(f"--since expects a unix timestamp, an ISO date or 'last', got {value!r}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return int(moment.timestamp())
+
+
+def format_requests(requests):
+    """
+    The API request metrics of a SyncResult as a suffix for its report line,
+    e.g. "; pages 2, attempts 3, latency 0.412s, 8123 bytes (40211 decoded)".
+    """
+    if not requests:
+        return ""
+    return (
+        f"; pages {requests['pages']}, attempts {requests['attempts']}, latency {requests['latency']:.3f}s, "
+        f"{requests['bytes']} bytes ({requests['decoded_bytes']} decoded)"
+    )
+
+
+class Command(BaseCommand):
+    help = "Syncs crew, payloads and launches from the SpaceX API."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "resources",
+            nargs="*",
+            help=f"Resources to sync, any of {', '.join(RESOURCES)} (default: all).",
+        )
+        parser.add_argument(
+            "--since",
+            help="Incremental sync through the API's /query endpoints: only fetch launches dated from "
+                 "this unix timestamp or ISO date on, plus upcoming ones. 'last' starts 30 days before "
+                 "the previous launch sync. Older launches corrected upstream are only picked up by a "
+                 "full sync.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would change and roll every write back.",
+        )
+        parser.add_argument(
+            "--shadow",
+            action="store_true",
+            help="Sync into a copy of the database and swap it in when the whole sync is done, so "
+                 "pages never show a half-synced catalogue.",
+        )
+        parser.add_argument(
+            "--loop",
+            type=float,
+            metavar="INTERVAL",
+            help="Keep running, syncing every INTERVAL seconds.",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help="Profile each sync (cProfile, sampled stacks, SQL log) and save the artifacts "
+                 "under PROFILE_DIR.",
+        )
+
+    def handle(self, *args, **options):
+        unknown = set(options["resources"]) - set(RESOURCES)
+        if unknown:
+            raise CommandError(f"Unknown resource(s): {', '.join(sorted(unknown))}")
+        if options["shadow"] and options["dry_run"]:
+            raise CommandError("--shadow and --dry-run cannot be combined")
+        if options["loop"] is None:
+            self.sync_once(options)
+            return
+        while True:
+            try:
+                self.sync_once(options)
+            except Exception as exc:  # keep the daemon alive across transient failures
+                self.stderr.write(f"Sync failed: {exc!r}")
+            time.sleep(options["loop"])
+
+    def sync_once(self, options):
+        since = resolve_since(options["since"])
+        kwargs = {"since": since, "dry_run": options["dry_run"], "shadow": options["shadow"]}
+        if options["profile"]:
+            with Profiler("sync " + " ".join(options["resources"] or ["all"])) as profiler:
+                results = sync_all(options["resources"] or None, **kwargs)
+            self.stdout.write(f"Profile saved to {profiler.save()}")
+        else:
+            results = sync_all(options["resources"] or None, **kwargs)
+        prefix = "[dry run] " if options["dry_run"] else ""
+        for result in results.values():
+            timings = ", ".join(f"{phase} {seconds:.3f}s" for phase, seconds in result.timings.items())
+            self.stdout.write(f"{prefix}{result} ({timings}{format_requests(result.requests)})")
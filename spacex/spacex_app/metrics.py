@@ -0,0 +1,87 @@
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+
+class Histogram:
+    '''
+    A Prometheus-style histogram with one series per label value. Kept in
+    process memory, so each server process reports its own numbers.
+    '''
+    def __init__(self, name, documentation, buckets, label="view"):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, label_value):
+        with self._lock:
+            series = self._series.setdefault(label_value, [[0] * len(self.buckets), 0.0, 0])
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, label_value):
+        """
+        (count, sum) observed so far for one label value.
+        """
+        with self._lock:
+            _, total, count = self._series.get(label_value, (None, 0.0, 0))
+        return count, total
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for label_value, (counts, total, count) in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label}}} {total!r}")
+            lines.append(f"{self.name}_count{{{label}}} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = []
+
+request_seconds = Histogram(
+    "spacex_request_duration_seconds", "Time to produce a response, by view.", LATENCY_BUCKETS
+)
+db_queries = Histogram(
+    "spacex_request_db_queries", "SQL statements executed per request, by view.", QUERY_BUCKETS
+)
+db_seconds = Histogram(
+    "spacex_request_db_duration_seconds", "Time spent in SQL per request, by view.", LATENCY_BUCKETS
+)
+template_seconds = Histogram(
+    "spacex_request_template_duration_seconds", "Time spent rendering templates per request, by view.",
+    LATENCY_BUCKETS,
+)
+response_bytes = Histogram(
+    "spacex_response_size_bytes", "Response body size, by view.", BYTES_BUCKETS
+)
+
+
+def exposition():
+    """
+    Every registered metric in the Prometheus text format (version 0.0.4).
+    """
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.exposition())
+    return "\n".join(lines) + "\n"
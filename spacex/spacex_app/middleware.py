@@ -0,0 +1,196 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import reverse
+
+from . import metrics
+from .profiling import Profiler, aprofiling_allowed, profiling_allowed
+from .query_wrappers import query_wrapper
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    '''
+    SQL and template timings gathered while one request is handled
+    '''
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self._render_start = None
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_seconds += time.perf_counter() - start
+
+    def render_started(self):
+        self._render_start = time.perf_counter()
+
+    def render_finished(self, response):
+        if self._render_start is not None:
+            self.template_seconds += time.perf_counter() - self._render_start
+            self._render_start = None
+
+
+_DONE = object()
+
+
+def _measured(content, stats, size, done):
+    """
+    Streams ``content``, adding the queries run to produce each chunk to
+    ``stats`` and the bytes sent to ``size[0]``, and calls ``done`` when the
+    body is finished or abandoned.
+    """
+    content = iter(content)
+    try:
+        while True:
+            with query_wrapper(stats.execute_wrapper):
+                chunk = next(content, _DONE)
+            if chunk is _DONE:
+                return
+            size[0] += len(chunk)
+            yield chunk
+    finally:
+        done()
+
+
+async def _ameasured(content, stats, size, done):
+    """
+    _measured() for an async streaming body.
+    """
+    content = aiter(content)
+    try:
+        while True:
+            with query_wrapper(stats.execute_wrapper):
+                chunk = await anext(content, _DONE)
+            if chunk is _DONE:
+                return
+            size[0] += len(chunk)
+            yield chunk
+    finally:
+        done()
+
+
+class AsyncCapableMiddleware:
+    '''
+    Base for middleware that runs in whichever mode the rest of the stack
+    uses, so async views under ASGI are awaited without a thread hop.
+    Subclasses implement both __call__, handing over to __acall__ in async
+    mode, and __acall__.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+class RequestMetricsMiddleware(AsyncCapableMiddleware):
+    '''
+    Records each request's latency, SQL statement count and time, template
+    render time and response size per view in spacex_app.metrics, and logs a
+    warning for requests slower than SLOW_REQUEST_SECONDS.
+
+    Template time is measured for TemplateResponses, which are rendered after
+    the view returns. Streamed responses are recorded once their body has
+    been sent, with the queries run while it was produced.
+    '''
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = request.stats = RequestStats()
+        start = time.perf_counter()
+        with query_wrapper(stats.execute_wrapper):
+            response = self.get_response(request)
+        return self._finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = request.stats = RequestStats()
+        start = time.perf_counter()
+        with query_wrapper(stats.execute_wrapper):
+            response = await self.get_response(request)
+        return self._finish(request, response, stats, start)
+
+    def _finish(self, request, response, stats, start):
+        if not response.streaming:
+            self._record(request, stats, time.perf_counter() - start, len(response.content))
+            return response
+        # A streamed body runs its queries while it is sent, after the view
+        # returned, so the request is recorded once the body is done
+        size = [0]
+
+        def done():
+            self._record(request, stats, time.perf_counter() - start, size[0])
+
+        measure = _ameasured if response.is_async else _measured
+        response.streaming_content = measure(response.streaming_content, stats, size, done)
+        return response
+
+    def _record(self, request, stats, elapsed, size):
+        match = request.resolver_match
+        view = (match.view_name if match else None) or "unmatched"
+        metrics.request_seconds.observe(elapsed, view)
+        metrics.db_queries.observe(stats.queries, view)
+        metrics.db_seconds.observe(stats.db_seconds, view)
+        metrics.template_seconds.observe(stats.template_seconds, view)
+        metrics.response_bytes.observe(size, view)
+
+        if elapsed >= settings.SLOW_REQUEST_SECONDS:
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs, templates %.3fs, %d bytes",
+                request.method, request.get_full_path(), view, elapsed,
+                stats.queries, stats.db_seconds, stats.template_seconds, size,
+            )
+
+    def process_template_response(self, request, response):
+        request.stats.render_started()
+        response.add_post_render_callback(request.stats.render_finished)
+        return response
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    '''
+    Profiles requests made with a ``profile`` query parameter (for users
+    allowed by profiling_allowed) and links the saved artifacts from the
+    X-Profile response header. Must come after AuthenticationMiddleware.
+
+    Under ASGI a profiled request runs on a worker thread with an event
+    loop of its own, so waiting for the profiler never blocks the server's
+    loop and the profile holds no other request's coroutines. It shows an
+    async view's own code and its SQL but not the template rendering and
+    queries Django hands to other threads.
+    '''
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if "profile" not in request.GET or not profiling_allowed(request):
+            return self.get_response(request)
+        with Profiler(f"{request.method} {request.path}") as profiler:
+            response = self.get_response(request)
+        return self._link(response, profiler)
+
+    async def __acall__(self, request):
+        if "profile" not in request.GET or not await aprofiling_allowed(request):
+            return await self.get_response(request)
+        return await sync_to_async(self._profile_on_thread, thread_sensitive=False)(request)
+
+    def _profile_on_thread(self, request):
+        with Profiler(f"{request.method} {request.path}") as profiler:
+            response = asyncio.run(self.get_response(request))
+        return self._link(response, profiler)
+
+    def _link(self, response, profiler):
+        directory = profiler.save()
+        response["X-Profile"] = reverse("profile_artifacts", args=[directory.name])
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:12
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spacex_app', '0007_alter_payload_dragon'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "CREATE VIRTUAL TABLE spacex_app_search_index USING fts5("
+                "kind UNINDEXED, object_id UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            ),
+            reverse_sql="DROP TABLE spacex_app_search_index",
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 17:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spacex_app', '0008_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='crewmember',
+            name='member_id',
+            field=models.CharField(blank=True, max_length=50, null=True, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='crewmember',
+            name='name',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='launch',
+            name='date_utc',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='launch',
+            name='launch_id',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='payload',
+            name='name',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='payload',
+            name='payload_id',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='dragon',
+            constraint=models.UniqueConstraint(fields=('capsule', 'manifest'), name='unique_dragon_capsule_manifest'),
+        ),
+        migrations.AddConstraint(
+            model_name='launchcore',
+            constraint=models.UniqueConstraint(fields=('core', 'flight'), name='unique_launchcore_core_flight'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spacex_app', '0010_sync_state_and_source_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LaunchCard',
+            fields=[
+                ('launch', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='spacex_app.launch')),
+                ('date_utc', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('data', models.JSONField()),
+            ],
+        ),
+    ]
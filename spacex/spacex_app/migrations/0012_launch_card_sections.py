@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+SECTIONS = ["cores", "fairings", "failures", "links"]
+
+
+def split_sections(apps, schema_editor):
+    # Moves the collapsed sections of existing cards out of ``data``
+    LaunchCard = apps.get_model("spacex_app", "LaunchCard")
+    cards = list(LaunchCard.objects.all())
+    for card in cards:
+        card.sections = {name: card.data.pop(name, None) for name in SECTIONS}
+        card.data["sections"] = [name for name in SECTIONS if card.sections[name]]
+    LaunchCard.objects.bulk_update(cards, ["data", "sections"], batch_size=500)
+
+
+def merge_sections(apps, schema_editor):
+    LaunchCard = apps.get_model("spacex_app", "LaunchCard")
+    cards = list(LaunchCard.objects.all())
+    for card in cards:
+        card.data.pop("sections", None)
+        card.data.update(card.sections)
+    LaunchCard.objects.bulk_update(cards, ["data"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spacex_app', '0011_launch_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='launchcard',
+            name='sections',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(split_sections, merge_sections),
+    ]
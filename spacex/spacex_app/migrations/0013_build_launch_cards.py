@@ -0,0 +1,35 @@
+from django.db import migrations
+
+from spacex_app.cards import BUILD_BATCH, card_data
+
+
+def build_missing_cards(apps, schema_editor):
+    # Cards for launches stored before LaunchCard existed, so /launch shows
+    # them before the next sync; the same cards cards.build_cards() writes
+    Launch = apps.get_model("spacex_app", "Launch")
+    LaunchCard = apps.get_model("spacex_app", "LaunchCard")
+    launches = (
+        Launch.objects.filter(card__isnull=True)
+        .select_related("links__patch", "links__reddit", "links__flickr")
+        .prefetch_related("crew", "payloads", "cores")
+        .order_by("pk")
+    )
+    cards = []
+    for launch in launches.iterator(chunk_size=BUILD_BATCH):
+        data, sections = card_data(launch)
+        cards.append(LaunchCard(launch=launch, date_utc=launch.date_utc, data=data, sections=sections))
+        if len(cards) == BUILD_BATCH:
+            LaunchCard.objects.bulk_create(cards)
+            cards = []
+    LaunchCard.objects.bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('spacex_app', '0012_launch_card_sections'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_missing_cards, migrations.RunPython.noop),
+    ]
@@ -1,16 +1,30 @@
 from django.db import models
 
+class SyncState(models.Model):
+    """
+    Cache validators from the last successful sync of one API endpoint, sent
+    back as If-None-Match/If-Modified-Since on the next request.
+    """
+    endpoint = models.CharField(max_length=255, unique=True)
+    etag = models.CharField(max_length=255, null=True, blank=True)
+    last_modified = models.CharField(max_length=64, null=True, blank=True)
+    synced_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sync state for {self.endpoint}"
+
 class CrewMember(models.Model):
     '''
     Represents a single crew member
     '''
-    name = models.CharField(max_length=100, null=True, blank=True)
+    name = models.CharField(max_length=100, null=True, blank=True, db_index=True)
     agency = models.CharField(max_length=100, null=True, blank=True)
     image_url = models.URLField(max_length=200, null=True, blank=True)
     wikipedia_url = models.URLField(max_length=200, null=True, blank=True)
     launches = models.JSONField(default=list, null=True, blank=True)
     status = models.CharField(max_length=50, null=True, blank=True)
-    member_id = models.CharField(max_length=50, null=True, blank=True)
+    member_id = models.CharField(max_length=50, null=True, blank=True, unique=True)
+    source_hash = models.CharField(max_length=40, null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -28,6 +42,11 @@ class Dragon(models.Model):
     water_landing = models.BooleanField(null=True, blank=True)
     land_landing = models.BooleanField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["capsule", "manifest"], name="unique_dragon_capsule_manifest"),
+        ]
+
     def __str__(self):
         return f"Dragon Capsule {self.capsule}" if self.capsule else f"Dragon (ID: {self.id})"
 
@@ -36,8 +55,8 @@ class Payload(models.Model):
     """
     Represents a single payload
     """
-    payload_id = models.CharField(max_length=255, null=True, blank=True)
-    name = models.CharField(max_length=255, null=True, blank=True)
+    payload_id = models.CharField(max_length=255, null=True, blank=True, unique=True)
+    name = models.CharField(max_length=255, null=True, blank=True, db_index=True)
     type = models.CharField(max_length=100, null=True, blank=True)
     reused = models.BooleanField(default=False, null=True, blank=True)
     launch = models.CharField(max_length=255, null=True, blank=True)
@@ -63,6 +82,7 @@ class Payload(models.Model):
     raan = models.FloatField(null=True, blank=True)
     arg_of_pericenter = models.FloatField(null=True, blank=True)
     mean_anomaly = models.FloatField(null=True, blank=True)
+    source_hash = models.CharField(max_length=40, null=True, blank=True)
 
     # Linked Dragon Object
     dragon = models.ForeignKey(
@@ -156,15 +176,37 @@ class LaunchCore(models.Model):
     landing_type = models.CharField(max_length=50, null=True, blank=True)
     landpad = models.CharField(max_length=255, null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["core", "flight"], name="unique_launchcore_core_flight"),
+        ]
+
     def __str__(self):
         return f"Core {self.core or 'N/A'} (Flight: {self.flight or 'N/A'})"
 
 
+class LaunchQuerySet(models.QuerySet):
+    """
+    QuerySet helpers for reading launches together with their nested objects.
+    """
+    def for_listing(self):
+        """
+        Loads everything a launch card renders in a fixed number of queries:
+        the links subtree is joined in, while crew, payloads and cores are
+        prefetched in one query each.
+        """
+        return (
+            self.select_related("links__patch", "links__reddit", "links__flickr")
+            .prefetch_related("crew", "payloads", "cores")
+            .order_by("-date_utc")
+        )
+
+
 class Launch(models.Model):
     '''
     Represents a single launch
     '''
-    launch_id = models.CharField(max_length=255)
+    launch_id = models.CharField(max_length=255, unique=True)
     fairings = models.JSONField(null=True, blank=True)
     static_fire_date_utc = models.DateTimeField(null=True, blank=True)
     static_fire_date_unix = models.IntegerField(null=True, blank=True)
@@ -181,11 +223,12 @@ class Launch(models.Model):
     auto_update = models.BooleanField(null=True, blank=True)
     flight_number = models.IntegerField(null=True, blank=True)
     name = models.CharField(max_length=255, null=True, blank=True)
-    date_utc = models.DateTimeField(null=True, blank=True)
+    date_utc = models.DateTimeField(null=True, blank=True, db_index=True)
     date_unix = models.IntegerField(null=True, blank=True)
     date_local = models.DateTimeField(null=True, blank=True)
     date_precision = models.CharField(max_length=50, null=True, blank=True)
     upcoming = models.BooleanField(null=True, blank=True)
+    source_hash = models.CharField(max_length=40, null=True, blank=True)
 
     # Nested objects as OneToOne or ManyToMany relationships
     links = models.OneToOneField(
@@ -208,5 +251,24 @@ class Launch(models.Model):
         blank=True
     )
 
+    objects = LaunchQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.name}"
+
+class LaunchCard(models.Model):
+    '''
+    Denormalized read model of one launch card: the card's summary, with
+    crew and payload names flattened into ``data``, and the collapsed
+    sections (cores, fairings, failures, links) in ``sections``, which the
+    listing never loads; each is fetched on its own when expanded. Rebuilt
+    by cards.build_cards whenever the sync changes a launch or anything it
+    shows.
+    '''
+    launch = models.OneToOneField(Launch, on_delete=models.CASCADE, primary_key=True, related_name="card")
+    date_utc = models.DateTimeField(null=True, blank=True, db_index=True)
+    data = models.JSONField()
+    sections = models.JSONField(default=dict)
+
     def __str__(self):
-        return f"{self.name}"
\ No newline at end of file
+        return f"{self.data.get('name')}"
@@ -0,0 +1,214 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class KeysetPage:
+    '''
+    One page of a keyset-paginated listing plus the links to its neighbours
+    '''
+    def __init__(self, object_list, page_size, next_url=None, previous_url=None):
+        self.object_list = object_list
+        self.page_size = page_size
+        self.next_url = next_url
+        self.previous_url = previous_url
+
+    @property
+    def has_next(self):
+        return self.next_url is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_url is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def _key_value(obj, name):
+    if isinstance(obj, dict):
+        return obj[name]
+    return getattr(obj, name)
+
+
+def encode_cursor(value, pk):
+    """
+    Packs the sort key and primary key of a row into an opaque URL-safe token.
+    """
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    raw = json.dumps([value, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, field):
+    """
+    Reverses encode_cursor. Returns None for a malformed token.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, pk = json.loads(raw)
+        if value is not None:
+            value = field.to_python(value)
+        return value, int(pk)
+    except (ValueError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+def _after(name, value, pk, descending):
+    lookup = "lt" if descending else "gt"
+    if value is None:
+        return Q(**{f"{name}__isnull": True, f"pk__{lookup}": pk})
+    return (
+        Q(**{f"{name}__{lookup}": value})
+        | Q(**{name: value, f"pk__{lookup}": pk})
+        | Q(**{f"{name}__isnull": True})
+    )
+
+
+def _before(name, value, pk, descending):
+    lookup = "gt" if descending else "lt"
+    if value is None:
+        return Q(**{f"{name}__isnull": False}) | Q(**{f"{name}__isnull": True, f"pk__{lookup}": pk})
+    return Q(**{f"{name}__{lookup}": value}) | Q(**{name: value, f"pk__{lookup}": pk})
+
+
+def keyset_ordering(name, descending=False, reverse=False):
+    """
+    Stable ordering for a keyset walk: the sort column with NULLs last, then
+    the primary key as a tie-breaker. ``reverse`` flips the whole ordering,
+    which is how previous pages are fetched.
+    """
+    nulls = {"nulls_first": True} if reverse else {"nulls_last": True}
+    if descending != reverse:
+        return F(name).desc(**nulls), "-pk"
+    return F(name).asc(**nulls), "pk"
+
+
+def keyset_chunks(queryset, name, descending=False, after=None, chunk_size=DEFAULT_PAGE_SIZE):
+    """
+    Walks ``queryset`` in keyset order from the (value, pk) position
+    ``after``, yielding lists of at most ``chunk_size`` rows. Each chunk is
+    one indexed range scan, so a walk over the whole table never holds more
+    than one chunk. Rows may be model instances or .values() dicts that
+    include ``name`` and "pk".
+    """
+    while True:
+        chunk = queryset
+        if after is not None:
+            chunk = chunk.filter(_after(name, *after, descending))
+        rows = list(chunk.order_by(*keyset_ordering(name, descending))[:chunk_size])
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = _key_value(rows[-1], name), _key_value(rows[-1], "pk")
+
+
+async def akeyset_chunks(queryset, name, descending=False, after=None, chunk_size=DEFAULT_PAGE_SIZE):
+    """
+    keyset_chunks() as an async generator reading through the async ORM.
+    """
+    while True:
+        chunk = queryset
+        if after is not None:
+            chunk = chunk.filter(_after(name, *after, descending))
+        rows = [row async for row in chunk.order_by(*keyset_ordering(name, descending))[:chunk_size]]
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = _key_value(rows[-1], name), _key_value(rows[-1], "pk")
+
+
+def page_size_from(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(request.GET.get("page_size", default))
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+def _page_url(request, **params):
+    query = request.GET.copy()
+    query.pop("after", None)
+    query.pop("before", None)
+    query.update(params)
+    return f"?{query.urlencode()}"
+
+
+def page_query(request, queryset, name, descending=False, size=DEFAULT_PAGE_SIZE):
+    """
+    The query behind one keyset page: ``queryset`` filtered by the request's
+    ``after``/``before`` cursor and cut to ``size`` + 1 rows (the extra row
+    tells whether there is more). Returns (queryset, backwards, after) where
+    ``backwards`` means the rows come in reverse listing order, from a
+    ``before`` cursor, and ``after`` whether an ``after`` cursor was applied.
+    """
+    field = queryset.model._meta.get_field(name)
+    after = decode_cursor(request.GET["after"], field) if "after" in request.GET else None
+    before = decode_cursor(request.GET["before"], field) if "before" in request.GET else None
+    if before is not None:
+        queryset = queryset.filter(_before(name, *before, descending))
+        return queryset.order_by(*keyset_ordering(name, descending, reverse=True))[:size + 1], True, False
+    if after is not None:
+        queryset = queryset.filter(_after(name, *after, descending))
+    return queryset.order_by(*keyset_ordering(name, descending))[:size + 1], False, after is not None
+
+
+def page_links(request, name, first, last, has_next, has_previous):
+    """
+    (next_url, previous_url) of a page whose first and last rows are
+    ``first`` and ``last`` (None for an empty page).
+    """
+    next_url = previous_url = None
+    if last is not None and has_next:
+        next_url = _page_url(request, after=encode_cursor(_key_value(last, name), _key_value(last, "pk")))
+    if first is not None and has_previous:
+        previous_url = _page_url(request, before=encode_cursor(_key_value(first, name), _key_value(first, "pk")))
+    return next_url, previous_url
+
+
+def paginate(request, queryset, name, descending=False, default_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns a KeysetPage of ``queryset`` ordered by ``name`` (with the primary
+    key as a tie-breaker), positioned by the ``after``/``before`` cursors in the
+    request and sized by ``page_size``.
+
+    Each page is a single indexed range scan, so the cost of a page does not
+    depend on how deep into the listing it is.
+    """
+    size = page_size_from(request, default_size)
+    queryset, backwards, after = page_query(request, queryset, name, descending, size)
+    return _page(request, list(queryset), name, size, backwards, after)
+
+
+async def apaginate(request, queryset, name, descending=False, default_size=DEFAULT_PAGE_SIZE):
+    """
+    paginate() for async views: the page is read through the async ORM.
+    """
+    size = page_size_from(request, default_size)
+    queryset, backwards, after = page_query(request, queryset, name, descending, size)
+    return _page(request, [row async for row in queryset], name, size, backwards, after)
+
+
+def _page(request, rows, name, size, backwards, after):
+    if backwards:
+        has_previous, has_next = len(rows) > size, True
+        rows = rows[:size][::-1]
+    else:
+        has_next, has_previous = len(rows) > size, after
+        rows = rows[:size]
+    next_url, previous_url = page_links(
+        request, name, rows[0] if rows else None, rows[-1] if rows else None, has_next, has_previous
+    )
+    return KeysetPage(rows, size, next_url, previous_url)
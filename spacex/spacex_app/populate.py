@@ -1,150 +1,476 @@
-from .helper_functions import api_request
-from .models import CrewMember, Payload, Dragon, Launch, LaunchCore, LaunchLinks, PatchLinks, RedditLinks, FlickrLinks
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .caching import bump_data_version
+from .cards import build_cards, missing_cards
+from .helper_functions import api_request, record_hash
+from .search_index import reindex
+from .transactions import write_transaction
+from .models import CrewMember, Payload, Dragon, Launch, LaunchCore, LaunchLinks, PatchLinks, RedditLinks, FlickrLinks, SyncState
+
+CREW_PATH = "/v4/crew"
+PAYLOAD_PATH = "/v4/payloads"
+LAUNCH_PATH = "/v5/launches"
+
+# The API fields each apply_* function reads: the projection requested from
+# the /query endpoints and the part of a record that source_hash covers.
+CREW_SELECT = ["id", "name", "agency", "image", "wikipedia", "launches", "status"]
+PAYLOAD_SELECT = [
+    "id", "name", "type", "reused", "launch", "customers", "nationalities", "manufacturers",
+    "norad_ids", "mass_kg", "mass_lbs", "orbit", "reference_system", "regime", "longitude",
+    "semi_major_axis_km", "eccentricity", "periapsis_km", "apoapsis_km", "inclination_deg",
+    "period_min", "lifespan_years", "epoch", "mean_motion", "raan", "arg_of_pericenter",
+    "mean_anomaly", "dragon",
+]
+
+
+# Keys of the api_request/api_query metrics kept on a SyncResult
+REQUEST_METRICS = ["pages", "attempts", "latency", "bytes", "decoded_bytes"]
+
+
+class SyncResult:
+    '''
+    What one apply_* call did: how many records were created, updated or left
+    alone, whether the endpoint answered 304, per-phase timings in seconds,
+    and the API request metrics of the fetch (see REQUEST_METRICS).
+    '''
+    def __init__(self, resource):
+        self.resource = resource
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.not_modified = False
+        self.timings = {}
+        self.requests = {}
+
+    def classify(self, known, record_id, digest):
+        """
+        Counts one record against the {id: source_hash} map of stored rows and
+        returns whether it needs writing.
+        """
+        if record_id not in known:
+            self.created += 1
+        elif known[record_id] != digest:
+            self.updated += 1
+        else:
+            self.unchanged += 1
+            return False
+        return True
+
+    def __str__(self):
+        if self.not_modified:
+            return f"{self.resource}: not modified"
+        return f"{self.resource}: {self.created} created, {self.updated} updated, {self.unchanged} unchanged"
+
+
+def api_url(path):
+    """
+    Full URL of an API path on SPACEX_API_BASE_URL. Sync state is kept per
+    full URL, so pointing the base URL at a stand-in server does not disturb
+    the validators saved for the real API.
+    """
+    return settings.SPACEX_API_BASE_URL.rstrip("/") + path
+
+
+def sync_state_for(api_url):
+    state, _ = SyncState.objects.get_or_create(endpoint=api_url)
+    return state
+
+
+def _finish_sync(state):
+    state.synced_at = timezone.now()
+    state.save()
+
+
+def _launches_linked_to(relation, pks):
+    return list(Launch.objects.filter(**{f"{relation}__in": pks}).values_list("pk", flat=True).distinct())
+
 
 def populate_crew():
-    api_url = "https://api.spacexdata.com/v4/crew"
-    crew_members = api_request(api_url)
-    for p in crew_members:
-        CrewMember.objects.get_or_create(
-            member_id=p.get("id"),
-            defaults={
-                "name": p.get("name"),
-                "agency": p.get("agency"),
-                "image_url": p.get("image"),
-                "wikipedia_url": p.get("wikipedia"),
-                "launches": p.get("launches"),
-                "status": p.get("status"),
-            },
-        )
-        
-def populate_launch():
-    api_url = "https://api.spacexdata.com/v5/launches"
-    launches = api_request(api_url)
-
-    for l_data in launches:
-        links_data = l_data.get("links", {})
-        patch_links_obj, reddit_links_obj, flickr_links_obj = None, None, None
-
-        if links_data and links_data.get("patch"):
-            patch_links_obj, _ = PatchLinks.objects.get_or_create(**links_data.get("patch", {}))
-
-        if links_data and links_data.get("reddit"):
-            reddit_links_obj, _ = RedditLinks.objects.get_or_create(**links_data.get("reddit", {}))
-
-        if links_data and links_data.get("flickr"):
-            flickr_links_obj, _ = FlickrLinks.objects.get_or_create(**links_data.get("flickr", {}))
-
-        launch_links_obj = LaunchLinks.objects.create(
-            patch=patch_links_obj,
-            reddit=reddit_links_obj,
-            flickr=flickr_links_obj,
-            presskit=links_data.get("presskit"),
-            webcast=links_data.get("webcast"),
-            youtube_id=links_data.get("youtube_id"),
-            article=links_data.get("article"),
-            wikipedia=links_data.get("wikipedia"),
-        )
-
-        launch_obj, _ = Launch.objects.update_or_create(
-            launch_id=l_data.get("id"),
-            defaults={
-                "fairings": l_data.get("fairings"),
-                "links": launch_links_obj,
-                "static_fire_date_utc": l_data.get("static_fire_date_utc"),
-                "static_fire_date_unix": l_data.get("static_fire_date_unix"),
-                "net": l_data.get("net", False),
-                "window": l_data.get("window"),
-                "rocket": l_data.get("rocket"),
-                "success": l_data.get("success"),
-                "failures": l_data.get("failures", []),
-                "details": l_data.get("details"),
-                "ships": l_data.get("ships", []),
-                "capsules": l_data.get("capsules", []),
-                "launchpad": l_data.get("launchpad"),
-                "flight_number": l_data.get("flight_number"),
-                "name": l_data.get("name"),
-                "date_utc": l_data.get("date_utc"),
-                "date_unix": l_data.get("date_unix"),
-                "date_local": l_data.get("date_local"),
-                "date_precision": l_data.get("date_precision"),
-                "upcoming": l_data.get("upcoming"),
-                "auto_update": l_data.get("auto_update"),
-                "tdb": l_data.get("tdb", False),
-            },
-        )
-
-        # Create LaunchCore objects and associate them
-        core_objects = []
-        for core_data in l_data.get("cores", []):
-            core_obj, _ = LaunchCore.objects.get_or_create(
-                core=core_data.get("core"),
-                flight=core_data.get("flight"),
-                defaults=core_data,
+    state = sync_state_for(api_url(CREW_PATH))
+    return apply_crew(api_request(state.endpoint, sync_state=state, stream=True), state)
+
+
+def apply_crew(crew_members, state):
+    """
+    Writes fetched /v4/crew records. ``crew_members`` is None when the endpoint
+    answered 304 Not Modified.
+    """
+    result = SyncResult("crew")
+    if crew_members is None:
+        result.not_modified = True
+        _finish_sync(state)
+        return result
+
+    known = dict(CrewMember.objects.values_list("member_id", "source_hash"))
+    changed = []
+    with write_transaction():
+        for p in crew_members:
+            digest = record_hash(p, CREW_SELECT)
+            if not result.classify(known, p.get("id"), digest):
+                continue
+            member, _ = CrewMember.objects.update_or_create(
+                member_id=p.get("id"),
+                defaults={
+                    "name": p.get("name"),
+                    "agency": p.get("agency"),
+                    "image_url": p.get("image"),
+                    "wikipedia_url": p.get("wikipedia"),
+                    "launches": p.get("launches"),
+                    "status": p.get("status"),
+                    "source_hash": digest,
+                },
             )
-            core_objects.append(core_obj)
-        if core_objects:
-            launch_obj.cores.set(core_objects)
-
-        # Link existing CrewMember objects
-        crew_ids = l_data.get("crew", [])
-        if crew_ids:
-            crew_members = CrewMember.objects.filter(member_id__in=crew_ids)
-            launch_obj.crew.set(crew_members)
-
-        # Link existing Payload objects
-        payload_ids = l_data.get("payloads", [])
-        if payload_ids:
-            payloads = Payload.objects.filter(payload_id__in=payload_ids)
-            launch_obj.payloads.set(payloads)        
+            changed.append(member.pk)
+        if changed:
+            reindex("crew", changed)
+            # Launch documents and cards include crew names
+            linked = _launches_linked_to("crew", changed)
+            reindex("launch", linked)
+            build_cards(linked)
+            bump_data_version("crew")
+        _finish_sync(state)
+    return result
+
+
+LAUNCH_WRITE_BATCH = 250
+
+LAUNCH_FIELDS = {
+    "fairings": ("fairings", None),
+    "static_fire_date_utc": ("static_fire_date_utc", None),
+    "static_fire_date_unix": ("static_fire_date_unix", None),
+    "net": ("net", False),
+    "window": ("window", None),
+    "rocket": ("rocket", None),
+    "success": ("success", None),
+    "failures": ("failures", []),
+    "details": ("details", None),
+    "ships": ("ships", []),
+    "capsules": ("capsules", []),
+    "launchpad": ("launchpad", None),
+    "flight_number": ("flight_number", None),
+    "name": ("name", None),
+    "date_utc": ("date_utc", None),
+    "date_unix": ("date_unix", None),
+    "date_local": ("date_local", None),
+    "date_precision": ("date_precision", None),
+    "upcoming": ("upcoming", None),
+    "auto_update": ("auto_update", None),
+    "tdb": ("tdb", False),
+}
+LINK_FIELDS = ["presskit", "webcast", "youtube_id", "article", "wikipedia"]
+LAUNCH_SELECT = ["id", *(key for key, _ in LAUNCH_FIELDS.values()), "links", "cores", "crew", "payloads"]
+
+
+def _get_or_create_values(model, items, key_fields=None, known=None):
+    """
+    Bulk get_or_create for value objects (patch/reddit/flickr links, cores).
+
+    ``items`` is a list of field dicts (or None); the result is the matching
+    list of saved instances (or None). Rows are identified by ``key_fields``,
+    all of the model's fields by default. Costs one SELECT for the table and
+    one INSERT for whatever is missing.
+
+    ``known`` is a dict shared by the calls for one sync, which keeps the
+    table's rows between batches so the SELECT only runs for the first one.
+    """
+    field_names = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+    key_fields = key_fields or field_names
+
+    def key(obj):
+        return tuple(json.dumps(getattr(obj, f), sort_keys=True) for f in key_fields)
+
+    known = {} if known is None else known
+    if model not in known:
+        known[model] = {key(obj): obj for obj in model.objects.all()}
+    existing = known[model]
+    keys, missing = [], {}
+    for data in items:
+        if not data:
+            keys.append(None)
+            continue
+        obj = model(**{k: v for k, v in data.items() if k in field_names})
+        keys.append(key(obj))
+        if keys[-1] not in existing:
+            missing.setdefault(keys[-1], obj)
+    if missing:
+        existing.update(zip(missing.keys(), model.objects.bulk_create(list(missing.values()))))
+    return [existing[k] if k is not None else None for k in keys]
+
+
+def _bulk_update(model, objs, fields):
+    """
+    UPDATE ... WHERE pk = %s run once per object through a single executemany.
+    QuerySet.bulk_update builds one CASE WHEN per field per batch, which costs
+    far more Python time than the database spends applying the rows.
+    """
+    objs = list(objs)
+    if not objs:
+        return
+    qn = connection.ops.quote_name
+    columns = [model._meta.get_field(name) for name in fields]
+    sql = "UPDATE {} SET {} WHERE {} = %s".format(
+        qn(model._meta.db_table),
+        ", ".join(f"{qn(field.column)} = %s" for field in columns),
+        qn(model._meta.pk.column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in columns] + [obj.pk]
+            for obj in objs
+        ])
+
+
+def _crew_member_id(entry):
+    # /v5/launches lists crew as {"crew": <id>, "role": ...}; older data used bare ids.
+    return entry.get("crew") if isinstance(entry, dict) else entry
+
+
+def _replace_m2m(relation, rows_by_launch, target_column):
+    """
+    Equivalent of ``launch.<relation>.set(...)`` for many launches at once:
+    one DELETE of the current through rows and one bulk INSERT of the new ones.
+    """
+    if not rows_by_launch:
+        return
+    through = relation.through
+    through.objects.filter(launch_id__in=rows_by_launch.keys()).delete()
+    through.objects.bulk_create(
+        [
+            through(launch_id=launch_pk, **{target_column: target_pk})
+            for launch_pk, targets in rows_by_launch.items()
+            for target_pk in dict.fromkeys(targets)
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def populate_launch():
+    state = sync_state_for(api_url(LAUNCH_PATH))
+    return apply_launch(api_request(state.endpoint, sync_state=state, stream=True), state)
+
+
+def apply_launch(launches, state):
+    """
+    Writes fetched /v5/launches records. ``launches`` is None when the endpoint
+    answered 304 Not Modified.
+
+    ``launches`` may be a lazy iterator; changed records are written in
+    batches of LAUNCH_WRITE_BATCH as they arrive, so only one batch of
+    records is held in memory at a time.
+    """
+    result = SyncResult("launch")
+    if launches is None:
+        result.not_modified = True
+        with write_transaction():
+            _build_missing_cards()
+            _finish_sync(state)
+        return result
+
+    known = dict(Launch.objects.values_list("launch_id", "source_hash"))
+    changed, batch, values = [], [], {}
+    with write_transaction():
+        for l_data in launches:
+            if result.classify(known, l_data.get("id"), record_hash(l_data, LAUNCH_SELECT)):
+                batch.append(l_data)
+            if len(batch) == LAUNCH_WRITE_BATCH:
+                changed.extend(_write_launches(batch, values))
+                batch = []
+        if batch:
+            changed.extend(_write_launches(batch, values))
+        if changed:
+            reindex("launch", changed)
+            build_cards(changed)
+            bump_data_version("launch")
+        _build_missing_cards()
+        _finish_sync(state)
+    return result
+
+
+def _build_missing_cards():
+    """
+    Builds the cards of launches that have none, such as ones stored before
+    LaunchCard existed, so an unchanged sync still completes the read model.
+    """
+    missing = missing_cards()
+    if missing:
+        build_cards(missing)
+        bump_data_version("launch")
+
+
+def _write_launches(launches, values=None):
+    """
+    Writes a batch of /v5/launches records with a fixed number of statements:
+    existing rows are loaded into maps keyed by their natural keys, then every
+    table is written with bulk_create/_bulk_update. Returns the launch pks.
+    """
+    links_data = [l_data.get("links") or {} for l_data in launches]
+    patches = _get_or_create_values(PatchLinks, [d.get("patch") for d in links_data], known=values)
+    reddits = _get_or_create_values(RedditLinks, [d.get("reddit") for d in links_data], known=values)
+    flickrs = _get_or_create_values(FlickrLinks, [d.get("flickr") for d in links_data], known=values)
+    flat_cores = _get_or_create_values(
+        LaunchCore,
+        [c for l_data in launches for c in l_data.get("cores", [])],
+        key_fields=["core", "flight"],
+        known=values,
+    )
+
+    existing = {
+        launch.launch_id: launch
+        for launch in Launch.objects.filter(launch_id__in=[l_data.get("id") for l_data in launches])
+    }
+    current_links = LaunchLinks.objects.in_bulk(
+        [launch.links_id for launch in existing.values() if launch.links_id is not None]
+    )
+
+    # A launch keeps its LaunchLinks row across syncs; only launches seen for
+    # the first time get a new one.
+    links_to_create, links_to_update = [], {}
+    launch_links = []
+    for l_data, d, patch, reddit, flickr in zip(launches, links_data, patches, reddits, flickrs):
+        launch = existing.get(l_data.get("id"))
+        links_obj = current_links.get(launch.links_id) if launch is not None else None
+        if links_obj is None:
+            links_obj = LaunchLinks()
+            links_to_create.append(links_obj)
+        else:
+            links_to_update[links_obj.pk] = links_obj
+        links_obj.patch, links_obj.reddit, links_obj.flickr = patch, reddit, flickr
+        for f in LINK_FIELDS:
+            setattr(links_obj, f, d.get(f))
+        launch_links.append(links_obj)
+    LaunchLinks.objects.bulk_create(links_to_create)
+    _bulk_update(LaunchLinks, links_to_update.values(), ["patch", "reddit", "flickr", *LINK_FIELDS])
+
+    to_create, to_update = [], {}
+    launch_objs = []
+    for l_data, links_obj in zip(launches, launch_links):
+        launch_id = l_data.get("id")
+        launch_obj = existing.get(launch_id)
+        if launch_obj is None:
+            launch_obj = existing[launch_id] = Launch(launch_id=launch_id)
+            to_create.append(launch_obj)
+        elif launch_obj.pk is not None:
+            to_update[launch_id] = launch_obj
+        for field, (key, default) in LAUNCH_FIELDS.items():
+            setattr(launch_obj, field, l_data.get(key, default))
+        launch_obj.source_hash = record_hash(l_data, LAUNCH_SELECT)
+        launch_obj.links = links_obj
+        launch_objs.append(launch_obj)
+    Launch.objects.bulk_create(to_create)
+    _bulk_update(Launch, to_update.values(), [*LAUNCH_FIELDS, "source_hash", "links"])
+
+    crew_ids = {
+        _crew_member_id(c) for l_data in launches for c in l_data.get("crew", [])
+    }
+    payload_ids = {p for l_data in launches for p in l_data.get("payloads", [])}
+    crew_pks = dict(CrewMember.objects.filter(member_id__in=crew_ids).values_list("member_id", "pk"))
+    payload_pks = dict(Payload.objects.filter(payload_id__in=payload_ids).values_list("payload_id", "pk"))
+
+    launch_cores, launch_crew, launch_payloads = {}, {}, {}
+    core_iter = iter(flat_cores)
+    for l_data, launch_obj in zip(launches, launch_objs):
+        if l_data.get("cores"):
+            launch_cores[launch_obj.pk] = [next(core_iter).pk for _ in l_data["cores"]]
+        if l_data.get("crew"):
+            launch_crew[launch_obj.pk] = [
+                crew_pks[m] for m in map(_crew_member_id, l_data["crew"]) if m in crew_pks
+            ]
+        if l_data.get("payloads"):
+            launch_payloads[launch_obj.pk] = [
+                payload_pks[p] for p in l_data["payloads"] if p in payload_pks
+            ]
+    _replace_m2m(Launch.cores, launch_cores, "launchcore_id")
+    _replace_m2m(Launch.crew, launch_crew, "crewmember_id")
+    _replace_m2m(Launch.payloads, launch_payloads, "payload_id")
+    return [launch_obj.pk for launch_obj in launch_objs]
+
 
 def populate_payload():
-    api_url = "https://api.spacexdata.com/v4/payloads"
-    payloads = api_request(api_url)
-    for p in payloads:
-        dragon_obj = None
-        if d := p.get("dragon"):
-            if any(d.values()):
-                dragon_obj, _ = Dragon.objects.get_or_create(
-                    capsule=d.get("capsule"),
-                    manifest=d.get("manifest"),
-                    defaults={
-                        "mass_returned_kg": d.get("mass_returned_kg"),
-                        "mass_returned_lbs": d.get("mass_returned_lbs"),
-                        "flight_time_sec": d.get("flight_time_sec"),
-                        "water_landing": d.get("water_landing"),
-                        "land_landing": d.get("land_landing"),
-                    },
-                )
-                
-        Payload.objects.update_or_create(
-            payload_id=p.get("id"),
-            defaults={
-                "name": p.get("name"),
-                "type": p.get("type"),
-                "reused": p.get("reused"),
-                "launch": p.get("launch"),
-                "customers": p.get("customers"),
-                "nationalities": p.get("nationalities"),
-                "manufacturers": p.get("manufacturers"),
-                "norad_ids": p.get("norad_ids"),
-                "mass_kg": p.get("mass_kg"),
-                "mass_lbs": p.get("mass_lbs"),
-                "orbit": p.get("orbit"),
-                "reference_system": p.get("reference_system"),
-                "regime": p.get("regime"),
-                "longitude": p.get("longitude"),
-                "semi_major_axis_km": p.get("semi_major_axis_km"),
-                "eccentricity": p.get("eccentricity"),
-                "periapsis_km": p.get("periapsis_km"),
-                "apoapsis_km": p.get("apoapsis_km"),
-                "inclination_deg": p.get("inclination_deg"),
-                "period_min": p.get("period_min"),
-                "lifespan_years": p.get("lifespan_years"),
-                "epoch": p.get("epoch"),
-                "mean_motion": p.get("mean_motion"),
-                "raan": p.get("raan"),
-                "arg_of_pericenter": p.get("arg_of_pericenter"),
-                "mean_anomaly": p.get("mean_anomaly"),
-                "dragon": dragon_obj,
-            },
-        )
\ No newline at end of file
+    state = sync_state_for(api_url(PAYLOAD_PATH))
+    return apply_payload(api_request(state.endpoint, sync_state=state, stream=True), state)
+
+
+def apply_payload(payloads, state):
+    """
+    Writes fetched /v4/payloads records. ``payloads`` is None when the endpoint
+    answered 304 Not Modified.
+    """
+    result = SyncResult("payload")
+    if payloads is None:
+        result.not_modified = True
+        _finish_sync(state)
+        return result
+
+    known = dict(Payload.objects.values_list("payload_id", "source_hash"))
+    changed = []
+    with write_transaction():
+        for p in payloads:
+            digest = record_hash(p, PAYLOAD_SELECT)
+            if not result.classify(known, p.get("id"), digest):
+                continue
+            changed.append(_write_payload(p, digest).pk)
+        if changed:
+            reindex("payload", changed)
+            # Launch documents and cards include payload names
+            linked = _launches_linked_to("payloads", changed)
+            reindex("launch", linked)
+            build_cards(linked)
+            bump_data_version("payload")
+        _finish_sync(state)
+    return result
+
+
+def _write_payload(p, digest):
+    dragon_obj = None
+    if d := p.get("dragon"):
+        if any(d.values()):
+            dragon_obj, _ = Dragon.objects.get_or_create(
+                capsule=d.get("capsule"),
+                manifest=d.get("manifest"),
+                defaults={
+                    "mass_returned_kg": d.get("mass_returned_kg"),
+                    "mass_returned_lbs": d.get("mass_returned_lbs"),
+                    "flight_time_sec": d.get("flight_time_sec"),
+                    "water_landing": d.get("water_landing"),
+                    "land_landing": d.get("land_landing"),
+                },
+            )
+
+    payload, _ = Payload.objects.update_or_create(
+        payload_id=p.get("id"),
+        defaults={
+            "name": p.get("name"),
+            "type": p.get("type"),
+            "reused": p.get("reused"),
+            "launch": p.get("launch"),
+            "customers": p.get("customers"),
+            "nationalities": p.get("nationalities"),
+            "manufacturers": p.get("manufacturers"),
+            "norad_ids": p.get("norad_ids"),
+            "mass_kg": p.get("mass_kg"),
+            "mass_lbs": p.get("mass_lbs"),
+            "orbit": p.get("orbit"),
+            "reference_system": p.get("reference_system"),
+            "regime": p.get("regime"),
+            "longitude": p.get("longitude"),
+            "semi_major_axis_km": p.get("semi_major_axis_km"),
+            "eccentricity": p.get("eccentricity"),
+            "periapsis_km": p.get("periapsis_km"),
+            "apoapsis_km": p.get("apoapsis_km"),
+            "inclination_deg": p.get("inclination_deg"),
+            "period_min": p.get("period_min"),
+            "lifespan_years": p.get("lifespan_years"),
+            "epoch": p.get("epoch"),
+            "mean_motion": p.get("mean_motion"),
+            "raan": p.get("raan"),
+            "arg_of_pericenter": p.get("arg_of_pericenter"),
+            "mean_anomaly": p.get("mean_anomaly"),
+            "dragon": dragon_obj,
+            "source_hash": digest,
+        },
+    )
+    return payload
\ No newline at end of file
@@ -0,0 +1,135 @@
+import cProfile
+import json
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.template.base import Template
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .query_wrappers import query_wrapper
+
+# Files written for every profile, served by views.profile_artifact
+ARTIFACT_FILES = ["summary.json", "profile.pstats", "stacks.collapsed", "sql.json", "templates.json"]
+MAX_SQL_ENTRIES = 10_000
+
+# One profile at a time: the template hook and the sampler are process-wide
+_lock = threading.Lock()
+
+
+def profiling_allowed(request):
+    """
+    Profiling is open to everyone when PROFILING_ENABLED is set and to staff
+    users otherwise.
+    """
+    user = getattr(request, "user", None)
+    return settings.PROFILING_ENABLED or bool(user and user.is_staff)
+
+
+async def aprofiling_allowed(request):
+    """
+    profiling_allowed() for async code, which cannot load request.user.
+    """
+    if settings.PROFILING_ENABLED:
+        return True
+    user = await request.auser() if hasattr(request, "auser") else None
+    return bool(user and user.is_staff)
+
+
+class Profiler:
+    '''
+    Profiles the code run in its ``with`` block on the current thread. It
+    records a cProfile profile, a sampled profile (collapsed stacks, as read
+    by flamegraph.pl and speedscope), every SQL statement with its duration,
+    and the render time of each template.
+    '''
+    def __init__(self, label, interval=0.005):
+        self.label = label
+        self.interval = interval
+        self.samples = Counter()
+        self.sql = []
+        self.templates = []
+        self.seconds = None
+        self._profile = cProfile.Profile()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        _lock.acquire()
+        self._thread_id = threading.get_ident()
+        self._original_render = Template._render
+        profiler = self
+
+        def timed_render(template, context):
+            if threading.get_ident() != profiler._thread_id:
+                return profiler._original_render(template, context)
+            start = time.perf_counter()
+            try:
+                return profiler._original_render(template, context)
+            finally:
+                profiler.templates.append({"template": template.name, "seconds": time.perf_counter() - start})
+
+        Template._render = timed_render
+        self._sql_wrapper = query_wrapper(self._execute)
+        self._sql_wrapper.__enter__()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self._start = time.perf_counter()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profile.disable()
+        self.seconds = time.perf_counter() - self._start
+        self._stop.set()
+        self._sampler.join()
+        self._sql_wrapper.__exit__(*exc_info)
+        Template._render = self._original_render
+        _lock.release()
+        return False
+
+    def _execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.sql) < MAX_SQL_ENTRIES:
+                self.sql.append({"sql": sql, "many": many, "seconds": time.perf_counter() - start})
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, directory=None):
+        """
+        Writes the artifacts to a new directory under PROFILE_DIR and returns
+        its path.
+        """
+        stamp = timezone.now().strftime("%Y%m%dT%H%M%S%f")
+        directory = Path(directory or settings.PROFILE_DIR) / f"{stamp}-{slugify(self.label)[:60]}"
+        directory.mkdir(parents=True)
+        self._profile.dump_stats(directory / "profile.pstats")
+        (directory / "stacks.collapsed").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+        )
+        (directory / "sql.json").write_text(json.dumps(self.sql, indent=1))
+        (directory / "templates.json").write_text(json.dumps(self.templates, indent=1))
+        (directory / "summary.json").write_text(json.dumps({
+            "label": self.label,
+            "seconds": self.seconds,
+            "sql_statements": len(self.sql),
+            "sql_seconds": sum(entry["seconds"] for entry in self.sql),
+            "samples": sum(self.samples.values()),
+            "sample_interval": self.interval,
+        }, indent=1))
+        return directory
@@ -0,0 +1,36 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+_wrappers = ContextVar("query_wrappers", default=())
+
+
+def _run_wrappers(execute, sql, params, many, context):
+    call = execute
+    for wrapper in reversed(_wrappers.get()):
+        call = partial(wrapper, call)
+    return call(sql, params, many, context)
+
+
+def install(sender, connection, **kwargs):
+    """
+    connection_created receiver that hooks every new connection up to the
+    wrappers of query_wrapper().
+    """
+    if _run_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_run_wrappers)
+
+
+@contextmanager
+def query_wrapper(wrapper):
+    """
+    Like connection.execute_wrapper(), but ``wrapper`` sees the queries of
+    the current context on any connection. That includes the queries an
+    async view sends through the async ORM, which run on another thread's
+    connection.
+    """
+    token = _wrappers.set((*_wrappers.get(), wrapper))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
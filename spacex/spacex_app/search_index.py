@@ -0,0 +1,173 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import CrewMember, Launch, Payload
+from .transactions import write_transaction
+
+SEARCH_TABLE = "spacex_app_search_index"
+
+# Each kind owns one residue class of the FTS rowid space, so a row can be
+# replaced or deleted by rowid without scanning the index.
+KIND_CODES = {"launch": 0, "payload": 1, "crew": 2}
+
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+
+def _rowid(kind, pk):
+    return pk * len(KIND_CODES) + KIND_CODES[kind]
+
+
+def _join(*parts):
+    return " ".join(str(p) for p in parts if p not in (None, "", []))
+
+
+def _launch_document(launch):
+    return launch.name, _join(
+        launch.details,
+        launch.launch_id,
+        launch.flight_number,
+        launch.rocket,
+        launch.launchpad,
+        launch.date_utc.date().isoformat() if launch.date_utc else None,
+        *(c.name for c in launch.crew.all()),
+        *(p.name for p in launch.payloads.all()),
+        *(c.core for c in launch.cores.all()),
+    )
+
+
+def _payload_document(payload):
+    return payload.name, _join(
+        payload.payload_id,
+        payload.type,
+        payload.orbit,
+        payload.regime,
+        payload.reference_system,
+        payload.launch,
+        *(payload.customers or []),
+        *(payload.nationalities or []),
+        *(payload.manufacturers or []),
+    )
+
+
+def _crew_document(member):
+    return member.name, _join(member.member_id, member.agency, member.status)
+
+
+INDEXERS = {
+    "launch": (lambda: Launch.objects.for_listing(), _launch_document),
+    "payload": (lambda: Payload.objects.all(), _payload_document),
+    "crew": (lambda: CrewMember.objects.all(), _crew_document),
+}
+
+
+def reindex(kind, pks=None):
+    """
+    Rewrites the search rows of one kind. With ``pks`` only those objects are
+    replaced, otherwise the whole kind is rebuilt from its table.
+    """
+    queryset_factory, document = INDEXERS[kind]
+    queryset = queryset_factory()
+    with write_transaction(), connection.cursor() as cursor:
+        if pks is None:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE kind = %s", [kind])
+        else:
+            pks = list(pks)
+            queryset = queryset.filter(pk__in=pks)
+            cursor.executemany(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+                [[_rowid(kind, pk)] for pk in pks],
+            )
+        rows = []
+        for obj in queryset:
+            title, body = document(obj)
+            rows.append([_rowid(kind, obj.pk), kind, obj.pk, title or "", body])
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def documents():
+    """
+    Every search row as (kind, object_id, title, body), for snapshots.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT kind, object_id, title, body FROM {SEARCH_TABLE}")
+        return cursor.fetchall()
+
+
+def load_documents(rows):
+    """
+    Replaces the whole index with (kind, object_id, title, body) rows as
+    returned by documents(), object ids already pointing at current rows.
+    """
+    with write_transaction(), connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, title, body) VALUES (%s, %s, %s, %s, %s)",
+            [[_rowid(kind, pk), kind, pk, title, body] for kind, pk, title, body in rows],
+        )
+
+
+def match_expression(text):
+    """
+    Turns free text into a safe FTS5 query: every word is quoted (so user
+    input can never be parsed as FTS syntax) and the last word is matched as
+    a prefix, which is what type-ahead search needs.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(text, kind=None, limit=20, offset=0):
+    """
+    Returns ranked matches as dicts with ``kind``, ``id``, ``title`` and an
+    HTML-escaped ``snippet`` whose matched terms are wrapped in <mark>.
+    Titles weigh ten times as much as the rest of the document.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    sql = (
+        f"SELECT kind, object_id, title, "
+        f"snippet({SEARCH_TABLE}, 3, %s, %s, '…', 12) "
+        f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+    )
+    params = [_MARK_START, _MARK_END, expression]
+    if kind is not None:
+        sql += " AND kind = %s"
+        params.append(kind)
+    sql += f" ORDER BY bm25({SEARCH_TABLE}, 0, 0, 10.0, 1.0) LIMIT %s OFFSET %s"
+    params += [limit, offset]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            {
+                "kind": row_kind,
+                "id": object_id,
+                "title": title,
+                "snippet": escape(snippet).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"),
+            }
+            for row_kind, object_id, title, snippet in cursor.fetchall()
+        ]
+
+
+def matching(text, kind):
+    """
+    Subquery of the primary keys of every object of ``kind`` matching
+    ``text``, to filter a queryset with ``pk__in`` in the same statement.
+    """
+    expression = match_expression(text)
+    if expression is None:
+        return []
+    return RawSQL(
+        f"SELECT object_id FROM {SEARCH_TABLE} WHERE kind = %s AND {SEARCH_TABLE} MATCH %s",
+        [kind, expression],
+    )
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.transaction import TransactionManagementError
+
+from .caching import bump_data_version, held_version_bumps
+
+
+def _shadow_path(live):
+    # Next to the live file, so the copy never crosses filesystems
+    directory = None if live.is_in_memory_db() else Path(live.settings_dict["NAME"]).parent
+    fd, path = tempfile.mkstemp(prefix="shadow-", suffix=".sqlite3", dir=directory)
+    os.close(fd)
+    return Path(path)
+
+
+def _remove(path):
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+@contextmanager
+def shadow_database(using=DEFAULT_DB_ALIAS):
+    '''
+    Runs the ``with`` block against a copy of the live SQLite database and,
+    if the block succeeds, copies the result back over the live database in
+    a single write transaction. Readers keep seeing the old data (WAL lets
+    them read during the copy) and then all of the new data, never a
+    half-written sync. Data versions bumped in the block are bumped after
+    the swap, so no page is cached from the old data under a new version.
+
+    Only this thread's connection is redirected; anything other code writes
+    to the live database while the block runs is overwritten by the swap.
+    '''
+    live = connections[using]
+    if live.vendor != "sqlite":
+        raise ImproperlyConfigured("shadow_database() needs an SQLite database")
+    if live.in_atomic_block:
+        raise TransactionManagementError("shadow_database() cannot run inside a transaction")
+    live.ensure_connection()
+    path = _shadow_path(live)
+    shadow = None
+    try:
+        target = sqlite3.connect(path)
+        try:
+            live.connection.backup(target)
+        finally:
+            target.close()
+        shadow = live.__class__({**live.settings_dict, "NAME": str(path)}, alias=using)
+        # Keeps profiling and request metrics wrappers seeing the sync's SQL
+        shadow.execute_wrappers = live.execute_wrappers
+        connections[using] = shadow
+        with held_version_bumps() as bumped:
+            yield shadow
+        connections[using] = live
+        shadow.close()
+        source = sqlite3.connect(path)
+        try:
+            source.backup(live.connection)
+        finally:
+            source.close()
+    finally:
+        connections[using] = live
+        if shadow is not None:
+            shadow.close()
+        _remove(path)
+    if bumped:
+        bump_data_version(*bumped)
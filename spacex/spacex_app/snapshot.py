@@ -0,0 +1,154 @@
+import gzip
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import search_index
+from .caching import bump_data_version
+from .models import (
+    CrewMember, Dragon, FlickrLinks, Launch, LaunchCard, LaunchCore, LaunchLinks, Payload,
+    PatchLinks, RedditLinks, SyncState
+)
+from .transactions import write_transaction
+
+FORMAT = "spacex-snapshot"
+VERSION = 2
+CHUNK_SIZE = 2000
+
+# In dependency order: every model only points at models listed before it.
+# Sync state goes along so the first sync after an import can answer 304.
+MODELS = [
+    SyncState, CrewMember, Dragon, Payload, PatchLinks, RedditLinks, FlickrLinks, LaunchLinks,
+    LaunchCore, Launch, Launch.crew.through, Launch.payloads.through, Launch.cores.through,
+    LaunchCard,
+]
+SEARCH_SECTION = "search_index"
+SEARCH_KINDS = {"launch": Launch, "payload": Payload, "crew": CrewMember}
+
+
+def _quoted(names):
+    return ", ".join(connection.ops.quote_name(name) for name in names)
+
+
+def _fetch_rows(cursor):
+    while rows := cursor.fetchmany(CHUNK_SIZE):
+        yield from rows
+
+
+def _write_section(f, name, columns, rows, count):
+    f.write(json.dumps({"table": name, "columns": columns, "rows": count}) + "\n")
+    for row in rows:
+        # The driver parses date columns; str() gives back their stored text
+        f.write(json.dumps(row, default=str, separators=(",", ":")) + "\n")
+
+
+def export_snapshot(path):
+    """
+    Writes every catalogue table and the search index to ``path`` as gzipped
+    JSON lines and returns the number of rows written per table. After a
+    header line, each table is one {"table", "columns", "rows"} line followed
+    by its rows as JSON arrays of the stored column values.
+    """
+    counts = {}
+    with gzip.open(path, "wt", encoding="utf-8") as f, transaction.atomic(), connection.cursor() as cursor:
+        f.write(json.dumps({"format": FORMAT, "version": VERSION, "created": timezone.now().isoformat()}) + "\n")
+        for model in MODELS:
+            table = connection.ops.quote_name(model._meta.db_table)
+            columns = [field.column for field in model._meta.concrete_fields]
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            counts[model._meta.label_lower] = count = cursor.fetchone()[0]
+            cursor.execute(f"SELECT {_quoted(columns)} FROM {table} ORDER BY {_quoted([model._meta.pk.column])}")
+            _write_section(f, model._meta.label_lower, columns, _fetch_rows(cursor), count)
+        documents = search_index.documents()
+        counts[SEARCH_SECTION] = len(documents)
+        _write_section(f, SEARCH_SECTION, ["kind", "object_id", "title", "body"], documents, len(documents))
+    return counts
+
+
+def _check_header(f):
+    header = json.loads(f.readline() or "{}")
+    if not isinstance(header, dict) or header.get("format") != FORMAT or header.get("version") != VERSION:
+        raise ValueError(f"Not a version {VERSION} {FORMAT} file")
+
+
+def _read_sections(f):
+    while line := f.readline():
+        section = json.loads(line)
+        yield section, (json.loads(f.readline()) for _ in range(section["rows"]))
+
+
+def _insert(cursor, model, columns, rows):
+    cursor.executemany(
+        f"INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({_quoted(columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})",
+        rows,
+    )
+
+
+def _load_table(cursor, model, columns, rows, new_pks):
+    """
+    Inserts one table's rows, giving each a primary key after the table's
+    current maximum and rewriting foreign keys through ``new_pks``.
+    """
+    fields = {field.column: field for field in model._meta.concrete_fields}
+    unknown = set(columns) - set(fields)
+    if unknown:
+        raise ValueError(f"{model._meta.label} has no column(s) {', '.join(sorted(unknown))}")
+    remap = [(i, new_pks[fields[c].related_model]) for i, c in enumerate(columns) if fields[c].is_relation]
+    pk = model._meta.pk
+    renumber = None if pk.is_relation else columns.index(pk.column)
+    cursor.execute(f"SELECT MAX({_quoted([pk.column])}) FROM {connection.ops.quote_name(model._meta.db_table)}")
+    next_pk = (cursor.fetchone()[0] or 0) + 1
+    batch = []
+    for row in rows:
+        for i, mapping in remap:
+            if row[i] is not None:
+                row[i] = mapping[row[i]]
+        if renumber is not None:
+            new_pks[model][row[renumber]] = row[renumber] = next_pk
+            next_pk += 1
+        batch.append(row)
+        if len(batch) == CHUNK_SIZE:
+            _insert(cursor, model, columns, batch)
+            batch = []
+    if batch:
+        _insert(cursor, model, columns, batch)
+
+
+def import_snapshot(path, replace=False):
+    """
+    Loads a file written by export_snapshot() in one transaction and returns
+    the number of rows loaded per table. Rows get new primary keys; foreign
+    keys, many-to-many rows and search rows are remapped to them. The
+    catalogue must be empty unless ``replace`` is set, in which case it is
+    deleted first; sync state is always replaced by the snapshot's.
+    """
+    models = {model._meta.label_lower: model for model in MODELS}
+    new_pks = {model: {} for model in MODELS}
+    counts = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f, write_transaction(), connection.cursor() as cursor:
+        _check_header(f)
+        if replace:
+            for model in reversed(MODELS):
+                model._default_manager.all().delete()
+        elif any(model._default_manager.exists() for model in MODELS if model is not SyncState):
+            raise ValueError("The database already holds catalogue data; import with replace to overwrite it")
+        # Validators saved for an empty catalogue would turn the next sync into a 304
+        SyncState.objects.all().delete()
+
+        for section, rows in _read_sections(f):
+            if section["table"] == SEARCH_SECTION:
+                # Rows left behind by deleted objects are dropped
+                search_index.load_documents(
+                    [kind, new_pks[SEARCH_KINDS[kind]][pk], title, body]
+                    for kind, pk, title, body in rows
+                    if pk in new_pks[SEARCH_KINDS[kind]]
+                )
+            elif section["table"] in models:
+                _load_table(cursor, models[section["table"]], section["columns"], rows, new_pks)
+            else:
+                raise ValueError(f"Unknown table {section['table']!r} in snapshot")
+            counts[section["table"]] = section["rows"]
+        bump_data_version("crew", "payload", "launch")
+    return counts
@@ -1,22 +1,59 @@
 document.addEventListener("DOMContentLoaded", function() {
   const searchInput = document.getElementById("query");
-  const cards = document.querySelectorAll(".card");
+  const resultList = document.getElementById("search-results");
+  const DEBOUNCE_MS = 250;
+  let timer = null;
+  let inflight = null;
 
-  searchInput.addEventListener("input", function() {
-    const searchTerm = this.value.toLowerCase();
+  function clearResults() {
+    resultList.replaceChildren();
+    resultList.hidden = true;
+  }
 
-    cards.forEach(card => {
-      const name = card.querySelector(".card-title")?.textContent.toLowerCase() || "";
+  function showResults(data) {
+    resultList.replaceChildren();
+    if (data.results.length === 0) {
+      const empty = document.createElement("li");
+      empty.textContent = "No matches";
+      resultList.appendChild(empty);
+    }
+    data.results.forEach(result => {
+      const item = document.createElement("li");
+      const link = document.createElement("a");
+      link.href = result.url;
+      link.textContent = result.title || "Untitled";
+      const snippet = document.createElement("span");
+      // The snippet is escaped server-side; only <mark> tags are added.
+      snippet.innerHTML = result.snippet;
+      item.append(link, snippet);
+      resultList.appendChild(item);
+    });
+    resultList.hidden = false;
+  }
 
-      const metaLists = Array.from(card.querySelectorAll(".meta-list, .kv, p"))
-        .map(el => el.textContent.toLowerCase())
-        .join(" ");
+  function runSearch(term) {
+    if (inflight) {
+      inflight.abort();
+    }
+    inflight = new AbortController();
+    const params = new URLSearchParams({ q: term, kind: searchInput.dataset.kind, page_size: 8 });
+    fetch(`${searchInput.dataset.endpoint}?${params}`, { signal: inflight.signal })
+      .then(response => response.json())
+      .then(showResults)
+      .catch(error => {
+        if (error.name !== "AbortError") {
+          clearResults();
+        }
+      });
+  }
 
-      if (name.includes(searchTerm) || metaLists.includes(searchTerm)) {
-        card.style.display = "";
-      } else {
-        card.style.display = "none";
-      }
-    });
+  searchInput.addEventListener("input", function() {
+    const term = this.value.trim();
+    clearTimeout(timer);
+    if (!term) {
+      clearResults();
+      return;
+    }
+    timer = setTimeout(() => runSearch(term), DEBOUNCE_MS);
   });
-});
\ No newline at end of file
+});
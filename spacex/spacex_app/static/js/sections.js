@@ -0,0 +1,30 @@
+// Fills a card's collapsed <details data-src="..."> section from its fragment
+// URL the first time it is opened.
+document.addEventListener("toggle", function(event) {
+  const details = event.target;
+  if (!(details instanceof HTMLDetailsElement) || !details.open || !details.dataset.src || details.dataset.loaded) {
+    return;
+  }
+  details.dataset.loaded = "loading";
+  const body = document.createElement("div");
+  body.textContent = "Loading…";
+  details.appendChild(body);
+
+  fetch(details.dataset.src)
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`HTTP ${response.status}`);
+      }
+      return response.text();
+    })
+    .then(html => {
+      // Fragments are rendered by our own templates, which escape the data
+      body.innerHTML = html;
+      details.dataset.loaded = "done";
+    })
+    .catch(() => {
+      body.textContent = "Could not load this section. Close and reopen to retry.";
+      delete details.dataset.loaded;
+      details.addEventListener("toggle", () => body.remove(), { once: true });
+    });
+}, true);
@@ -0,0 +1,145 @@
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from .pagination import KeysetPage, page_links, page_query, page_size_from
+
+# Cards rendered per streamed chunk, and rows fetched per database round trip
+STREAM_CHUNK_SIZE = 20
+
+
+class StreamMarkers:
+    '''
+    Placeholders the listing templates print instead of their cards and
+    pagination links when passed as ``stream``; the page is split on them.
+    '''
+    cards = mark_safe("<!--stream:cards-->")
+    pagination = mark_safe("<!--stream:pagination-->")
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _achunks(rows, size):
+    chunk = []
+    async for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _aiter(rows):
+    for row in rows:
+        yield row
+
+
+class _StreamedPage:
+    '''
+    The parts of a streamed listing page, and the bookkeeping that turns the
+    chunks of rows read for it into cards and pagination links.
+    '''
+    def __init__(self, request, template_name, cards_template_name, name, queryset, order, descending, context):
+        self.request = request
+        self.name = name
+        self.order = order
+        self.context = context or {}
+        self.size = page_size_from(request)
+        self.rows, self.backwards, after = page_query(request, queryset, order, descending, self.size)
+        page_html = get_template(template_name).render({**self.context, "stream": StreamMarkers}, request)
+        self.head, rest = page_html.split(StreamMarkers.cards, 1)
+        self.middle, self.tail = rest.split(StreamMarkers.pagination, 1)
+        self.cards = get_template(cards_template_name)
+        self.has_previous, self.has_next = after, False
+        self.sent = 0
+        self.first = self.last = None
+
+    def read_backwards(self, listed):
+        # A before cursor reads the page in reverse, so it is read whole
+        self.has_previous, self.has_next = len(listed) > self.size, True
+        return listed[:self.size][::-1]
+
+    def render(self, chunk):
+        """
+        Cards for the next chunk of rows ("" once the page is full).
+        """
+        if not self.backwards and self.sent + len(chunk) > self.size:
+            chunk, self.has_next = chunk[:self.size - self.sent], True
+        if not chunk:
+            return ""
+        self.sent += len(chunk)
+        self.first = chunk[0] if self.first is None else self.first
+        self.last = chunk[-1]
+        return self.cards.render({**self.context, self.name: chunk}, self.request)
+
+    def end(self):
+        """
+        The rest of the page after the last card.
+        """
+        empty = self.cards.render({**self.context, self.name: []}, self.request) if self.first is None else ""
+        next_url, previous_url = page_links(
+            self.request, self.order, self.first, self.last, self.has_next, self.has_previous
+        )
+        page = KeysetPage([], self.size, next_url, previous_url)
+        return empty + self.middle + get_template("pagination.html").render({"page": page}, self.request) + self.tail
+
+
+def stream_listing(request, template_name, cards_template_name, name, queryset, order, descending=False,
+                   context=None):
+    """
+    Renders a keyset-paginated listing as a StreamingHttpResponse: the page
+    up to the cards goes out first, then the cards STREAM_CHUNK_SIZE at a
+    time as ``queryset.iterator()`` reads them, then the pagination links
+    and the rest of the page. ``cards_template_name`` renders a list of rows
+    passed as ``name``; only one chunk of rows is held at a time.
+    """
+    page = _StreamedPage(request, template_name, cards_template_name, name, queryset, order, descending, context)
+
+    def content():
+        yield page.head
+        if page.backwards:
+            listed = page.read_backwards(list(page.rows))
+        else:
+            listed = page.rows.iterator(chunk_size=STREAM_CHUNK_SIZE)
+        for chunk in _chunks(listed, STREAM_CHUNK_SIZE):
+            if cards := page.render(chunk):
+                yield cards
+        yield page.end()
+
+    return StreamingHttpResponse(content(), content_type="text/html; charset=utf-8")
+
+
+async def astream_listing(request, template_name, cards_template_name, name, queryset, order, descending=False,
+                          context=None):
+    """
+    stream_listing() for async views, with an async iterator as the body:
+    rows come from ``queryset.aiterator()`` and the templates are rendered
+    on a worker thread, so the event loop only waits on them.
+    """
+    page = await sync_to_async(_StreamedPage)(
+        request, template_name, cards_template_name, name, queryset, order, descending, context
+    )
+
+    async def content():
+        yield page.head
+        if page.backwards:
+            rows = _aiter(page.read_backwards([row async for row in page.rows]))
+        else:
+            rows = page.rows.aiterator(chunk_size=STREAM_CHUNK_SIZE)
+        async for chunk in _achunks(rows, STREAM_CHUNK_SIZE):
+            if cards := await sync_to_async(page.render)(chunk):
+                yield cards
+        yield await sync_to_async(page.end)()
+
+    return StreamingHttpResponse(content(), content_type="text/html; charset=utf-8")
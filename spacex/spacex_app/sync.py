@@ -0,0 +1,95 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from django.db import transaction
+
+from .helper_functions import api_query, api_request
+from .populate import (
+    CREW_PATH, CREW_SELECT, LAUNCH_PATH, LAUNCH_SELECT, PAYLOAD_PATH, PAYLOAD_SELECT,
+    REQUEST_METRICS, api_url, apply_crew, apply_launch, apply_payload, sync_state_for
+)
+from .shadow import shadow_database
+
+# In dependency order: launches link to crew members and payloads by their
+# API ids, so those rows have to be written first.
+RESOURCES = {
+    "crew": (CREW_PATH, apply_crew, CREW_SELECT),
+    "payload": (PAYLOAD_PATH, apply_payload, PAYLOAD_SELECT),
+    "launch": (LAUNCH_PATH, apply_launch, LAUNCH_SELECT),
+}
+
+
+def _fetch(name, state, query):
+    select = RESOURCES[name][2]
+    metrics = {}
+    if query is None:
+        records = api_request(state.endpoint, sync_state=state, metrics=metrics, stream=True)
+    else:
+        records = api_query(state.endpoint, query=query, select=select, metrics=metrics)
+    return records, metrics
+
+
+def launched_since(since):
+    """
+    /query filter for an incremental launch sync: launches dated at or after
+    the ``since`` unix timestamp, plus every upcoming launch, since those are
+    the ones whose details still change.
+    """
+    return {"$or": [{"upcoming": True}, {"date_unix": {"$gte": since}}]}
+
+
+def sync_all(resources=None, since=None, dry_run=False, shadow=False):
+    """
+    Refreshes ``resources`` (all of them by default) from the SpaceX API and
+    returns a {resource: SyncResult} map.
+
+    Every endpoint is fetched at once on a thread pool sharing the pooled
+    session, so the network part of a refresh takes as long as the slowest
+    fetch rather than the sum of all three. Writes stay on the calling thread
+    and are applied in RESOURCES order as each fetch completes.
+
+    A full sync GETs each collection conditionally, so an unchanged one costs
+    a 304. With ``since`` the /query endpoints are used instead: records are
+    projected to the fields the models store, read page by page, and
+    launches are filtered server-side by launched_since(). With
+    ``dry_run`` everything runs inside one transaction that is rolled back,
+    so the results describe what a real sync would change. With ``shadow``
+    the sync writes to a copy of the database that replaces the live one in
+    one step when every resource is done (see shadow.shadow_database()).
+    """
+    names = [name for name in RESOURCES if resources is None or name in resources]
+    results = {}
+
+    with (
+        shadow_database() if shadow else nullcontext(),
+        ThreadPoolExecutor(max_workers=len(names) or 1) as pool,
+        transaction.atomic() if dry_run else nullcontext(),
+    ):
+        # Sync state is read here because the worker threads must not touch the database
+        states = {name: sync_state_for(api_url(RESOURCES[name][0])) for name in names}
+        fetches = {}
+        for name in names:
+            query = None
+            if since is not None:
+                query = launched_since(since) if name == "launch" else {}
+            fetches[name] = pool.submit(_fetch, name, states[name], query)
+        for name in names:
+            records, metrics = fetches[name].result()
+            start = time.perf_counter()
+            result = RESOURCES[name][1](records, states[name])
+            # A streamed GET body is parsed while it is written; /query pages
+            # are parsed on the fetching threads
+            parse = metrics.get("parse", 0.0)
+            result.timings = {
+                "fetch": metrics.get("fetch", 0.0),
+                "parse": parse,
+                "write": time.perf_counter() - start - (parse if since is None else 0.0),
+            }
+            result.requests = {key: metrics[key] for key in REQUEST_METRICS if key in metrics}
+            if result.requests:
+                result.requests.setdefault("pages", 1)
+            results[name] = result
+        if dry_run:
+            transaction.set_rollback(True)
+    return results
@@ -0,0 +1,326 @@
+"""
+Test support shared by the test suite and the benchmarks: synthetic SpaceX
+API records shaped like /v4/crew, /v4/payloads and /v5/launches, at any
+size, and a local stand-in for api.spacexdata.com serving them. The
+command-line server is benchmarks/stub_api.py.
+"""
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ENDPOINTS = {"/v4/crew": "crew", "/v4/payloads": "payloads", "/v5/launches": "launches"}
+ERROR_STATUSES = [429, 500, 503]
+
+EPOCH = datetime(2006, 3, 24, tzinfo=timezone.utc)
+
+
+def crew(n):
+    return [
+        {
+            "id": f"crew{i:08d}", "name": f"Astronaut {i}", "agency": random.choice(["NASA", "ESA", "JAXA", "SpaceX"]),
+            "image": f"https://example.com/crew/{i}.png", "wikipedia": f"https://en.wikipedia.org/wiki/Astronaut_{i}",
+            "launches": [], "status": "active",
+        }
+        for i in range(n)
+    ]
+
+
+def payloads(n):
+    return [
+        {
+            "id": f"payload{i:08d}", "name": f"Payload {i}", "type": random.choice(["Satellite", "Dragon 2.0"]),
+            "reused": False, "launch": None, "customers": ["NASA"], "nationalities": ["United States"],
+            "manufacturers": ["SpaceX"], "norad_ids": [40000 + i], "mass_kg": 1000.0 + i, "mass_lbs": 2204.6 + i,
+            "orbit": "LEO", "reference_system": "geocentric", "regime": "low-earth",
+            "dragon": {
+                "capsule": f"capsule{i % 50:04d}", "mass_returned_kg": None, "mass_returned_lbs": None,
+                "flight_time_sec": None, "manifest": f"https://example.com/manifest/{i}", "water_landing": True,
+                "land_landing": None,
+            } if i % 10 == 0 else {},
+        }
+        for i in range(n)
+    ]
+
+
+def launches(n, n_payloads, n_crew):
+    records = []
+    for i in range(n):
+        date = EPOCH + timedelta(hours=6 * i)
+        records.append({
+            "id": f"launch{i:08d}", "name": f"Mission {i}", "flight_number": i + 1,
+            "date_utc": date.isoformat(), "date_unix": int(date.timestamp()), "date_local": date.isoformat(),
+            "date_precision": "hour", "static_fire_date_utc": None, "static_fire_date_unix": None,
+            "tdb": False, "net": False, "window": 0, "rocket": "falcon9", "success": True, "failures": [],
+            "upcoming": False, "details": f"Synthetic mission number {i}.",
+            "fairings": {"reused": False, "recovery_attempt": True, "recovered": True, "ships": []},
+            "crew": [{"crew": f"crew{(i + k) % n_crew:08d}", "role": "Crew"} for k in range(2)] if n_crew and i % 5 == 0 else [],
+            "ships": [], "capsules": [], "launchpad": "pad1", "auto_update": True,
+            "payloads": [f"payload{(2 * i + k) % n_payloads:08d}" for k in range(2)] if n_payloads else [],
+            "cores": [{
+                "core": f"core{i % 300:05d}", "flight": i // 300 + 1, "gridfins": True, "legs": True,
+                "reused": i >= 300, "landing_attempt": True, "landing_success": True,
+                "landing_type": "ASDS", "landpad": "ocisly",
+            }],
+            "links": {
+                "patch": {"small": f"https://example.com/patch/{i}_s.png", "large": f"https://example.com/patch/{i}_l.png"},
+                "reddit": {"campaign": None, "launch": f"https://reddit.com/r/spacex/{i}", "media": None, "recovery": None},
+                "flickr": {"small": [], "original": [f"https://example.com/flickr/{i}.jpg"]},
+                "presskit": None, "webcast": f"https://youtube.com/watch?v={i}", "youtube_id": str(i),
+                "article": None, "wikipedia": None,
+            },
+        })
+    return records
+
+
+def catalog(n_launches, n_payloads, n_crew):
+    """
+    {"crew": [...], "payloads": [...], "launches": [...]} of synthetic
+    records linking to each other, as served by StubAPI.
+    """
+    return {
+        "crew": crew(n_crew),
+        "payloads": payloads(n_payloads),
+        "launches": launches(n_launches, n_payloads, n_crew),
+    }
+
+
+def scale(catalog, factor):
+    """
+    ``factor`` copies of the catalogue. Copy k > 0 suffixes every id (and
+    core serial) with "-k" and rewrites the cross references to match, so
+    each copy links only to its own crew and payloads.
+    """
+    if factor <= 1:
+        return catalog
+
+    def suffix(value, k):
+        return f"{value}-{k}" if k and value is not None else value
+
+    scaled = {"crew": [], "payloads": [], "launches": []}
+    for k in range(factor):
+        for member in catalog["crew"]:
+            scaled["crew"].append({
+                **member, "id": suffix(member["id"], k),
+                "launches": [suffix(l, k) for l in member.get("launches") or []],
+            })
+        for payload in catalog["payloads"]:
+            scaled["payloads"].append({
+                **payload, "id": suffix(payload["id"], k), "launch": suffix(payload.get("launch"), k),
+            })
+        for launch in catalog["launches"]:
+            scaled["launches"].append({
+                **launch, "id": suffix(launch["id"], k),
+                "payloads": [suffix(p, k) for p in launch.get("payloads") or []],
+                "crew": [
+                    {**c, "crew": suffix(c.get("crew"), k)} if isinstance(c, dict) else suffix(c, k)
+                    for c in launch.get("crew") or []
+                ],
+                "cores": [{**c, "core": suffix(c.get("core"), k)} for c in launch.get("cores") or []],
+            })
+    return scaled
+
+
+def matches(query, record):
+    """
+    Evaluates the subset of MongoDB filters the sync uses: field equality,
+    $or/$and, and $gt/$gte/$lt/$lte/$in/$ne on top-level fields.
+    """
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(q, record) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(q, record) for q in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = record.get(key)
+            for op, operand in condition.items():
+                if op == "$in":
+                    ok = value in operand
+                elif op == "$ne":
+                    ok = value != operand
+                elif value is None:
+                    ok = False
+                else:
+                    ok = {
+                        "$gt": value > operand, "$gte": value >= operand,
+                        "$lt": value < operand, "$lte": value <= operand,
+                    }[op]
+                if not ok:
+                    return False
+        elif record.get(key) != condition:
+            return False
+    return True
+
+
+class Collection:
+    """
+    One endpoint's records plus their pre-encoded body and validators.
+    """
+    def __init__(self, records):
+        self.set(records)
+
+    def set(self, records):
+        self.records = records
+        self.body = json.dumps(records).encode()
+        self.gzipped = gzip.compress(self.body, compresslevel=5)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()}"'
+        self.last_modified = formatdate(usegmt=True)
+
+
+class StubAPI:
+    """
+    The served catalogue and fault settings. ``latency`` seconds are added to
+    every answer and ``error_rate`` of them are replaced by a random
+    429/500/503 (with Retry-After: 0). Answers queued with script() are sent
+    first, in order. With ``log`` set, every request is kept in ``received``.
+    """
+    def __init__(self, catalog, factor=1, latency=0.0, error_rate=0.0, seed=0, log=False):
+        catalog = scale(catalog, factor)
+        self.collections = {path: Collection(catalog[name]) for path, name in ENDPOINTS.items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.answers = []
+        self.received = [] if log else None
+
+    def script(self, status=200, body=b"[]", headers=None, delay=0):
+        """
+        Queues an answer for the next request, whatever its path: ``status``
+        and ``body`` sent after ``delay`` seconds.
+        """
+        self.answers.append((status, headers or {}, body, delay))
+
+    def record(self, method, path, headers, body=None):
+        """
+        Logs a request if ``log`` is set and returns the scripted answer to
+        send, or None.
+        """
+        with self.lock:
+            if self.received is not None:
+                self.received.append({"method": method, "path": path, "headers": headers, "body": body})
+            return self.answers.pop(0) if self.answers else None
+
+    def touch(self, path, fraction, field="details"):
+        """
+        Changes ``field`` on ``fraction`` of a collection's records (a new
+        ETag follows), to benchmark re-syncs after upstream edits.
+        """
+        collection = self.collections[path]
+        records = [dict(r) for r in collection.records]
+        for r in self.random.sample(records, int(len(records) * fraction)):
+            r[field] = f"{r.get(field) or ''} (edited {time.time_ns()})"
+        collection.set(records)
+
+    def fault(self):
+        """
+        Waits out the configured latency and returns an error status to send
+        instead of the answer, or None.
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.requests += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return self.random.choice(ERROR_STATUSES)
+        return None
+
+    def query(self, path, request):
+        """
+        Answers a /query POST in the paginated shape the real API uses.
+        """
+        options = request.get("options") or {}
+        docs = [r for r in self.collections[path].records if matches(request.get("query") or {}, r)]
+        limit = int(options.get("limit") or 10)
+        page = int(options.get("page") or 1)
+        if options.get("pagination") is False:
+            limit, page = max(len(docs), 1), 1
+        total_pages = max(1, -(-len(docs) // limit))
+        selected = docs[(page - 1) * limit:page * limit]
+        select = options.get("select")
+        if isinstance(select, str):
+            select = select.split()
+        if select:
+            selected = [{field: doc[field] for field in select if field in doc} for doc in selected]
+        return {
+            "docs": selected, "totalDocs": len(docs), "limit": limit, "totalPages": total_pages,
+            "page": page, "pagingCounter": (page - 1) * limit + 1,
+            "hasPrevPage": page > 1, "hasNextPage": page < total_pages,
+            "prevPage": page - 1 if page > 1 else None, "nextPage": page + 1 if page < total_pages else None,
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def api(self):
+        return self.server.api
+
+    def send(self, status, body=b"", headers=None, gzipped=None):
+        if gzipped is not None and "gzip" in self.headers.get("Accept-Encoding", ""):
+            body, headers = gzipped, {**(headers or {}), "Content-Encoding": "gzip"}
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def scripted(self, answer):
+        status, headers, body, delay = answer
+        time.sleep(delay)
+        self.send(status, body, headers, gzip.compress(body))
+
+    def do_GET(self):
+        if (answer := self.api.record("GET", self.path, dict(self.headers))) is not None:
+            return self.scripted(answer)
+        collection = self.api.collections.get(self.path.split("?")[0].rstrip("/"))
+        if collection is None:
+            return self.send(404)
+        if (status := self.api.fault()) is not None:
+            return self.send(status, headers={"Retry-After": "0"})
+        validators = {"ETag": collection.etag, "Last-Modified": collection.last_modified}
+        if self.headers.get("If-None-Match") == collection.etag:
+            return self.send(304, headers=validators)
+        self.send(200, collection.body, {**validators, "Content-Type": "application/json"}, collection.gzipped)
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if (answer := self.api.record("POST", self.path, dict(self.headers), request)) is not None:
+            return self.scripted(answer)
+        if not path.endswith("/query") or path[:-len("/query")] not in self.api.collections:
+            return self.send(404)
+        if (status := self.api.fault()) is not None:
+            return self.send(status, headers={"Retry-After": "0"})
+        body = json.dumps(self.api.query(path[:-len("/query")], request)).encode()
+        self.send(200, body, {"Content-Type": "application/json"}, gzip.compress(body, compresslevel=5))
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(api, host="127.0.0.1", port=0):
+    """
+    Starts serving ``api`` on a background thread. Returns the server (call
+    shutdown() and server_close() when done) and its base URL.
+    """
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.api = api
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
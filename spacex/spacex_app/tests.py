@@ -1,13 +1,40 @@
-from django.test import TestCase, Client, override_settings
-from django.urls import reverse
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DatabaseError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils.http import urlencode
 from django.utils import timezone
+from datetime import timedelta
+from django.core.management import CommandError, call_command
+from io import StringIO
+from pathlib import Path
+import asyncio
+import os
+import re
+import pstats
+import tempfile
+import gzip
+import json
+import requests
+import time
 from unittest.mock import patch
 
+from . import api, metrics as request_metrics, snapshot, testing, urls, views
+from .caching import bump_data_version, data_version
+from .cards import build_cards
+from .helper_functions import api_query, api_request, iter_json_array, record_hash
 from .models import (
     CrewMember, Dragon, Payload, PatchLinks, RedditLinks, FlickrLinks,
-    LaunchLinks, LaunchCore, Launch
+    LaunchLinks, LaunchCore, Launch, LaunchCard, SyncState
 )
-from .populate import populate_crew, populate_payload, populate_launch
+from .populate import CREW_PATH, LAUNCH_PATH, LAUNCH_SELECT, PAYLOAD_PATH, api_url, apply_crew, apply_launch, apply_payload, populate_crew, populate_payload, populate_launch, sync_state_for
+from .search_index import matching, reindex, search
+from .sync import sync_all
+from .transactions import write_transaction
 
 # region Model Tests
 
@@ -154,7 +181,12 @@ class LaunchModelTest(TestCase):
 
 # region View Tests
 
-@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing')
+# Listing pages are cached per data version; tests that change rows through the
+# ORM (which does not bump versions) and re-request a page render uncached.
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
 class ViewTests(TestCase):
     def setUp(self):
         self.client = Client()
@@ -162,6 +194,7 @@ class ViewTests(TestCase):
         CrewMember.objects.create(name="Test Crew")
         Payload.objects.create(name="Test Payload")
         Launch.objects.create(name="Test Launch", date_utc=timezone.now())
+        build_cards()
 
     def test_home_view(self):
         response = self.client.get(reverse('home'))
@@ -189,10 +222,629 @@ class ViewTests(TestCase):
         self.assertIn('crew', response.context)
         self.assertEqual(len(response.context['crew']), 1)
 
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class LaunchListingQueryTests(TestCase):
+    def create_launch(self, n):
+        links = LaunchLinks.objects.create(
+            patch=PatchLinks.objects.create(small=f"http://example.com/{n}.png"),
+            reddit=RedditLinks.objects.create(launch=f"http://reddit.com/{n}"),
+            flickr=FlickrLinks.objects.create(original=[f"http://example.com/{n}.jpg"]),
+            presskit="http://example.com/presskit",
+        )
+        launch = Launch.objects.create(
+            launch_id=f"launch_{n}", name=f"Launch {n}", date_utc=timezone.now(), links=links
+        )
+        launch.crew.add(CrewMember.objects.create(name=f"Crew {n}", member_id=f"crew_{n}"))
+        launch.payloads.add(Payload.objects.create(name=f"Payload {n}", payload_id=f"payload_{n}"))
+        launch.cores.add(LaunchCore.objects.create(core=f"core_{n}", flight=1))
+        build_cards([launch.pk])
+        return launch
+
+    def count_launch_page_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('launch'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_launch_view_query_count_is_constant(self):
+        self.create_launch(0)
+        single = self.count_launch_page_queries()
+        for n in range(1, 10):
+            self.create_launch(n)
+        self.assertEqual(self.count_launch_page_queries(), single)
+
+    def test_launch_view_renders_related_objects(self):
+        launch = self.create_launch(0)
+        response = self.client.get(reverse('launch'))
+        self.assertContains(response, "Payload 0")
+        self.assertContains(response, "Crew 0")
+        self.assertContains(response, "http://example.com/0.png")
+        self.assertContains(response, f'data-src="{reverse("launch_section", args=[launch.pk, "cores"])}"')
+        self.assertNotContains(response, "core_0")
+        self.assertNotContains(response, "Fairings")
+
+    def test_sections_are_served_on_their_own(self):
+        launch = self.create_launch(0)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('launch_section', args=[launch.pk, "cores"]))
+        self.assertContains(response, "core_0")
+        self.assertNotContains(response, "<html")
+        self.assertContains(self.client.get(reverse('launch_section', args=[launch.pk, "links"])), "http://example.com/presskit")
+        for section in ["fairings", "details"]:
+            self.assertEqual(self.client.get(reverse('launch_section', args=[launch.pk, section])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('launch_section', args=[launch.pk + 1, "cores"])).status_code, 404)
+
+    def test_payload_sections_are_served_on_their_own(self):
+        with_dragon = Payload.objects.create(
+            name="CRS-1", payload_id="p1", inclination_deg=51.6,
+            dragon=Dragon.objects.create(capsule="C101"),
+        )
+        without = Payload.objects.create(name="Sat", payload_id="p2")
+        with self.assertNumQueries(1):
+            listing = self.client.get(reverse('payload'))
+        self.assertContains(listing, reverse("payload_section", args=[with_dragon.pk, "dragon"]))
+        self.assertNotContains(listing, reverse("payload_section", args=[without.pk, "dragon"]))
+        self.assertNotContains(listing, "C101")
+        self.assertContains(self.client.get(reverse('payload_section', args=[with_dragon.pk, "dragon"])), "C101")
+        self.assertContains(self.client.get(reverse('payload_section', args=[with_dragon.pk, "orbit"])), "51.6")
+        self.assertEqual(self.client.get(reverse('payload_section', args=[without.pk, "dragon"])).status_code, 404)
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class PaginationTests(TestCase):
+    def walk(self, url, key, direction="next_url"):
+        names = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = response.context['page']
+            names.extend(str(obj) for obj in response.context[key])
+            next_url = getattr(page, direction)
+            url = f"{reverse(response.resolver_match.url_name)}{next_url}" if next_url else None
+        return names
+
+    def test_launch_pages_cover_every_launch_in_date_order(self):
+        now = timezone.now()
+        for n in range(5):
+            Launch.objects.create(launch_id=f"launch_{n}", name=f"L{n}", date_utc=now - timedelta(days=n))
+        Launch.objects.create(launch_id="undated", name="Undated")
+        build_cards()
+        names = self.walk(reverse('launch') + "?page_size=2", 'launches')
+        self.assertEqual(names, ["L0", "L1", "L2", "L3", "L4", "Undated"])
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        for name in ["b", "a", "d", "c", "e"]:
+            CrewMember.objects.create(name=name, member_id=name)
+        response = self.client.get(reverse('crew') + "?page_size=2")
+        last_url = reverse('crew') + response.context['page'].next_url
+        last_url = reverse('crew') + self.client.get(last_url).context['page'].next_url
+        self.assertEqual([str(c) for c in self.client.get(last_url).context['crew']], ["e"])
+        names = self.walk(last_url, 'crew', direction="previous_url")
+        self.assertEqual(names, ["e", "c", "d", "a", "b"])
+
+    def test_duplicate_sort_keys_are_not_skipped(self):
+        for n in range(5):
+            Payload.objects.create(name="Starlink", payload_id=f"payload_{n}")
+        names = self.walk(reverse('payload') + "?page_size=2", 'payloads')
+        self.assertEqual(len(names), 5)
+
+    def test_page_size_is_clamped_and_bad_cursor_falls_back_to_first_page(self):
+        CrewMember.objects.create(name="Solo", member_id="solo")
+        response = self.client.get(reverse('crew') + "?page_size=0&after=not-a-cursor")
+        self.assertEqual(response.context['page'].page_size, 1)
+        self.assertEqual(len(response.context['crew']), 1)
+        self.assertFalse(response.context['page'].has_previous)
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class StreamedListingTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for n in range(45):
+            Launch.objects.create(launch_id=f"launch_{n}", name=f"L{n}", date_utc=now - timedelta(days=n))
+        build_cards()
+
+    def get(self, url, stream=True):
+        with override_settings(STREAM_LISTINGS=stream):
+            return self.client.get(url)
+
+    def test_streamed_page_matches_the_rendered_page(self):
+        second_page = "/launch" + self.get("/launch?page_size=7", stream=False).context["page"].next_url
+        for url in ["/launch", second_page, "/crew", "/payload?q=nothing"]:
+            streamed = self.get(url)
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(b"".join(streamed.streaming_content), self.get(url, stream=False).content, url)
+
+    def test_header_is_sent_before_any_card_is_queried(self):
+        response = self.get("/launch")
+        chunks = iter(response.streaming_content)
+        with CaptureQueriesContext(connection) as ctx:
+            head = next(chunks)
+        self.assertIn(b"<nav>", head)
+        self.assertNotIn(b'class="card"', head)
+        self.assertFalse([q for q in ctx.captured_queries if "launchcard" in q["sql"]])
+        with CaptureQueriesContext(connection) as ctx:
+            first_cards = next(chunks)
+        self.assertEqual(first_cards.count(b'class="card"'), 20)
+        # Rows are fetched a chunk at a time, not the whole page up front
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(sum(chunk.count(b'class="card"') for chunk in chunks), 25)
+
+    def test_next_and_previous_links_walk_the_listing(self):
+        names, url = [], "/launch?page_size=20"
+        while url:
+            html = b"".join(self.get(url).streaming_content).decode()
+            names += re.findall(r'<h2 class="card-title">(L\d+)</h2>', html)
+            match = re.search(r'href="(\?[^"]+)" rel="next"', html)
+            url = "/launch" + match.group(1).replace("&amp;", "&") if match else None
+        self.assertEqual(names, [f"L{n}" for n in range(45)])
+        previous = re.search(r'href="(\?[^"]+)" rel="prev"', html).group(1).replace("&amp;", "&")
+        html = b"".join(self.get("/launch" + previous).streaming_content).decode()
+        self.assertEqual(re.findall(r'<h2 class="card-title">(L\d+)</h2>', html), [f"L{n}" for n in range(20, 40)])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_streamed_body_is_cached_once_complete(self):
+        cache.clear()
+        body = b"".join(self.get("/launch").streaming_content)
+        cached = self.get("/launch")
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached.content, body)
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing')
+class SearchTests(TestCase):
+    def setUp(self):
+        self.starlink = Payload.objects.create(name="Starlink-1", payload_id="p1", orbit="VLEO", customers=["NASA (CRS)"])
+        self.crs = Payload.objects.create(name="CRS-20", payload_id="p2", orbit="ISS", customers=["SpaceX"])
+        self.member = CrewMember.objects.create(name="Robert Behnken", agency="NASA", member_id="c1")
+        launch = Launch.objects.create(launch_id="l1", name="Demo-2", details="First crewed flight", date_utc=timezone.now())
+        launch.crew.add(self.member)
+        for kind in ("launch", "payload", "crew"):
+            reindex(kind)
+
+    def test_title_matches_rank_above_body_matches(self):
+        results = search("crs")
+        self.assertEqual([r["id"] for r in results], [self.crs.pk, self.starlink.pk])
+
+    def test_last_word_is_matched_as_prefix(self):
+        results = search("starl", kind="payload")
+        self.assertEqual([r["id"] for r in results], [self.starlink.pk])
+
+    def test_launch_documents_include_crew_names(self):
+        results = search("behnken", kind="launch")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["title"], "Demo-2")
+
+    def test_fts_syntax_in_user_input_is_treated_as_text(self):
+        self.assertEqual(search('" OR NEAR( *'), [])
+        self.assertEqual(search("crs AND"), [])
+
+    def test_snippets_are_escaped_and_highlighted(self):
+        Payload.objects.filter(pk=self.crs.pk).update(type="<b>Cargo</b>")
+        reindex("payload", [self.crs.pk])
+        snippet = search("cargo")[0]["snippet"]
+        self.assertIn("&lt;b&gt;<mark>Cargo</mark>&lt;/b&gt;", snippet)
+
+    def test_search_view_returns_paginated_json(self):
+        response = self.client.get(reverse('search'), {"q": "crs", "page_size": 1})
+        data = response.json()
+        self.assertEqual(len(data["results"]), 1)
+        self.assertTrue(data["has_next"])
+        self.assertEqual(data["results"][0]["url"], f"/payload?q=crs#payload-{self.crs.pk}")
+        data = self.client.get(reverse('search'), {"q": "crs", "page_size": 1, "page": 2}).json()
+        self.assertEqual(data["results"][0]["id"], self.starlink.pk)
+        self.assertFalse(data["has_next"])
+
+    def test_listing_query_filters_cards(self):
+        response = self.client.get(reverse('payload'), {"q": "starlink"})
+        self.assertEqual([p.name for p in response.context['payloads']], ["Starlink-1"])
+        self.assertEqual(response.context['query'], "starlink")
+
+    def test_listing_query_is_a_subquery(self):
+        queryset = Payload.objects.filter(pk__in=matching("crs", "payload"))
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(p.name for p in queryset), ["CRS-20", "Starlink-1"])
+        self.assertFalse(Payload.objects.filter(pk__in=matching("!!", "payload")).exists())
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing')
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.state = sync_state_for(api_url(CREW_PATH))
+        self.member = {"id": "crew_1", "name": "Robert Behnken", "agency": "NASA", "launches": []}
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_crew([self.member], self.state)
+
+    def test_repeat_request_is_served_from_cache(self):
+        self.client.get(reverse('crew'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('crew'))
+        self.assertContains(response, "Robert Behnken")
+
+    def test_changed_sync_invalidates_dependent_pages(self):
+        self.client.get(reverse('crew'))
+        self.client.get(reverse('payload'))
+        payload_version = data_version("payload")
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_crew([{**self.member, "name": "Bob Behnken"}], self.state)
+        self.assertContains(self.client.get(reverse('crew')), "Bob Behnken")
+        self.assertEqual(data_version("payload"), payload_version)
+
+    def test_unchanged_sync_keeps_cached_pages(self):
+        version = data_version("crew")
+        with self.captureOnCommitCallbacks(execute=True):
+            result = apply_crew([self.member], self.state)
+        self.assertEqual(result.unchanged, 1)
+        self.assertEqual(data_version("crew"), version)
+
+    def test_queries_and_pages_are_cached_separately(self):
+        self.assertContains(self.client.get(reverse('crew')), "Robert Behnken")
+        self.assertNotContains(self.client.get(reverse('crew') + "?q=nobody"), "Robert Behnken")
+
+    def test_current_validators_get_304_without_queries(self):
+        response = self.client.get(reverse('crew'))
+        self.assertIn("no-cache", response["Cache-Control"])
+        # Whole-second dates cannot tell apart two syncs within one second
+        self.assertNotIn("Last-Modified", response)
+        self.assertEqual(
+            self.client.get(reverse('crew'), HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT").status_code, 200
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('crew'), HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+        self.assertEqual(self.client.get(reverse('crew') + "?q=nobody", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_crew([{**self.member, "name": "Bob Behnken"}], self.state)
+        changed = self.client.get(reverse('crew'), HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(changed, "Bob Behnken")
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+
+    def test_cached_bodies_are_served_gzipped(self):
+        first = self.client.get(reverse('crew'), HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(first["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", first["Vary"])
+        with self.assertNumQueries(0):
+            hit = self.client.get(reverse('crew'), HTTP_ACCEPT_ENCODING="gzip")
+            plain = self.client.get(reverse('crew'))
+        self.assertEqual(hit.content, first.content)
+        self.assertFalse(plain.has_header("Content-Encoding"))
+        self.assertEqual(gzip.decompress(hit.content), plain.content)
+        self.assertContains(plain, "Robert Behnken")
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        Launch.objects.create(launch_id="launch_1", name="Test Launch", date_utc=timezone.now())
+
+    def test_listing_request_is_recorded(self):
+        before = {m.name: m.snapshot("launch") for m in request_metrics.REGISTRY}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('launch'))
+        after = {m.name: m.snapshot("launch") for m in request_metrics.REGISTRY}
+
+        self.assertTrue(all(after[name][0] == before[name][0] + 1 for name in after))
+        queries = after["spacex_request_db_queries"][1] - before["spacex_request_db_queries"][1]
+        self.assertEqual(queries, len(ctx.captured_queries))
+        self.assertGreater(after["spacex_request_template_duration_seconds"][1], before["spacex_request_template_duration_seconds"][1])
+        self.assertEqual(after["spacex_response_size_bytes"][1] - before["spacex_response_size_bytes"][1], len(response.content))
+
+    @override_settings(STREAM_LISTINGS=True)
+    def test_streamed_request_is_recorded_when_the_body_is_done(self):
+        before = {m.name: m.snapshot("launch") for m in request_metrics.REGISTRY}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('launch'))
+            self.assertEqual(request_metrics.db_queries.snapshot("launch"), before["spacex_request_db_queries"])
+            body = b"".join(response.streaming_content)
+        after = {m.name: m.snapshot("launch") for m in request_metrics.REGISTRY}
+
+        queries = after["spacex_request_db_queries"][1] - before["spacex_request_db_queries"][1]
+        self.assertEqual(queries, len(ctx.captured_queries))
+        self.assertGreater(after["spacex_request_db_duration_seconds"][1], before["spacex_request_db_duration_seconds"][1])
+        self.assertEqual(after["spacex_response_size_bytes"][1] - before["spacex_response_size_bytes"][1], len(body))
+
+    def test_metrics_endpoint_serves_prometheus_text_to_local_clients(self):
+        self.client.get(reverse('crew'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        self.assertIn("# TYPE spacex_request_duration_seconds histogram", body)
+        self.assertIn('spacex_request_duration_seconds_bucket{view="crew",le="+Inf"}', body)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR="10.0.0.8").status_code, 403)
+
+    @override_settings(SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs("spacex_app.middleware", "WARNING") as logs:
+            self.client.get(reverse('payload'))
+        self.assertIn("Slow request GET /payload (payload)", logs.output[0])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = request_metrics.Histogram("test_histogram", "Test.", (1, 5))
+        request_metrics.REGISTRY.remove(histogram)
+        for value in (0.5, 1, 3, 9):
+            histogram.observe(value, "x")
+        self.assertEqual(histogram.exposition()[2:6], [
+            'test_histogram_bucket{view="x",le="1"} 2',
+            'test_histogram_bucket{view="x",le="5"} 3',
+            'test_histogram_bucket{view="x",le="+Inf"} 4',
+            'test_histogram_sum{view="x"} 13.5',
+        ])
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(PROFILE_DIR=self.profile_dir))
+        Launch.objects.create(launch_id="launch_1", name="Test Launch", date_utc=timezone.now())
+        build_cards()
+
+    def test_profiling_is_off_for_anonymous_users_by_default(self):
+        response = self.client.get(reverse('launch') + "?profile=1")
+        self.assertNotIn("X-Profile", response)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_staff_can_profile_a_page_and_download_the_artifacts(self):
+        self.client.force_login(User.objects.create(username="staff", is_staff=True))
+        response = self.client.get(reverse('launch') + "?profile=1")
+        self.assertContains(response, "Test Launch")
+
+        listing = self.client.get(response["X-Profile"]).json()
+        self.assertEqual(len(listing["artifacts"]), 5)
+        directory = Path(self.profile_dir) / listing["profile"]
+        stats = pstats.Stats(str(directory / "profile.pstats"))
+        self.assertTrue(any(func[2] == "launch" for func in stats.stats))
+        self.assertTrue(json.loads((directory / "sql.json").read_text()))
+        templates = [t["template"] for t in json.loads((directory / "templates.json").read_text())]
+        self.assertIn("launch.html", templates)
+
+        download = self.client.get(reverse('profile_artifact', args=[listing["profile"], "summary.json"]))
+        self.assertEqual(json.loads(b"".join(download.streaming_content))["label"], "GET /launch")
+        self.assertEqual(self.client.get(reverse('profile_artifact', args=[listing["profile"], "db.sqlite3"])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('profile_artifacts', args=[".."])).status_code, 404)
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_settings_flag_opens_profiling_to_everyone(self):
+        response = self.client.get(reverse('crew') + "?profile=1")
+        self.assertIn("X-Profile", response)
+
+class APITests(TestCase):
+    def setUp(self):
+        self.launches = testing.launches(20, 10, 4)
+        apply_crew(testing.crew(4), sync_state_for(api_url(CREW_PATH)))
+        apply_payload(testing.payloads(10), sync_state_for(api_url(PAYLOAD_PATH)))
+        apply_launch(self.launches, sync_state_for(api_url(LAUNCH_PATH)))
+
+    def get_lines(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_pages_follow_next_links_newest_first(self):
+        url, ids, pages = "/api/v1/launches?fields=launch_id&page_size=7", [], 0
+        while url:
+            lines = self.get_lines(url)
+            url = lines.pop()["_next"] if "_next" in lines[-1] else None
+            ids += [line["launch_id"] for line in lines]
+            pages += 1
+        self.assertEqual(pages, 3)
+        by_date = sorted(self.launches, key=lambda r: r["date_unix"], reverse=True)
+        self.assertEqual(ids, [r["id"] for r in by_date])
+
+    @patch.object(api, "CHUNK_SIZE", 8)
+    def test_page_cut_inside_the_last_chunk_links_the_rest(self):
+        # page_size 18 takes 8 + 8 + 2 of the last chunk's 4 rows
+        first = self.get_lines("/api/v1/launches?fields=launch_id&page_size=18")
+        self.assertEqual(len(first), 19)
+        rest = self.get_lines(first.pop()["_next"])
+        self.assertEqual(len(rest), 2)
+        by_date = sorted(self.launches, key=lambda r: r["date_unix"], reverse=True)
+        self.assertEqual([line["launch_id"] for line in first + rest], [r["id"] for r in by_date])
+
+    def test_fields_include_relations(self):
+        record = self.launches[3]
+        [line] = self.get_lines(f"/api/v1/launches?launch_id={record['id']}&fields=name,crew,payloads,links,cores")
+        self.assertEqual(list(line), ["name", "crew", "payloads", "links", "cores"])
+        self.assertEqual(line["crew"], [c["crew"] for c in record["crew"]])
+        self.assertEqual(line["payloads"], record["payloads"])
+        self.assertEqual(line["links"]["patch"]["small"], record["links"]["patch"]["small"])
+        self.assertEqual([c["core"] for c in line["cores"]], [c["core"] for c in record["cores"]])
+
+        [with_dragon] = self.get_lines("/api/v1/payloads?name=Payload%200&fields=payload_id,dragon")
+        self.assertEqual(with_dragon["dragon"]["capsule"], "capsule0000")
+        [without] = self.get_lines("/api/v1/payloads?name=Payload%201&fields=dragon")
+        self.assertIsNone(without["dragon"])
+
+    def test_filters_on_indexed_columns_and_search(self):
+        since = urlencode({"since": self.launches[15]["date_utc"]})
+        self.assertEqual(len(self.get_lines(f"/api/v1/launches?{since}&fields=name")), 5)
+        ids = ",".join(r["id"] for r in self.launches[:3])
+        self.assertEqual(len(self.get_lines(f"/api/v1/launches?launch_id={ids}&fields=name")), 3)
+        self.assertEqual(len(self.get_lines("/api/v1/crew?q=crew")), 4)
+
+    def test_queries_per_chunk_not_per_row(self):
+        with CaptureQueriesContext(connection) as ctx:
+            lines = self.get_lines("/api/v1/launches")
+        self.assertEqual(len(lines), 20)
+        # The rows, then links, cores, crew and payloads
+        self.assertEqual(len(ctx.captured_queries), 5)
+
+    def test_unchanged_collections_answer_304(self):
+        etags = {name: self.client.get(f"/api/v1/{name}")["ETag"] for name in ["launches", "payloads", "crew"]}
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/v1/launches", HTTP_IF_NONE_MATCH=etags["launches"])
+        self.assertEqual(response.status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_data_version("crew")
+        for name, status in [("launches", 200), ("payloads", 304), ("crew", 200)]:
+            self.assertEqual(self.client.get(f"/api/v1/{name}", HTTP_IF_NONE_MATCH=etags[name]).status_code, status, name)
+
+    def test_bad_parameters_are_rejected(self):
+        for url in ["/api/v1/crew?fields=name,salary", "/api/v1/launches?since=yesterday", "/api/v1/payloads?after=x"]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn("error", response.json())
+
+ASYNC_ROUTES = {
+    views.launch: views.alaunch, views.payload: views.apayload, views.crew: views.acrew, api.collection: api.acollection,
+    views.launch_section: views.alaunch_section, views.payload_section: views.apayload_section,
+}
+
+class AsyncURLConf:
+    '''
+    The site's URLs with the async listing and API views routed, as under
+    ASGI with ASYNC_VIEWS set.
+    '''
+    urlpatterns = [
+        URLPattern(p.pattern, ASYNC_ROUTES.get(p.callback, p.callback), p.default_args, p.name) for p in urls.urlpatterns
+    ]
+
+@override_settings(SECRET_KEY='a-dummy-secret-key-for-testing', CACHES=NO_CACHE)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for n in range(30):
+            Launch.objects.create(launch_id=f"launch_{n}", name=f"L{n}", date_utc=now - timedelta(days=n))
+        for n in range(3):
+            CrewMember.objects.create(member_id=f"crew_{n}", name=f"Crew {n}")
+            Payload.objects.create(payload_id=f"payload_{n}", name=f"Payload {n}")
+        build_cards()
+        reindex("launch")
+
+    def aget(self, url, headers=None, **settings):
+        async def get():
+            response = await self.async_client.get(url, headers=headers)
+            if response.streaming:
+                response.body = b"".join([chunk async for chunk in response.streaming_content])
+            return response
+
+        with override_settings(ROOT_URLCONF=AsyncURLConf, **settings):
+            return async_to_sync(get)()
+
+    def test_pages_match_the_sync_views(self):
+        next_page = "/launch" + self.client.get("/launch?page_size=7").context["page"].next_url
+        previous_page = "/launch" + self.client.get(next_page).context["page"].previous_url
+        for url in ["/launch", next_page, previous_page, "/launch?q=L1", "/crew", "/payload"]:
+            expected = self.client.get(url).content
+            self.assertEqual(self.aget(url).content, expected, url)
+            streamed = self.aget(url, STREAM_LISTINGS=True)
+            self.assertTrue(streamed.is_async)
+            self.assertEqual(streamed.body, expected, url)
+
+    def test_sections_match_the_sync_views(self):
+        launch = Launch.objects.first()
+        launch.links = LaunchLinks.objects.create(presskit="http://example.com/presskit")
+        launch.save()
+        launch.cores.add(LaunchCore.objects.create(core="core_0", flight=1))
+        build_cards([launch.pk])
+        payload = Payload.objects.create(
+            name="CRS-1", payload_id="p1", inclination_deg=51.6, dragon=Dragon.objects.create(capsule="C101")
+        )
+        for url, status in [
+            (reverse("launch_section", args=[launch.pk, "cores"]), 200),
+            (reverse("launch_section", args=[launch.pk, "links"]), 200),
+            (reverse("launch_section", args=[launch.pk, "fairings"]), 404),
+            (reverse("payload_section", args=[payload.pk, "dragon"]), 200),
+            (reverse("payload_section", args=[payload.pk, "orbit"]), 200),
+            (reverse("payload_section", args=[payload.pk - 1, "dragon"]), 404),
+        ]:
+            response = self.aget(url)
+            self.assertEqual(response.status_code, status, url)
+            if status == 200:
+                self.assertEqual(response.content, self.client.get(url).content, url)
+        self.assertContains(self.aget(reverse("payload_section", args=[payload.pk, "dragon"])), "C101")
+
+    def test_api_matches_the_sync_view(self):
+        url = "/api/v1/launches?page_size=7&fields=launch_id,name,crew,payloads&q=L1"
+        response = self.aget(url)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        self.assertEqual(response.body, b"".join(self.client.get(url).streaming_content))
+        self.assertEqual(self.aget("/api/v1/crew?fields=salary").status_code, 400)
+
+    @patch.object(api, "CHUNK_SIZE", 8)
+    def test_api_page_cut_inside_the_last_chunk_links_the_rest(self):
+        lines = self.aget("/api/v1/launches?fields=launch_id&page_size=26").body.splitlines()
+        self.assertEqual(len(lines), 27)
+        self.assertIn(b'"_next"', lines[-1])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_validators_and_gzip_on_async_views(self):
+        cache.clear()
+        for url in ["/launch", "/api/v1/crew"]:
+            etag = self.aget(url)["ETag"]
+            self.assertEqual(self.aget(url, headers={"If-None-Match": etag}).status_code, 304, url)
+        hit = self.aget("/launch", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(hit["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(hit.content), self.client.get("/launch").content)
+
+    def test_metrics_count_queries_of_the_async_orm(self):
+        before = request_metrics.db_queries.snapshot("launch")
+        with CaptureQueriesContext(connection) as ctx:
+            self.aget("/launch")
+        after = request_metrics.db_queries.snapshot("launch")
+        self.assertEqual(after[0], before[0] + 1)
+        self.assertEqual(after[1] - before[1], len(ctx.captured_queries))
+        self.assertGreater(len(ctx.captured_queries), 0)
+
+    def test_metrics_count_queries_of_async_streamed_bodies(self):
+        before = request_metrics.db_queries.snapshot("launch")
+        with CaptureQueriesContext(connection) as ctx:
+            self.aget("/launch", STREAM_LISTINGS=True)
+        after = request_metrics.db_queries.snapshot("launch")
+        self.assertEqual(after[1] - before[1], len(ctx.captured_queries))
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_concurrent_profiled_requests_do_not_block_the_loop(self):
+        profile_dir = self.enterContext(tempfile.TemporaryDirectory())
+
+        async def get_both():
+            requests = [self.async_client.get(f"/crew?profile={n}") for n in range(2)]
+            return await asyncio.wait_for(asyncio.gather(*requests), timeout=30)
+
+        with override_settings(ROOT_URLCONF=AsyncURLConf, PROFILE_DIR=profile_dir):
+            responses = async_to_sync(get_both)()
+        self.assertEqual([r.status_code for r in responses], [200, 200])
+        self.assertContains(responses[0], "Crew 1")
+        directories = [Path(profile_dir) / Path(r["X-Profile"]).name for r in responses]
+        self.assertEqual(len(set(directories)), 2)
+        stats = pstats.Stats(str(directories[0] / "profile.pstats"))
+        self.assertTrue(any(func[2] == "acrew" for func in stats.stats))
+
+    def test_health_and_readiness(self):
+        self.assertEqual(self.client.get(reverse('health')).json(), {"status": "ok"})
+        self.assertEqual(self.aget("/ready").json()["status"], "ready")
+        Launch.objects.all().delete()
+        response = self.client.get(reverse('ready'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "empty")
+
+    def test_readiness_does_not_expose_database_errors(self):
+        with patch.object(Launch.objects, "aexists", side_effect=DatabaseError("no such table: secret")), \
+                self.assertLogs("spacex_app.views", "ERROR"):
+            response = self.aget("/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"status": "unavailable"})
+
 # endregion: View Tests
 
 # region Population Script Tests
 
+def launch_record(n, **overrides):
+    record = {
+        "id": f"launch_{n}", "name": f"Mission {n}", "flight_number": n,
+        "date_utc": "2020-03-07T04:50:31.000Z", "date_unix": 1583556631 + n,
+        "date_local": "2020-03-06T23:50:31-05:00", "date_precision": "hour",
+        "upcoming": False, "success": True, "failures": [], "fairings": None,
+        "crew": [{"crew": "crew_1", "role": "Commander"}], "payloads": [f"payload_{n}"],
+        "ships": [], "capsules": [], "rocket": "rocket_1", "launchpad": "pad_1",
+        "cores": [{"core": f"core_{n}", "flight": 1, "landing_attempt": True, "landing_success": True}],
+        "links": {
+            "patch": {"small": f"small_{n}", "large": f"large_{n}"},
+            "reddit": {"campaign": None, "launch": f"reddit_{n}", "media": None, "recovery": None},
+            "flickr": {"small": [], "original": []},
+            "youtube_id": f"yt_{n}",
+        },
+    }
+    record.update(overrides)
+    return record
+
+
 class PopulationTests(TestCase):
     
     @patch('spacex_app.populate.api_request')
@@ -212,6 +864,8 @@ class PopulationTests(TestCase):
         crew_member = CrewMember.objects.first()
         self.assertEqual(crew_member.name, "Robert Behnken")
         self.assertEqual(crew_member.member_id, "crew_member_1")
+        # The search index is refreshed as part of the sync
+        self.assertEqual([r["id"] for r in search("behnken")], [crew_member.pk])
 
     @patch('spacex_app.populate.api_request')
     def test_populate_payload(self, mock_api_request):
@@ -304,4 +958,668 @@ class PopulationTests(TestCase):
         self.assertEqual(launch.links.youtube_id, "youtube_123")
         self.assertEqual(launch.links.patch.small, "small_patch_url")
 
+    @patch('spacex_app.populate.api_request')
+    def test_populate_launch_statement_count_does_not_grow_with_launches(self, mock_api_request):
+        CrewMember.objects.create(member_id="crew_1", name="Test Astronaut")
+        for n in range(21):
+            Payload.objects.create(payload_id=f"payload_{n}", name=f"Payload {n}")
+
+        mock_api_request.return_value = [launch_record(0)]
+        with CaptureQueriesContext(connection) as single:
+            populate_launch()
+        mock_api_request.return_value = [launch_record(n) for n in range(1, 21)]
+        with CaptureQueriesContext(connection) as many:
+            populate_launch()
+
+        self.assertLessEqual(len(many.captured_queries), len(single.captured_queries))
+        self.assertEqual(Launch.objects.count(), 21)
+        self.assertEqual(LaunchCore.objects.count(), 21)
+        # Reused flickr links are shared rather than duplicated
+        self.assertEqual(FlickrLinks.objects.count(), 1)
+        launch = Launch.objects.get(launch_id="launch_7")
+        self.assertEqual([c.name for c in launch.crew.all()], ["Test Astronaut"])
+        self.assertEqual([p.name for p in launch.payloads.all()], ["Payload 7"])
+        self.assertEqual(launch.links.patch.small, "small_7")
+
+    @patch('spacex_app.populate.api_request')
+    def test_populate_launch_resync_updates_rows_and_relations(self, mock_api_request):
+        Payload.objects.create(payload_id="payload_0", name="First")
+        Payload.objects.create(payload_id="payload_extra", name="Second")
+
+        mock_api_request.return_value = [launch_record(0)]
+        populate_launch()
+        mock_api_request.return_value = [
+            launch_record(0, name="Renamed", payloads=["payload_extra"], cores=[{"core": "core_b", "flight": 2}])
+        ]
+        populate_launch()
+
+        launch = Launch.objects.get()
+        # The launch keeps (and updates) its LaunchLinks row instead of leaking a new one
+        self.assertEqual(LaunchLinks.objects.count(), 1)
+        self.assertEqual(launch.links.youtube_id, "yt_0")
+        self.assertEqual(launch.name, "Renamed")
+        self.assertEqual([p.name for p in launch.payloads.all()], ["Second"])
+        self.assertEqual([c.core for c in launch.cores.all()], ["core_b"])
+
+
+class LaunchCardTests(TestCase):
+    def sync(self, launches, crew=({"id": "crew_1", "name": "Doug Hurley"},)):
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_crew(list(crew), sync_state_for(api_url(CREW_PATH)))
+            apply_payload([{"id": "payload_0", "name": "Crew Dragon"}], sync_state_for(api_url(PAYLOAD_PATH)))
+            apply_launch(launches, sync_state_for(api_url(LAUNCH_PATH)))
+
+    def test_sync_builds_cards_with_flattened_relations(self):
+        self.sync([launch_record(0)])
+        card = LaunchCard.objects.get(launch__launch_id="launch_0")
+        self.assertEqual(card.data["crew_names"], "Doug Hurley")
+        self.assertEqual(card.data["payload_names"], "Crew Dragon")
+        self.assertEqual(card.data["patch_small"], "small_0")
+        self.assertEqual(card.data["sections"], ["cores", "links"])
+        self.assertEqual(card.sections["cores"][0]["core"], "core_0")
+        self.assertEqual(card.sections["links"]["reddit"], {"launch": "reddit_0"})
+        self.assertIsNone(card.sections["links"]["presskit"])
+
+    def test_cards_follow_crew_changes_and_skip_unchanged_launches(self):
+        self.sync([launch_record(0), launch_record(1, crew=[])])
+        with CaptureQueriesContext(connection) as ctx:
+            self.sync([launch_record(0), launch_record(1, crew=[])], crew=[{"id": "crew_1", "name": "Bob Behnken"}])
+        card_writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "spacex_app_launchcard"')]
+        self.assertEqual(len(card_writes), 1)
+        self.assertEqual(LaunchCard.objects.get(launch__launch_id="launch_0").data["crew_names"], "Bob Behnken")
+
+    def test_unmodified_sync_builds_missing_cards(self):
+        Launch.objects.create(launch_id="legacy", name="Legacy", date_utc=timezone.now())
+        apply_launch(None, sync_state_for(api_url(LAUNCH_PATH)))
+        self.assertEqual(str(LaunchCard.objects.get()), "Legacy")
+
+    def test_launch_page_reads_only_the_card_table(self):
+        self.sync([launch_record(n) for n in range(3)])
+        with override_settings(CACHES=NO_CACHE), CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('launch'))
+        self.assertContains(response, "Doug Hurley")
+        tables = {t for q in ctx.captured_queries for t in re.findall(r'"(spacex_app_\w+)"', q["sql"])}
+        self.assertEqual(tables, {"spacex_app_launchcard"})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+
+class LaunchCardMigrationTests(TransactionTestCase):
+    def test_upgrade_builds_cards_for_stored_launches(self):
+        apply_crew([{"id": "crew_1", "name": "Doug Hurley"}], sync_state_for(api_url(CREW_PATH)))
+        apply_launch([launch_record(0), launch_record(1, crew=[])], sync_state_for(api_url(LAUNCH_PATH)))
+        built = {card.pk: (card.data, card.sections) for card in LaunchCard.objects.all()}
+
+        executor = MigrationExecutor(connection)
+        executor.migrate([("spacex_app", "0012_launch_card_sections")])
+        LaunchCard.objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes("spacex_app"))
+
+        self.assertEqual({card.pk: (card.data, card.sections) for card in LaunchCard.objects.all()}, built)
+
+
+class DeltaSyncTests(TestCase):
+    @patch('spacex_app.helper_functions.session.request')
+    def test_api_request_sends_validators_and_returns_none_on_304(self, mock_get):
+        state = SyncState(endpoint="https://example.com/v4/crew", etag='"abc"', last_modified="Sat, 01 Jan 2022 00:00:00 GMT")
+        mock_get.return_value.status_code = 304
+
+        self.assertIsNone(api_request(state.endpoint, sync_state=state))
+        headers = mock_get.call_args.kwargs["headers"]
+        self.assertEqual(headers["If-None-Match"], '"abc"')
+        self.assertEqual(headers["If-Modified-Since"], "Sat, 01 Jan 2022 00:00:00 GMT")
+        mock_get.return_value.raise_for_status.assert_not_called()
+
+    @patch('spacex_app.helper_functions.session.request')
+    def test_api_request_records_new_validators(self, mock_get):
+        state = SyncState(endpoint="https://example.com/v4/crew")
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {"ETag": '"v2"', "Last-Modified": "Sun, 02 Jan 2022 00:00:00 GMT"}
+        mock_get.return_value.json.return_value = []
+
+        self.assertEqual(api_request(state.endpoint, sync_state=state), [])
+        self.assertEqual(mock_get.call_args.kwargs["headers"], {})
+        self.assertEqual(state.etag, '"v2"')
+        self.assertEqual(state.last_modified, "Sun, 02 Jan 2022 00:00:00 GMT")
+
+    @patch('spacex_app.populate.api_request')
+    def test_not_modified_response_skips_the_write(self, mock_api_request):
+        mock_api_request.return_value = None
+        populate_launch()
+        self.assertFalse(Launch.objects.exists())
+        self.assertIsNotNone(SyncState.objects.get(endpoint__endswith="/v5/launches").synced_at)
+
+    @patch('spacex_app.populate.api_request')
+    def test_unchanged_records_are_not_rewritten(self, mock_api_request):
+        mock_api_request.return_value = [launch_record(0), launch_record(1)]
+        populate_launch()
+
+        mock_api_request.return_value = [launch_record(0), launch_record(1, name="Changed")]
+        with CaptureQueriesContext(connection) as ctx:
+            populate_launch()
+
+        # executemany is logged as "<n> times: <sql>"
+        launch_updates = [q["sql"] for q in ctx.captured_queries if 'UPDATE "spacex_app_launch"' in q["sql"]]
+        self.assertEqual(len(launch_updates), 1)
+        self.assertTrue(launch_updates[0].startswith("1 times:"))
+        self.assertEqual(Launch.objects.get(launch_id="launch_1").name, "Changed")
+        self.assertEqual(LaunchLinks.objects.count(), 2)
+
+    @patch('spacex_app.populate.api_request')
+    def test_changed_crew_members_are_updated(self, mock_api_request):
+        record = {"id": "crew_1", "name": "Bob", "agency": "NASA"}
+        mock_api_request.return_value = [record]
+        populate_crew()
+        mock_api_request.return_value = [dict(record, name="Robert")]
+        populate_crew()
+        self.assertEqual(CrewMember.objects.get().name, "Robert")
+
+
+class StreamingIngestTests(TestCase):
+    def test_iter_json_array_matches_json_loads_at_any_chunk_size(self):
+        data = [launch_record(0, name="Ünïcode ☄"), 12.5, None, [], {"nested": [1, {"a": "]"}]}, "x,y"]
+        raw = json.dumps(data, ensure_ascii=False, indent=1).encode()
+        for size in (1, 2, 3, 7, 64, len(raw)):
+            chunks = [raw[i:i + size] for i in range(0, len(raw), size)]
+            self.assertEqual(list(iter_json_array(chunks)), data)
+
+    def test_iter_json_array_rejects_bad_input(self):
+        self.assertEqual(list(iter_json_array([b" [ ] "])), [])
+        for raw in (b'{"a": 1}', b'[1, 2', b'[1 2]', b'[{"a": }]'):
+            with self.assertRaises(ValueError):
+                list(iter_json_array([raw]))
+
+    @patch('spacex_app.helper_functions.session.request')
+    def test_streamed_request_yields_records_lazily(self, mock_get):
+        records = [{"id": f"crew_{n}", "name": f"Crew {n}"} for n in range(3)]
+        raw = json.dumps(records).encode()
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.headers = {"ETag": '"v1"'}
+        mock_get.return_value.iter_content.return_value = [raw[:10], raw[10:]]
+        mock_get.return_value.raw.tell.return_value = 42
+        state = SyncState(endpoint="https://example.com/v4/crew")
+        metrics = {}
+
+        result = api_request(state.endpoint, sync_state=state, metrics=metrics, stream=True)
+        self.assertTrue(mock_get.call_args.kwargs["stream"])
+        self.assertEqual(metrics["bytes"], 42)
+        self.assertEqual(metrics["decoded_bytes"], len(raw))
+        self.assertEqual(next(result), records[0])
+        self.assertEqual(list(result), records[1:])
+        self.assertEqual(state.etag, '"v1"')
+
+    def test_launches_are_written_in_batches_from_an_iterator(self):
+        written = []
+
+        def launches():
+            for n in range(5):
+                written.append(Launch.objects.count())
+                yield launch_record(n)
+
+        state = sync_state_for(api_url(LAUNCH_PATH))
+        with patch('spacex_app.populate.LAUNCH_WRITE_BATCH', 2):
+            result = apply_launch(launches(), state)
+        self.assertEqual(result.created, 5)
+        self.assertEqual(Launch.objects.count(), 5)
+        # Earlier batches are in the database before later records are read
+        self.assertEqual(written, [0, 0, 2, 2, 4])
+
+
+@override_settings(SPACEX_API_RETRIES=2, SPACEX_API_BACKOFF=0.01, SPACEX_API_TIMEOUT=(1, 0.5))
+class APIClientTests(TestCase):
+    """api_request against testing.StubAPI answering from a script"""
+
+    def setUp(self):
+        self.api = testing.StubAPI(testing.catalog(0, 0, 0), log=True)
+        server, url = testing.serve(self.api)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.url = url + "/v4/crew"
+        self.answer = self.api.script
+
+    def test_transient_errors_are_retried(self):
+        self.answer(503)
+        self.answer(502)
+        self.answer(body=b'[{"id": "crew_1"}]')
+        metrics = {}
+        with self.assertLogs("spacex_app.helper_functions", "WARNING") as logs:
+            self.assertEqual(api_request(self.url, metrics=metrics), [{"id": "crew_1"}])
+        self.assertEqual(metrics["attempts"], 3)
+        self.assertIn("HTTP 503", logs.output[0])
+        self.assertGreater(metrics["latency"], 0)
+
+    def test_retry_after_is_honoured(self):
+        self.answer(429, headers={"Retry-After": "0.2"})
+        self.answer()
+        start = time.perf_counter()
+        with self.assertLogs("spacex_app.helper_functions", "WARNING"):
+            api_request(self.url)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.2)
+
+    def test_gives_up_after_the_retry_budget(self):
+        for _ in range(3):
+            self.answer(500)
+        with self.assertLogs("spacex_app.helper_functions", "WARNING"), self.assertRaises(requests.HTTPError):
+            api_request(self.url)
+        self.assertEqual(len(self.api.received), 3)
+
+    def test_client_errors_are_not_retried(self):
+        self.answer(404)
+        with self.assertRaises(requests.HTTPError):
+            api_request(self.url)
+        self.assertEqual(len(self.api.received), 1)
+
+    def test_slow_responses_time_out_and_are_retried(self):
+        self.answer(delay=1)
+        self.answer(body=b'[{"id": "crew_1"}]')
+        metrics = {}
+        with self.assertLogs("spacex_app.helper_functions", "WARNING") as logs:
+            records = api_request(self.url, metrics=metrics, stream=True)
+        self.assertIn("Timeout", logs.output[0])
+        self.assertEqual(list(records), [{"id": "crew_1"}])
+        self.assertEqual(metrics["attempts"], 2)
+
+    def test_query_reads_every_page_in_order_with_projection(self):
+        self.api.collections["/v4/crew"].set(
+            [{"id": f"crew_{n}", "name": f"Crew {n}", "status": "active", "extra": n} for n in range(25)]
+        )
+        metrics = {}
+        records = list(api_query(self.url, query={"status": "active"}, select=["id", "name"], metrics=metrics, page_size=10, workers=2))
+        self.assertEqual(records, [{"id": f"crew_{n}", "name": f"Crew {n}"} for n in range(25)])
+        requests = [r["body"] for r in self.api.received]
+        self.assertEqual(sorted(r["options"]["page"] for r in requests), [1, 2, 3])
+        self.assertEqual(requests[0]["query"], {"status": "active"})
+        self.assertEqual(requests[0]["options"]["select"], {"id": 1, "name": 1})
+        self.assertEqual(metrics["pages"], 3)
+
+    def test_projected_and_full_records_hash_alike(self):
+        record = launch_record(0, extra_field="ignored")
+        projected = {k: record[k] for k in LAUNCH_SELECT if k in record}
+        self.assertEqual(record_hash(record, LAUNCH_SELECT), record_hash(projected, LAUNCH_SELECT))
+
+    def test_responses_are_gzipped_on_the_wire(self):
+        body = json.dumps([{"id": f"crew_{n}", "name": "x" * 100} for n in range(50)]).encode()
+        self.answer(body=body)
+        metrics = {}
+        self.assertEqual(len(list(api_request(self.url, metrics=metrics, stream=True))), 50)
+        self.assertIn("gzip", self.api.received[0]["headers"]["Accept-Encoding"])
+        self.assertEqual(metrics["decoded_bytes"], len(body))
+        self.assertLess(metrics["bytes"], len(body) // 5)
+
+
+class SyncAllTests(TestCase):
+    def fake_api(self, delays):
+        responses = {
+            "/v4/crew": [{"id": "crew_1", "name": "Test Astronaut"}],
+            "/v4/payloads": [{"id": "payload_0", "name": "Test Satellite"}],
+            "/v5/launches": [launch_record(0)],
+        }
+
+        def api_request(api_url, sync_state=None, metrics=None, stream=False):
+            path = api_url[api_url.index("/v"):]
+            time.sleep(delays.get(path, 0))
+            return responses[path]
+        return api_request
+
+    def test_launches_are_linked_even_when_their_fetch_finishes_first(self):
+        delays = {"/v4/crew": 0.1, "/v4/payloads": 0.1}
+        with patch('spacex_app.sync.api_request', side_effect=self.fake_api(delays)):
+            sync_all()
+        launch = Launch.objects.get()
+        self.assertEqual([c.name for c in launch.crew.all()], ["Test Astronaut"])
+        self.assertEqual([p.name for p in launch.payloads.all()], ["Test Satellite"])
+
+    def test_fetches_run_concurrently(self):
+        delays = {"/v4/crew": 0.3, "/v4/payloads": 0.3, "/v5/launches": 0.3}
+        with patch('spacex_app.sync.api_request', side_effect=self.fake_api(delays)):
+            start = time.perf_counter()
+            sync_all()
+            elapsed = time.perf_counter() - start
+        self.assertLess(elapsed, 0.8)
+
+    def test_subset_of_resources(self):
+        with patch('spacex_app.sync.api_request', side_effect=self.fake_api({})) as mock_api_request:
+            sync_all(["crew"])
+        self.assertEqual(mock_api_request.call_count, 1)
+        self.assertEqual(CrewMember.objects.count(), 1)
+        self.assertFalse(Launch.objects.exists())
+
+
+@override_settings(SPACEX_API_BACKOFF=0.01)
+class StubAPISyncTests(TestCase):
+    """End-to-end syncs against testing.StubAPI"""
+
+    def serve(self, **kwargs):
+        self.api = testing.StubAPI(testing.catalog(20, 10, 4), **kwargs)
+        server, url = testing.serve(self.api)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.enterContext(override_settings(SPACEX_API_BASE_URL=url))
+
+    def test_full_resync_and_upstream_edits(self):
+        self.serve(factor=2)
+        results = sync_all()
+        self.assertEqual([r.created for r in results.values()], [8, 20, 40])
+        self.assertEqual(Launch.objects.get(launch_id="launch00000000-1").payloads.count(), 2)
+
+        self.assertTrue(all(r.not_modified for r in sync_all().values()))
+        self.api.touch("/v5/launches", 0.25)
+        results = sync_all(["launch"])
+        self.assertEqual((results["launch"].updated, results["launch"].unchanged), (10, 30))
+
+    def test_incremental_sync_uses_the_query_endpoints(self):
+        self.serve()
+        since = testing.launches(20, 10, 4)[15]["date_unix"]
+        results = sync_all(since=since)
+        self.assertEqual(results["launch"].created, 5)
+        self.assertEqual(results["crew"].created, 4)
+
+    @override_settings(SPACEX_API_RETRIES=8)
+    def test_injected_errors_are_retried(self):
+        self.serve(error_rate=0.3, seed=1)
+        with self.assertLogs("spacex_app.helper_functions", "WARNING"):
+            results = sync_all()
+        self.assertEqual(results["launch"].created, 20)
+        self.assertGreater(self.api.errors, 0)
+
+
+@override_settings(SPACEX_API_BACKOFF=0.01)
+class ShadowSyncTests(TransactionTestCase):
+    """sync_all(shadow=True) against testing.StubAPI"""
+
+    def setUp(self):
+        self.api = testing.StubAPI(testing.catalog(20, 10, 4))
+        server, url = testing.serve(self.api)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.enterContext(override_settings(SPACEX_API_BASE_URL=url))
+        self.live = connections["default"]
+        self.shadow_files = set(Path(tempfile.gettempdir()).glob("shadow-*"))
+
+    def live_count(self, table):
+        with self.live.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            return cursor.fetchone()[0]
+
+    def test_readers_see_nothing_until_the_swap(self):
+        seen = []
+        version = data_version("launch")
+
+        def apply_launch_and_look(records, state):
+            self.assertIsNot(connections["default"], self.live)
+            seen.append((CrewMember.objects.count(), self.live_count("spacex_app_crewmember")))
+            seen.append(data_version("launch"))
+            return apply_launch(records, state)
+
+        with patch.dict("spacex_app.sync.RESOURCES", launch=("/v5/launches", apply_launch_and_look, LAUNCH_SELECT)):
+            results = sync_all(shadow=True)
+        self.assertEqual(results["launch"].created, 20)
+        self.assertEqual(seen, [(4, 0), version])
+        self.assertIs(connections["default"], self.live)
+        self.assertEqual(Launch.objects.count(), 20)
+        self.assertEqual(LaunchCard.objects.count(), 20)
+        self.assertNotEqual(data_version("launch"), version)
+        self.assertTrue(all(r.not_modified for r in sync_all(shadow=True).values()))
+
+    def test_failed_sync_leaves_the_live_database_alone(self):
+        version = data_version("crew")
+        def fail(records, state):
+            raise RuntimeError("API changed shape")
+
+        with patch.dict("spacex_app.sync.RESOURCES", launch=("/v5/launches", fail, LAUNCH_SELECT)), \
+                self.assertRaises(RuntimeError):
+            sync_all(shadow=True)
+        self.assertIs(connections["default"], self.live)
+        self.assertFalse(CrewMember.objects.exists())
+        self.assertEqual(data_version("crew"), version)
+        self.assertEqual(set(Path(tempfile.gettempdir()).glob("shadow-*")), self.shadow_files)
+
+
+def fresh_connection(test):
+    """
+    Swaps the default connection for a new, unopened one for the rest of
+    ``test``, as in a new process: closing a connection keeps the attributes
+    the backend set when it first connected.
+    """
+    live = connections["default"]
+    fresh = live.__class__(live.settings_dict, alias="default")
+    connections["default"] = fresh
+    test.addCleanup(fresh.close)
+    test.addCleanup(connections.__setitem__, "default", live)
+    return fresh
+
+
+class WriteTransactionTests(TransactionTestCase):
+    def begins(self, block):
+        with CaptureQueriesContext(connection) as queries:
+            with block():
+                CrewMember.objects.exists()
+        return [q["sql"] for q in queries if q["sql"].startswith("BEGIN")]
+
+    def test_only_writers_take_the_lock_at_begin(self):
+        self.assertEqual(self.begins(write_transaction), ["BEGIN IMMEDIATE"])
+        self.assertEqual(self.begins(transaction.atomic), ["BEGIN"])
+
+    def test_write_transaction_on_a_new_connection(self):
+        fresh = fresh_connection(self)
+        # Unlike CaptureQueriesContext, this does not open the connection
+        fresh.force_debug_cursor = True
+        with write_transaction():
+            CrewMember.objects.exists()
+        self.assertEqual([q["sql"] for q in fresh.queries if q["sql"].startswith("BEGIN")], ["BEGIN IMMEDIATE"])
+
+    def test_dry_run_sync_stays_deferred(self):
+        with CaptureQueriesContext(connection) as queries, patch("spacex_app.sync._fetch", return_value=(None, {})):
+            sync_all(dry_run=True)
+        self.assertEqual([q["sql"] for q in queries if q["sql"].startswith("BEGIN")], ["BEGIN"])
+
+
+class SyncCommandTests(TestCase):
+    def run_sync(self, *args, records=None):
+        records = records or {
+            "/v4/crew": [{"id": "crew_1", "name": "Test Astronaut"}],
+            "/v4/payloads": [],
+            "/v5/launches": [
+                launch_record(0, date_unix=1000),
+                launch_record(1, date_unix=2000),
+                launch_record(2, date_unix=500, upcoming=True),
+            ],
+        }
+        self.queries = {}
+
+        def api_query(url, query=None, **kwargs):
+            self.queries[url[url.index("/v"):]] = query
+            return records[url[url.index("/v"):]]
+
+        out = StringIO()
+        with patch('spacex_app.sync.api_request', side_effect=lambda url, **kwargs: records[url[url.index("/v"):]]), \
+                patch('spacex_app.sync.api_query', side_effect=api_query):
+            call_command("sync_spacex", *args, stdout=out)
+        return out.getvalue()
+
+    def test_full_sync_reports_counts_and_phase_timings(self):
+        output = self.run_sync()
+        self.assertIn("launch: 3 created, 0 updated, 0 unchanged (fetch", output)
+        self.assertIn("write", output)
+        self.assertEqual(Launch.objects.count(), 3)
+
+    def test_full_sync_reports_request_metrics(self):
+        def api_request(url, metrics=None, **kwargs):
+            metrics.update(fetch=0.5, latency=0.25, parse=0.0, bytes=800, decoded_bytes=4000, attempts=2)
+            return [{"id": "crew_1", "name": "Test Astronaut"}]
+
+        out = StringIO()
+        with patch('spacex_app.sync.api_request', side_effect=api_request):
+            call_command("sync_spacex", "crew", stdout=out)
+        self.assertIn("; pages 1, attempts 2, latency 0.250s, 800 bytes (4000 decoded))", out.getvalue())
+
+    def test_dry_run_reports_the_diff_without_writing(self):
+        self.run_sync()
+        records = {
+            "/v4/crew": [{"id": "crew_1", "name": "Renamed"}],
+            "/v4/payloads": [],
+            "/v5/launches": [launch_record(0, date_unix=1000), launch_record(3)],
+        }
+        output = self.run_sync("--dry-run", records=records)
+        self.assertIn("[dry run] crew: 0 created, 1 updated, 0 unchanged", output)
+        self.assertIn("[dry run] launch: 1 created, 0 updated, 1 unchanged", output)
+        self.assertEqual(CrewMember.objects.get().name, "Test Astronaut")
+        self.assertEqual(Launch.objects.count(), 3)
+
+    def test_since_queries_recent_and_upcoming_launches(self):
+        output = self.run_sync("launch", "--since", "1500")
+        self.assertEqual(
+            self.queries, {"/v5/launches": {"$or": [{"upcoming": True}, {"date_unix": {"$gte": 1500}}]}}
+        )
+        self.assertIn("launch: 3 created", output)
+        self.assertNotIn("crew:", output)
+
+    def test_profile_saves_sync_artifacts(self):
+        with tempfile.TemporaryDirectory() as profile_dir, override_settings(PROFILE_DIR=profile_dir):
+            output = self.run_sync("crew", "--profile")
+            (directory,) = Path(profile_dir).iterdir()
+            self.assertIn(f"Profile saved to {directory}", output)
+            summary = json.loads((directory / "summary.json").read_text())
+        self.assertEqual(summary["label"], "sync crew")
+        self.assertGreater(summary["sql_statements"], 0)
+
+    def test_since_accepts_iso_dates_and_rejects_garbage(self):
+        self.run_sync("launch", "--since", "1970-01-01T00:25:00Z")
+        self.assertEqual(self.queries["/v5/launches"]["$or"][1]["date_unix"]["$gte"], 1500)
+        with self.assertRaises(CommandError):
+            self.run_sync("--since", "yesterday-ish")
+        with self.assertRaises(CommandError):
+            self.run_sync("rockets")
+
+    def test_since_last_reaches_back_before_the_previous_sync(self):
+        self.run_sync("launch")
+        synced_at = SyncState.objects.get(endpoint__endswith="/v5/launches").synced_at
+        self.run_sync("launch", "--since", "last")
+        self.assertEqual(
+            self.queries["/v5/launches"]["$or"][1]["date_unix"]["$gte"],
+            int(synced_at.timestamp()) - 30 * 24 * 3600,
+        )
+
+
+class PurgeOrphansCommandTests(TestCase):
+    def setUp(self):
+        patch_links = PatchLinks.objects.create(small="kept")
+        self.launch = Launch.objects.create(
+            launch_id="launch_1", links=LaunchLinks.objects.create(patch=patch_links)
+        )
+        self.launch.cores.add(LaunchCore.objects.create(core="kept"))
+        Payload.objects.create(payload_id="payload_1", dragon=Dragon.objects.create(capsule="kept"))
+
+        LaunchLinks.objects.create(
+            patch=PatchLinks.objects.create(small="orphan"),
+            reddit=RedditLinks.objects.create(),
+            flickr=FlickrLinks.objects.create(),
+        )
+        LaunchCore.objects.create(core="orphan")
+        Dragon.objects.create(capsule="orphan")
+
+    def test_purge_orphans_deletes_only_unreferenced_rows(self):
+        out = StringIO()
+        call_command("purge_orphans", stdout=out)
+
+        self.assertIn("Deleted 1 LaunchLinks rows", out.getvalue())
+        self.assertEqual(LaunchLinks.objects.get(), self.launch.links)
+        self.assertEqual(list(PatchLinks.objects.values_list("small", flat=True)), ["kept"])
+        self.assertFalse(RedditLinks.objects.exists())
+        self.assertFalse(FlickrLinks.objects.exists())
+        self.assertEqual(list(LaunchCore.objects.values_list("core", flat=True)), ["kept"])
+        self.assertEqual(list(Dragon.objects.values_list("capsule", flat=True)), ["kept"])
+
+    def test_dry_run_reports_without_deleting(self):
+        out = StringIO()
+        call_command("purge_orphans", "--dry-run", stdout=out)
+
+        self.assertIn("Would delete 1 PatchLinks rows", out.getvalue())
+        self.assertEqual(LaunchLinks.objects.count(), 2)
+        self.assertEqual(PatchLinks.objects.count(), 2)
+
+class PurgeOrphansNewConnectionTests(TransactionTestCase):
+    def test_purge_orphans_as_the_first_command(self):
+        Dragon.objects.create(capsule="orphan")
+        fresh_connection(self)
+        out = StringIO()
+        call_command("purge_orphans", stdout=out)
+        self.assertIn("Deleted 1 Dragon rows", out.getvalue())
+        self.assertFalse(Dragon.objects.exists())
+
+class SnapshotCommandTests(TestCase):
+    def setUp(self):
+        apply_crew(testing.crew(4), sync_state_for(api_url(CREW_PATH)))
+        apply_payload(testing.payloads(10), sync_state_for(api_url(PAYLOAD_PATH)))
+        apply_launch(testing.launches(20, 10, 4), sync_state_for(api_url(LAUNCH_PATH)))
+        SyncState.objects.update(etag='"v1"')
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "snapshot.jsonl.gz"
+
+    def graph(self):
+        return sorted(
+            (
+                launch.launch_id, launch.date_utc, launch.links.patch.small, launch.links.flickr.original,
+                sorted(m.member_id for m in launch.crew.all()),
+                sorted((p.payload_id, p.dragon.capsule if p.dragon else None) for p in launch.payloads.all()),
+                sorted((c.core, c.flight) for c in launch.cores.all()),
+                launch.card.data,
+            )
+            for launch in Launch.objects.for_listing().select_related("card")
+        )
+
+    def test_round_trip_remaps_keys(self):
+        # Gaps in the old keys, so the imported rows cannot keep them
+        Launch.objects.filter(pk__lte=Launch.objects.order_by("pk")[4].pk).delete()
+        before = self.graph()
+        call_command("export_snapshot", self.path, stdout=StringIO())
+        out = StringIO()
+        call_command("import_snapshot", self.path, "--replace", stdout=out)
+
+        self.assertIn("spacex_app.launch: 15 rows", out.getvalue())
+        self.assertEqual(set(Launch.objects.values_list("pk", flat=True)), set(range(1, 16)))
+        self.assertEqual(self.graph(), before)
+        self.assertEqual(set(SyncState.objects.values_list("etag", flat=True)), {'"v1"'})
+        self.assertEqual(
+            {r["id"] for r in search("mission", kind="launch", limit=50)}, set(range(1, 16))
+        )
+
+    def test_import_refuses_a_populated_database(self):
+        call_command("export_snapshot", self.path, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "already holds catalogue data"):
+            call_command("import_snapshot", self.path, stdout=StringIO())
+        out = StringIO()
+        call_command("import_snapshot", self.path, "--if-empty", stdout=out)
+        self.assertIn("Skipped", out.getvalue())
+        self.assertEqual(Launch.objects.count(), 20)
+
+    def test_import_rejects_other_files(self):
+        with gzip.open(self.path, "wt") as f:
+            f.write("[]\n")
+        with self.assertRaisesMessage(CommandError, "Not a version 2 spacex-snapshot file"):
+            call_command("import_snapshot", self.path, "--replace", stdout=StringIO())
+
+
+class SnapshotCommandNewConnectionTests(TransactionTestCase):
+    """import_snapshot as the first thing a new process does"""
+
+    def setUp(self):
+        catalog = testing.catalog(5, 3, 2)
+        apply_crew(catalog["crew"], sync_state_for(api_url(CREW_PATH)))
+        apply_payload(catalog["payloads"], sync_state_for(api_url(PAYLOAD_PATH)))
+        apply_launch(catalog["launches"], sync_state_for(api_url(LAUNCH_PATH)))
+        self.path = Path(self.enterContext(tempfile.TemporaryDirectory())) / "snapshot.jsonl.gz"
+        call_command("export_snapshot", self.path, stdout=StringIO())
+
+    def test_import_into_an_empty_database(self):
+        for model in reversed(snapshot.MODELS):
+            model._default_manager.all().delete()
+        fresh_connection(self)
+        call_command("import_snapshot", self.path, stdout=StringIO())
+        self.assertEqual(Launch.objects.count(), 5)
+
+    def test_replace_import(self):
+        fresh_connection(self)
+        call_command("import_snapshot", self.path, "--replace", stdout=StringIO())
+        self.assertEqual(Launch.objects.count(), 5)
+
 # endregion: Population Script Tests
\ No newline at end of file
@@ -0,0 +1,30 @@
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_transaction(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic() for code that writes. On SQLite the outermost block
+    begins with BEGIN IMMEDIATE, taking the write lock up front: a deferred
+    transaction that reads first and then writes cannot wait for the lock
+    (busy_timeout does not apply to the upgrade) and fails with "database is
+    locked" when another writer committed in between. Read-only transactions
+    keep the default DEFERRED mode and never hold the write lock.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    # The backend sets transaction_mode when it connects, so connect first:
+    # before, there is no mode to save, and a connection made inside atomic()
+    # would reset the override
+    connection.ensure_connection()
+    mode, connection.transaction_mode = connection.transaction_mode, "IMMEDIATE"
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.transaction_mode = mode
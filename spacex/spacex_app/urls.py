@@ -1,10 +1,29 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import api, views
+
+if settings.ASYNC_VIEWS:
+    launch, crew, payload, collection = views.alaunch, views.acrew, views.apayload, api.acollection
+    launch_section, payload_section = views.alaunch_section, views.apayload_section
+else:
+    launch, crew, payload, collection = views.launch, views.crew, views.payload, api.collection
+    launch_section, payload_section = views.launch_section, views.payload_section
 
 urlpatterns = [
     path("", views.home, name="home"),
-    path("launch", views.launch, name="launch"),
-    path("crew", views.crew, name="crew"),
-    path("payload", views.payload, name="payload"),
-]
\ No newline at end of file
+    path("launch", launch, name="launch"),
+    path("crew", crew, name="crew"),
+    path("payload", payload, name="payload"),
+    path("launch/<int:pk>/<slug:section>", launch_section, name="launch_section"),
+    path("payload/<int:pk>/<slug:section>", payload_section, name="payload_section"),
+    path("search", views.search, name="search"),
+    path("metrics", views.metrics, name="metrics"),
+    path("health", views.health, name="health"),
+    path("ready", views.ready, name="ready"),
+    path("profiles/<str:name>/", views.profile_artifacts, name="profile_artifacts"),
+    path("profiles/<str:name>/<str:filename>", views.profile_artifacts, name="profile_artifact"),
+    path("api/v1/launches", collection, {"name": "launches"}, name="api_launches"),
+    path("api/v1/payloads", collection, {"name": "payloads"}, name="api_payloads"),
+    path("api/v1/crew", collection, {"name": "crew"}, name="api_crew"),
+]
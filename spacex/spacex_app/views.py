@@ -1,17 +1,237 @@
-from django.shortcuts import render
-from .models import CrewMember, Payload, Launch
+import logging
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Max
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils.http import urlencode
+from . import metrics as request_metrics, search_index
+from .caching import adata_version, cache_listing, data_version
+from .cards import SECTIONS
+from .models import CrewMember, Launch, Payload, LaunchCard, SyncState
+from .pagination import apaginate, paginate, page_size_from
+from .profiling import ARTIFACT_FILES, profiling_allowed
+from .streaming import astream_listing, stream_listing
+
+logger = logging.getLogger(__name__)
+
+# Payload columns only shown in the collapsed "Orbital parameters" section
+ORBIT_FIELDS = [
+    "semi_major_axis_km", "eccentricity", "periapsis_km", "apoapsis_km", "inclination_deg", "period_min",
+    "lifespan_years", "epoch", "mean_motion", "raan", "arg_of_pericenter", "mean_anomaly",
+]
+
+def _launch_cards():
+    # One indexed scan of the denormalized cards, without their sections; see cards.py
+    return LaunchCard.objects.defer("sections")
+
+def _payloads():
+    # The dragon and orbit sections are fetched when expanded; see payload_section
+    return Payload.objects.defer(*ORBIT_FIELDS)
+
+def _filter_by_query(request, queryset, kind):
+    query = request.GET.get("q", "").strip()
+    if query:
+        queryset = queryset.filter(pk__in=search_index.matching(query, kind))
+    return queryset, query
 
 def home(request):
-    return render(request, "home.html")
+    return TemplateResponse(request, "home.html")
+
+class Listing:
+    '''
+    One card listing page: its templates, the context name of its rows, the
+    column it is listed by and the data versions (see caching.py) its cards
+    are built from. The sync and async views share it and differ only in how
+    they read the rows.
+    '''
+    def __init__(self, kind, template_name, cards_template_name, name, queryset, order, versions, descending=False):
+        self.kind = kind
+        self.template_name = template_name
+        self.cards_template_name = cards_template_name
+        self.name = name
+        self.queryset = queryset
+        self.order = order
+        self.versions = versions
+        self.descending = descending
+
+    def query(self, request, version):
+        """
+        The rows matching the request's search and the page context.
+        """
+        queryset, query = _filter_by_query(request, self.queryset(), self.kind)
+        return queryset, {"query": query, "data_version": version}
 
+    def stream(self, streamer, request, queryset, context):
+        # streamer is stream_listing or astream_listing
+        return streamer(
+            request, self.template_name, self.cards_template_name, self.name, queryset, self.order,
+            self.descending, context=context,
+        )
+
+    def response(self, request, page, context):
+        return TemplateResponse(request, self.template_name, {self.name: page.object_list, "page": page, **context})
+
+
+LISTINGS = {
+    # Launch cards also show crew and payload names
+    "launch": Listing(
+        "launch", "launch.html", "launch_cards.html", "launches", _launch_cards, "date_utc",
+        ["launch", "crew", "payload"], descending=True,
+    ),
+    "payload": Listing("payload", "payload.html", "payload_cards.html", "payloads", _payloads, "name", ["payload"]),
+    "crew": Listing("crew", "crew.html", "crew_cards.html", "crew", CrewMember.objects.all, "name", ["crew"]),
+}
+
+def _listing(request, listing):
+    queryset, context = listing.query(request, data_version(*listing.versions))
+    if settings.STREAM_LISTINGS:
+        return listing.stream(stream_listing, request, queryset, context)
+    page = paginate(request, queryset, listing.order, descending=listing.descending)
+    return listing.response(request, page, context)
+
+async def _alisting(request, listing):
+    queryset, context = listing.query(request, await adata_version(*listing.versions))
+    if settings.STREAM_LISTINGS:
+        return await listing.stream(astream_listing, request, queryset, context)
+    page = await apaginate(request, queryset, listing.order, descending=listing.descending)
+    return listing.response(request, page, context)
+
+@cache_listing(*LISTINGS["launch"].versions)
 def launch(request):
-    launches = Launch.objects.all().order_by('-date_utc')
-    return render(request, "launch.html", {"launches": launches})
+    return _listing(request, LISTINGS["launch"])
 
+@cache_listing(*LISTINGS["payload"].versions)
 def payload(request):
-    payloads = Payload.objects.all().order_by('name')
-    return render(request, "payload.html", {"payloads": payloads})
+    return _listing(request, LISTINGS["payload"])
 
+@cache_listing(*LISTINGS["crew"].versions)
 def crew(request):
-    crew = CrewMember.objects.all().order_by('name')
-    return render(request, "crew.html", {'crew': crew})
\ No newline at end of file
+    return _listing(request, LISTINGS["crew"])
+
+# Async versions of the listings, routed instead of the ones above when
+# ASYNC_VIEWS is set
+
+@cache_listing(*LISTINGS["launch"].versions)
+async def alaunch(request):
+    return await _alisting(request, LISTINGS["launch"])
+
+@cache_listing(*LISTINGS["payload"].versions)
+async def apayload(request):
+    return await _alisting(request, LISTINGS["payload"])
+
+@cache_listing(*LISTINGS["crew"].versions)
+async def acrew(request):
+    return await _alisting(request, LISTINGS["crew"])
+
+def _launch_section(request, sections, section):
+    if section not in SECTIONS or not sections or not sections.get(section):
+        raise Http404("No such section")
+    return TemplateResponse(request, f"sections/launch_{section}.html", {"launch": sections})
+
+def _payload_section(pk, section):
+    if section == "orbit":
+        return Payload.objects.filter(pk=pk).only(*ORBIT_FIELDS)
+    if section == "dragon":
+        return Payload.objects.filter(pk=pk, dragon__isnull=False).select_related("dragon")
+    return Payload.objects.none()
+
+def _payload_section_response(request, payload, section):
+    if payload is None:
+        raise Http404("No such section")
+    return TemplateResponse(request, f"sections/payload_{section}.html", {"p": payload})
+
+@cache_listing("launch")
+def launch_section(request, pk, section):
+    """
+    One collapsed section of a launch card, fetched when it is first
+    expanded.
+    """
+    sections = LaunchCard.objects.filter(pk=pk).values_list("sections", flat=True).first()
+    return _launch_section(request, sections, section)
+
+@cache_listing("payload")
+def payload_section(request, pk, section):
+    """
+    The orbital parameters or the dragon of a payload card, fetched when
+    first expanded.
+    """
+    return _payload_section_response(request, _payload_section(pk, section).first(), section)
+
+@cache_listing("launch")
+async def alaunch_section(request, pk, section):
+    sections = await LaunchCard.objects.filter(pk=pk).values_list("sections", flat=True).afirst()
+    return _launch_section(request, sections, section)
+
+@cache_listing("payload")
+async def apayload_section(request, pk, section):
+    return _payload_section_response(request, await _payload_section(pk, section).afirst(), section)
+
+async def health(request):
+    """
+    Liveness: the process answers requests.
+    """
+    return JsonResponse({"status": "ok"})
+
+async def ready(request):
+    """
+    Readiness: the database answers and holds a catalogue to serve. Answers
+    503 until the first import or sync has loaded launches.
+    """
+    try:
+        loaded = await Launch.objects.aexists()
+        last_sync = (await SyncState.objects.aaggregate(last=Max("synced_at")))["last"]
+    except DatabaseError:
+        logger.exception("Readiness check could not query the database")
+        return JsonResponse({"status": "unavailable"}, status=503)
+    return JsonResponse(
+        {"status": "ready" if loaded else "empty", "last_sync": last_sync},
+        status=200 if loaded else 503,
+    )
+
+def search(request):
+    query = request.GET.get("q", "")
+    kind = request.GET.get("kind")
+    if kind not in search_index.KIND_CODES:
+        kind = None
+    size = page_size_from(request, default=20)
+    try:
+        page_number = max(1, int(request.GET.get("page", 1)))
+    except ValueError:
+        page_number = 1
+
+    results = search_index.search(query, kind, limit=size + 1, offset=(page_number - 1) * size)
+    for result in results:
+        result["url"] = f"{reverse(result['kind'])}?{urlencode({'q': query})}#{result['kind']}-{result['id']}"
+    return JsonResponse({
+        "query": query,
+        "page": page_number,
+        "has_next": len(results) > size,
+        "results": results[:size],
+    })
+
+def metrics(request):
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(request_metrics.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+def profile_artifacts(request, name, filename=None):
+    """
+    Lists (as JSON links) or downloads the artifacts of a saved profile.
+    """
+    if not profiling_allowed(request):
+        return HttpResponseForbidden()
+    directory = Path(settings.PROFILE_DIR) / name
+    if name.startswith(".") or "/" in name or not directory.is_dir():
+        raise Http404("No such profile")
+    if filename is None:
+        return JsonResponse({
+            "profile": name,
+            "artifacts": [reverse("profile_artifact", args=[name, f]) for f in ARTIFACT_FILES],
+        })
+    if filename not in ARTIFACT_FILES:
+        raise Http404("No such artifact")
+    return FileResponse(open(directory / filename, "rb"), as_attachment=True, filename=f"{name}-{filename}")